@@ -1,7 +1,50 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 
+from naptan_stream import scan
+
+# Define the namespace
+ns = {'n': 'http://www.naptan.org.uk/'}
+
+
+class FlexibleZoneCountAnalysis:
+    """
+    Group BCT/FLX stops by the number of positions in their FlexibleZone, one StopPoint at a time.
+    """
+    name = 'FLX_zone_count'
+
+    def __init__(self):
+        self.counts = {}
+        self.atco_codes_by_group = {}
+
+    def process(self, stop_point):
+        stop_type = stop_point.find('.//n:StopClassification/n:StopType', namespaces=ns)
+        bus_stop_type = stop_point.find('.//n:StopClassification/n:OnStreet/n:Bus/n:BusStopType', namespaces=ns)
+
+        if stop_type is not None and stop_type.text == 'BCT' and bus_stop_type is not None and bus_stop_type.text == 'FLX':
+            # Get the ATCO code for the stop
+            atco_code = stop_point.find('.//n:AtcoCode', namespaces=ns).text
+            # Check if FlexibleZone element exists
+            flexible_zone = stop_point.find('.//n:StopClassification/n:OnStreet/n:Bus/n:FlexibleZone', namespaces=ns)
+            num_locations = 0 if flexible_zone is None else len(flexible_zone.findall('.//n:Location', namespaces=ns))
+
+            # Update counts and ATCO codes by group
+            self.counts[num_locations] = self.counts.get(num_locations, 0) + 1
+            self.atco_codes_by_group.setdefault(num_locations, []).append(atco_code)
+
+    def merge(self, other):
+        for num_locations, count in other.counts.items():
+            self.counts[num_locations] = self.counts.get(num_locations, 0) + count
+        for num_locations, atco_codes in other.atco_codes_by_group.items():
+            self.atco_codes_by_group.setdefault(num_locations, []).extend(atco_codes)
+
+    def result(self):
+        return self.counts, self.atco_codes_by_group
+
+    def export(self, timestamp):
+        export_results(*self.result(), timestamp)
+
+
 def analyze_flexible_zones(file_path):
     """
     Analyze stops with StopType BCT and BusStopType FLX, group by the number of positions, and list ATCO codes.
@@ -13,34 +56,11 @@ def analyze_flexible_zones(file_path):
     Returns:
     dict: A dictionary with counts and ATCO codes grouped by the number of positions in the FlexibleZone.
     """
-    counts = {}
-    atco_codes_by_group = {}
-
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-
-        # Define the namespace
-        ns = {'n': 'http://www.naptan.org.uk/'}
-
         # Iterate over all StopPoint elements with StopType BCT and BusStopType FLX
-        for stop_point in root.findall('.//n:StopPoint', namespaces=ns):
-            stop_type = stop_point.find('.//n:StopClassification/n:StopType', namespaces=ns)
-            bus_stop_type = stop_point.find('.//n:StopClassification/n:OnStreet/n:Bus/n:BusStopType', namespaces=ns)
-
-            if stop_type is not None and stop_type.text == 'BCT' and bus_stop_type is not None and bus_stop_type.text == 'FLX':
-                # Get the ATCO code for the stop
-                atco_code = stop_point.find('.//n:AtcoCode', namespaces=ns).text
-                # Check if FlexibleZone element exists
-                flexible_zone = stop_point.find('.//n:StopClassification/n:OnStreet/n:Bus/n:FlexibleZone', namespaces=ns)
-                num_locations = 0 if flexible_zone is None else len(flexible_zone.findall('.//n:Location', namespaces=ns))
-
-                # Update counts and ATCO codes by group
-                counts[num_locations] = counts.get(num_locations, 0) + 1
-                atco_codes_by_group.setdefault(num_locations, []).append(atco_code)
-
-        return counts, atco_codes_by_group
+        analysis = FlexibleZoneCountAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
@@ -65,14 +85,15 @@ def export_to_csv(data, filename, header):
             else:
                 writer.writerow([key, value])
 
-if __name__ == "__main__":
-    # Replace this with the absolute path to your NaPTAN XML file
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-
-    counts, atco_codes_by_group = analyze_flexible_zones(file_path)
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+def export_results(counts, atco_codes_by_group, timestamp):
+    """
+    Export FlexibleZone position counts and the ATCO codes in each group to timestamped CSV files.
 
+    Args:
+    counts (dict): Number of positions mapped to the count of stops.
+    atco_codes_by_group (dict): Number of positions mapped to a list of ATCO codes.
+    timestamp (str): Timestamp used in exported filenames.
+    """
     if counts is not None:
         # Export counts to a CSV file
         csv_filename_counts = f'flexible_zones_counts_{timestamp}.csv'
@@ -84,3 +105,12 @@ if __name__ == "__main__":
         csv_filename_atco_codes = f'flexible_zones_atco_codes_{timestamp}.csv'
         export_to_csv(atco_codes_by_group, csv_filename_atco_codes, ['NumberOfPositions', 'ATCOCode'])
         print(f"Exported ATCO codes data to {csv_filename_atco_codes}")
+
+if __name__ == "__main__":
+    # Replace this with the absolute path to your NaPTAN XML file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+
+    counts, atco_codes_by_group = analyze_flexible_zones(file_path)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(counts, atco_codes_by_group, timestamp)
@@ -0,0 +1,251 @@
+import xml.etree.ElementTree as ET
+import argparse
+import contextlib
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from compressed import map_naptan
+from generate_naptan import generate
+from metrics import peak_rss_bytes
+from stop_index import find_stop_point, STOP_POINT_OPEN
+from stop_record import StopPointRecord
+
+# (name, module, function) of each benchmarked entry point, all called with the file path
+BENCHMARKS = (
+    ('count', 'count', 'count_total_stops'),
+    ('count_FLX', 'count_FLX', 'analyze_bus_stop_types'),
+    ('deleted_common_name', 'deleted_common_name', 'find_atco_with_delete_in_descriptor'),
+    ('duplicates', 'duplicates', 'find_duplicates'),
+    ('flexiblezone_stoptype', 'flexiblezone_stoptype', 'analyze_stops_with_flexible_zone'),
+    ('FLX_LL_vs_NE', 'FLX_LL_vs_NE', 'analyze_flexible_zone_positions'),
+    ('FLX_zone_count', 'FLX_zone_count', 'analyze_flexible_zones'),
+    ('inactive', 'inactive', 'count_inactive_stops'),
+    ('unique_codes', 'main', 'count_unique_codes'),
+    ('missing_naptan_code', 'missing_naptan_code', 'find_atco_with_no_naptan_and_grouped_by_type'),
+    ('one_atco_many_naptan', 'one_atco_many_naptan', 'find_atco_with_multiple_naptan'),
+    ('zero_coords', 'zero_coords', 'find_invalid_stops_and_export'),
+    ('run_all', 'run_all', 'run_analyses'),
+)
+
+# Scales relative to the national release that the suite generates inputs for
+DEFAULT_SCALES = (1.0,)
+
+BASELINE_FILE = 'benchmark_baseline.json'
+DATA_DIR = 'benchmark_data'
+
+# A benchmark this much slower than its baseline is flagged as a regression
+REGRESSION_THRESHOLD = 1.10
+
+
+def _normalize(value):
+    """
+    Turn an analysis result into plain JSON data, so it can be hashed and compared across runs.
+    """
+    if isinstance(value, ET.Element):
+        return ET.tostring(value, encoding='unicode')
+    if isinstance(value, StopPointRecord):
+        return value.as_dict()
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if hasattr(value, 'result') and hasattr(value, 'name'):
+        # run_analyses returns analysis objects
+        return {value.name: _normalize(value.result())}
+    return value
+
+
+def result_digest(result):
+    """
+    Return a short SHA-256 of an analysis result, independent of object identity.
+    """
+    data = json.dumps(_normalize(result), sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+def count_stop_points(file_path):
+    """
+    Count the StopPoints of a NaPTAN XML file by scanning its raw bytes.
+    """
+    count = 0
+    with map_naptan(file_path) as data:
+        pos = find_stop_point(data)
+        while pos != -1:
+            count += 1
+            pos = find_stop_point(data, pos + len(STOP_POINT_OPEN))
+    return count
+
+
+def run_one(name, file_path):
+    """
+    Time one benchmark in the current process.
+
+    Args:
+    name (str): Name of the benchmark in BENCHMARKS.
+    file_path (str): Path to the NaPTAN XML file.
+
+    Returns:
+    dict: seconds, peak_rss and result digest.
+    """
+    _, module_name, function_name = next(benchmark for benchmark in BENCHMARKS if benchmark[0] == name)
+    function = getattr(importlib.import_module(module_name), function_name)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        result = function(file_path)
+        seconds = time.perf_counter() - start
+
+    return {'seconds': seconds, 'peak_rss': peak_rss_bytes(), 'digest': result_digest(result)}
+
+
+def run_benchmark(name, file_path):
+    """
+    Run one benchmark in a fresh Python process, inside a scratch directory for any exported files.
+
+    A separate process per benchmark keeps each peak RSS measurement its own.
+
+    Args:
+    name (str): Name of the benchmark in BENCHMARKS.
+    file_path (str): Path to the NaPTAN XML file.
+
+    Returns:
+    dict: seconds, peak_rss and result digest.
+    """
+    scratch = tempfile.mkdtemp(prefix='naptan_benchmark_')
+    try:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', name, os.path.abspath(file_path)],
+            cwd=scratch, check=True, capture_output=True, text=True,
+            env={**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                                         os.environ.get('PYTHONPATH')]))})
+        return json.loads(output.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def run_suite(file_paths, names=None):
+    """
+    Run the benchmarks against each input file.
+
+    Args:
+    file_paths (list): Paths to the NaPTAN XML files.
+    names (list): Names of the benchmarks to run. Defaults to all of them.
+
+    Returns:
+    dict: Input file name mapped to stops, size and per-benchmark measurements.
+    """
+    names = names or [benchmark[0] for benchmark in BENCHMARKS]
+    results = {}
+    for file_path in file_paths:
+        stops = count_stop_points(file_path)
+        measurements = {}
+        for name in names:
+            measurement = run_benchmark(name, file_path)
+            measurement['stops_per_second'] = stops / measurement['seconds'] if measurement['seconds'] else None
+            measurements[name] = measurement
+            print(f"{os.path.basename(file_path)} {name}: {measurement['seconds']:.2f}s, "
+                  f"{measurement['stops_per_second']:.0f} stops/s, peak RSS {_format_bytes(measurement['peak_rss'])}")
+        results[os.path.basename(file_path)] = {'stops': stops, 'bytes': os.path.getsize(file_path), 'benchmarks': measurements}
+    return results
+
+
+def _format_bytes(value):
+    return 'n/a' if value is None else f'{value / 1024 ** 2:.0f} MB'
+
+
+def compare(results, baseline):
+    """
+    Compare a run against a stored baseline.
+
+    Args:
+    results (dict): Result of run_suite.
+    baseline (dict): An earlier result of run_suite.
+
+    Returns:
+    list of tuples: (file, benchmark, time ratio, peak RSS ratio, result changed) for each benchmark in both.
+    """
+    comparisons = []
+    for file_name, run in results.items():
+        baseline_run = baseline.get(file_name)
+        if baseline_run is None:
+            continue
+        for name, measurement in run['benchmarks'].items():
+            reference = baseline_run['benchmarks'].get(name)
+            if reference is None:
+                continue
+            time_ratio = measurement['seconds'] / reference['seconds'] if reference['seconds'] else None
+            rss_ratio = (measurement['peak_rss'] / reference['peak_rss']
+                         if measurement['peak_rss'] and reference['peak_rss'] else None)
+            comparisons.append((file_name, name, time_ratio, rss_ratio, measurement['digest'] != reference['digest']))
+    return comparisons
+
+
+def print_comparison(comparisons):
+    for file_name, name, time_ratio, rss_ratio, changed in comparisons:
+        flags = []
+        if changed:
+            flags.append('RESULT CHANGED')
+        if time_ratio is not None and time_ratio > REGRESSION_THRESHOLD:
+            flags.append('SLOWER')
+        time_text = 'n/a' if time_ratio is None else f'{time_ratio:.2f}x'
+        rss_text = 'n/a' if rss_ratio is None else f'{rss_ratio:.2f}x'
+        print(f"{file_name} {name}: time {time_text}, peak RSS {rss_text} vs baseline {' '.join(flags)}".rstrip())
+
+
+def synthetic_inputs(scales, data_dir=DATA_DIR, seed=0):
+    """
+    Return the paths of the synthetic inputs for the given scales, generating any that are missing.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = []
+    for scale in scales:
+        path = os.path.join(data_dir, f'synthetic_naptan_{scale:g}x_seed{seed}.xml')
+        if not os.path.exists(path):
+            print(f"Generating {path}")
+            generate(path, scale, seed)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the NaPTAN analyses on synthetic or real inputs.')
+    parser.add_argument('file_paths', nargs='*', help='NaPTAN XML files to benchmark (default: synthetic inputs)')
+    parser.add_argument('--scales', nargs='+', type=float, default=list(DEFAULT_SCALES),
+                        help='Synthetic input sizes relative to the national release, e.g. --scales 1 5 20')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--only', nargs='+', choices=[benchmark[0] for benchmark in BENCHMARKS])
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_one(args.worker, args.file_paths[0])))
+        sys.exit()
+
+    file_paths = args.file_paths or synthetic_inputs(args.scales, args.data_dir, args.seed)
+    results = run_suite(file_paths, args.only)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    json_filename = f'benchmark_{timestamp}.json'
+    with open(json_filename, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Exported benchmark results to {json_filename}")
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            print_comparison(compare(results, json.load(file)))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
@@ -0,0 +1,310 @@
+import argparse
+import csv
+import datetime
+import os
+import pickle
+import time
+
+from dataset_cache import source_key
+from query import Query
+
+# Bump whenever the layout of the index changes, so old files are rebuilt
+MAP_VERSION = 1
+
+
+def map_path_for(file_path):
+    """
+    Return the path of the sidecar code map for a NaPTAN XML file.
+    """
+    return f'{file_path}.codemap'
+
+
+def read_pairs(file_path):
+    """
+    Count the (AtcoCode, NaptanCode) pairs of the stops in a NaPTAN XML file.
+
+    Only the two code elements are read, so this is much faster than a full extraction.
+    Stops missing either code are left out.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file, plain or compressed.
+
+    Returns:
+    dict: ATCO code mapped to a dict of its NaPTAN codes and the number of stops with each, in document order.
+    """
+    pairs = {}
+    for record in Query(['AtcoCode', 'NaptanCode']).run(file_path):
+        atco_code, naptan_code = record['AtcoCode'], record['NaptanCode']
+        if atco_code and naptan_code:
+            naptan_codes = pairs.setdefault(atco_code, {})
+            naptan_codes[naptan_code] = naptan_codes.get(naptan_code, 0) + 1
+    return pairs
+
+
+class CodeMap:
+    """
+    Two-way mapping between ATCO codes and NaPTAN (SMS) codes.
+
+    Both directions are dicts from a code to the codes it maps to, each with the number of
+    stops carrying that pair, so lookups in either direction are a single dict access and
+    codes mapped to more than one code are found without a scan of the file. The map can
+    be moved to a newer release in place: only the pairs that differ are touched.
+    """
+
+    def __init__(self, atco_to_naptan=None, naptan_to_atco=None, source=None):
+        self.atco_to_naptan = atco_to_naptan if atco_to_naptan is not None else {}
+        self.naptan_to_atco = naptan_to_atco if naptan_to_atco is not None else {}
+        # Path and key of the release the map currently reflects
+        self.source = source
+
+    @classmethod
+    def build(cls, file_path):
+        """
+        Build the map from a NaPTAN XML file.
+        """
+        code_map = cls()
+        for atco_code, naptan_codes in read_pairs(file_path).items():
+            for naptan_code, count in naptan_codes.items():
+                code_map._set(atco_code, naptan_code, count)
+        code_map.source = (os.path.abspath(file_path), source_key(file_path))
+        return code_map
+
+    def __len__(self):
+        return sum(len(naptan_codes) for naptan_codes in self.atco_to_naptan.values())
+
+    def _set(self, atco_code, naptan_code, count):
+        """
+        Set the number of stops with a pair of codes in both directions, dropping it at zero.
+        """
+        for mapping, key, value in ((self.atco_to_naptan, atco_code, naptan_code),
+                                    (self.naptan_to_atco, naptan_code, atco_code)):
+            if count:
+                mapping.setdefault(key, {})[value] = count
+            else:
+                values = mapping.get(key)
+                if values is not None:
+                    values.pop(value, None)
+                    if not values:
+                        del mapping[key]
+
+    def update(self, file_path):
+        """
+        Bring the map up to date with a newer release, touching only the pairs that changed.
+
+        Args:
+        file_path (str): Path to the newer NaPTAN XML file.
+
+        Returns:
+        list of tuples: (NaPTAN code, change, old ATCO codes, new ATCO codes) for every NaPTAN
+            code whose mapping changed, where change is 'added', 'removed' or 'repointed'.
+        """
+        new_pairs = read_pairs(file_path)
+        changed = []
+        for atco_code, naptan_codes in new_pairs.items():
+            old_codes = self.atco_to_naptan.get(atco_code, {})
+            for naptan_code, count in naptan_codes.items():
+                if old_codes.get(naptan_code) != count:
+                    changed.append((atco_code, naptan_code, count))
+        for atco_code, naptan_codes in self.atco_to_naptan.items():
+            new_codes = new_pairs.get(atco_code, {})
+            for naptan_code in naptan_codes:
+                if naptan_code not in new_codes:
+                    changed.append((atco_code, naptan_code, 0))
+
+        touched = list(dict.fromkeys(naptan_code for _, naptan_code, _ in changed))
+        before = {naptan_code: list(self.naptan_to_atco.get(naptan_code, ())) for naptan_code in touched}
+        for atco_code, naptan_code, count in changed:
+            self._set(atco_code, naptan_code, count)
+        self.source = (os.path.abspath(file_path), source_key(file_path))
+
+        changes = []
+        for naptan_code in touched:
+            old_atco_codes, new_atco_codes = before[naptan_code], list(self.naptan_to_atco.get(naptan_code, ()))
+            if set(old_atco_codes) == set(new_atco_codes):
+                # Only the number of stops carrying the pair changed
+                continue
+            change = 'added' if not old_atco_codes else 'removed' if not new_atco_codes else 'repointed'
+            changes.append((naptan_code, change, old_atco_codes, new_atco_codes))
+        return changes
+
+    def save(self, map_path):
+        """
+        Write the map to disk, tagged with the release it reflects.
+        """
+        header = {'version': MAP_VERSION, 'source': self.source}
+        temp_path = f'{map_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((self.atco_to_naptan, self.naptan_to_atco), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, map_path)
+
+    @classmethod
+    def load(cls, file_path, map_path=None):
+        """
+        Load the code map for a NaPTAN XML file.
+
+        A missing map is built from the file. A map saved from another release (an older
+        file, or the same path since replaced) is updated in place from the file and saved
+        again, so only the changed pairs are rewritten in memory.
+
+        Args:
+        file_path (str): Path to the NaPTAN XML file.
+        map_path (str): Path of the saved map. Defaults to map_path_for(file_path).
+
+        Returns:
+        CodeMap: The map.
+        list of tuples: Changes applied by the update, as returned by update (empty when the map was current or new).
+        """
+        map_path = map_path or map_path_for(file_path)
+        code_map = None
+        try:
+            with open(map_path, 'rb') as file:
+                header = pickle.load(file)
+                if header.get('version') == MAP_VERSION:
+                    code_map = cls(*pickle.load(file), source=header.get('source'))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        if code_map is None:
+            code_map = cls.build(file_path)
+            code_map.save(map_path)
+            return code_map, []
+
+        if code_map.source == (os.path.abspath(file_path), source_key(file_path)):
+            return code_map, []
+
+        changes = code_map.update(file_path)
+        code_map.save(map_path)
+        return code_map, changes
+
+    def atco_codes(self, naptan_code):
+        """
+        Return the ATCO codes a NaPTAN code maps to (empty if unknown).
+        """
+        return list(self.naptan_to_atco.get(naptan_code, ()))
+
+    def naptan_codes(self, atco_code):
+        """
+        Return the NaPTAN codes an ATCO code maps to (empty if unknown).
+        """
+        return list(self.atco_to_naptan.get(atco_code, ()))
+
+    def resolve_naptan(self, naptan_codes):
+        """
+        Resolve a batch of NaPTAN codes to ATCO codes.
+
+        Returns:
+        dict: Each NaPTAN code mapped to its list of ATCO codes (empty if unknown).
+        """
+        lookup = self.naptan_to_atco.get
+        return {code: list(lookup(code, ())) for code in naptan_codes}
+
+    def resolve_atco(self, atco_codes):
+        """
+        Resolve a batch of ATCO codes to NaPTAN codes.
+
+        Returns:
+        dict: Each ATCO code mapped to its list of NaPTAN codes (empty if unknown).
+        """
+        lookup = self.atco_to_naptan.get
+        return {code: list(lookup(code, ())) for code in atco_codes}
+
+    def atco_with_many_naptan(self):
+        """
+        Return the ATCO codes mapped to more than one distinct NaPTAN code.
+        """
+        return {code: list(codes) for code, codes in self.atco_to_naptan.items() if len(codes) > 1}
+
+    def naptan_with_many_atco(self):
+        """
+        Return the NaPTAN codes mapped to more than one distinct ATCO code.
+        """
+        return {code: list(codes) for code, codes in self.naptan_to_atco.items() if len(codes) > 1}
+
+
+def export_to_csv(data, filename, column_names):
+    """
+    Export a dictionary of codes to lists of codes to a CSV file, one pair per row.
+
+    Args:
+    data (dict): Codes mapped to lists of codes.
+    filename (str): Filename for the CSV file.
+    column_names (list): Column names for the CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(column_names)
+        for code, codes in data.items():
+            if not codes:
+                writer.writerow([code, ''])
+            for other in codes:
+                writer.writerow([code, other])
+
+
+def export_changes(changes, filename):
+    """
+    Export the changes applied by CodeMap.update to a CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['NaPTAN Code', 'Change', 'Old ATCO Codes', 'New ATCO Codes'])
+        for naptan_code, change, old_atco_codes, new_atco_codes in changes:
+            writer.writerow([naptan_code, change, ';'.join(old_atco_codes), ';'.join(new_atco_codes)])
+
+
+def _read_codes(path):
+    with open(path, encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Resolve between ATCO and NaPTAN codes through a persisted two-way map.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--map', help='Saved map to use, updated in place if it is from another release '
+                                      '(default: next to the XML file, .codemap appended)')
+    parser.add_argument('--naptan', nargs='+', default=[], help='NaPTAN codes to resolve to ATCO codes')
+    parser.add_argument('--atco', nargs='+', default=[], help='ATCO codes to resolve to NaPTAN codes')
+    parser.add_argument('--naptan-file', help='File of NaPTAN codes to resolve, one per line')
+    parser.add_argument('--atco-file', help='File of ATCO codes to resolve, one per line')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    code_map, changes = CodeMap.load(args.file_path, args.map)
+    print(f"Loaded code map of {len(code_map)} pairs in {time.perf_counter() - start:.2f}s")
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    if changes:
+        csv_filename = f'code_map_changes_{timestamp}.csv'
+        export_changes(changes, csv_filename)
+        print(f"Updated map with {len(changes)} changed NaPTAN codes, exported to {csv_filename}")
+
+    naptan_codes = args.naptan + (_read_codes(args.naptan_file) if args.naptan_file else [])
+    atco_codes = args.atco + (_read_codes(args.atco_file) if args.atco_file else [])
+    if naptan_codes or atco_codes:
+        start = time.perf_counter()
+        by_naptan = code_map.resolve_naptan(naptan_codes)
+        by_atco = code_map.resolve_atco(atco_codes)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"Resolved {len(naptan_codes) + len(atco_codes)} codes in {elapsed:.1f} ms "
+              f"({sum(1 for codes in by_naptan.values() if not codes) + sum(1 for codes in by_atco.values() if not codes)} unknown)")
+        if naptan_codes:
+            csv_filename = f'naptan_to_atco_{timestamp}.csv'
+            export_to_csv(by_naptan, csv_filename, ['NaPTAN Code', 'ATCO Code'])
+            print(f"Exported NaPTAN code resolutions to {csv_filename}")
+        if atco_codes:
+            csv_filename = f'atco_to_naptan_{timestamp}.csv'
+            export_to_csv(by_atco, csv_filename, ['ATCO Code', 'NaPTAN Code'])
+            print(f"Exported ATCO code resolutions to {csv_filename}")
+    else:
+        atco_with_many = code_map.atco_with_many_naptan()
+        naptan_with_many = code_map.naptan_with_many_atco()
+        print(f"ATCO codes with more than one NaPTAN code: {len(atco_with_many)}")
+        print(f"NaPTAN codes with more than one ATCO code: {len(naptan_with_many)}")
+        csv_filename = f'atco_with_many_naptan_{timestamp}.csv'
+        export_to_csv(atco_with_many, csv_filename, ['ATCO Code', 'NaPTAN Code'])
+        print(f"Exported ATCO codes with many NaPTAN codes to {csv_filename}")
+        csv_filename = f'naptan_with_many_atco_{timestamp}.csv'
+        export_to_csv(naptan_with_many, csv_filename, ['NaPTAN Code', 'ATCO Code'])
+        print(f"Exported NaPTAN codes with many ATCO codes to {csv_filename}")
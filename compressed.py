@@ -0,0 +1,186 @@
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import mmap
+import queue
+import threading
+import zipfile
+
+# Leading bytes of each supported compressed format
+MAGIC_NUMBERS = (
+    (b'PK\x03\x04', 'zip'),
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+)
+
+# Decompressed bytes handed from the decompression thread to the parser at a time
+CHUNK_SIZE = 1024 * 1024
+
+# Chunks the decompression thread may get ahead of the parser, bounding the memory used
+QUEUE_CHUNKS = 8
+
+
+def compression_of(file_path):
+    """
+    Detect the compression of a file from its first bytes, whatever its extension.
+
+    Args:
+    file_path (str): Path to the file.
+
+    Returns:
+    str: 'zip', 'gzip', 'bz2' or 'xz', or None for an uncompressed file.
+    """
+    with open(file_path, 'rb') as file:
+        head = file.read(6)
+    for magic, compression in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _xml_member(archive):
+    """
+    Pick the NaPTAN XML file out of a zip archive: its largest .xml member.
+    """
+    members = [info for info in archive.infolist() if info.filename.lower().endswith('.xml') and not info.is_dir()]
+    if not members:
+        raise ValueError(f'No XML file in {archive.filename}')
+    return max(members, key=lambda info: info.file_size)
+
+
+def open_decompressed(file_path):
+    """
+    Open a NaPTAN file for reading, decompressing it on the fly in the calling thread.
+
+    Args:
+    file_path (str): Path to a NaPTAN XML file, plain or compressed with zip, gzip, bz2 or xz.
+
+    Returns:
+    file object: A binary file object reading the XML.
+    """
+    compression = compression_of(file_path)
+    if compression is None:
+        return open(file_path, 'rb')
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(file_path, 'rb')
+    if compression == 'xz':
+        return lzma.open(file_path, 'rb')
+    # The member keeps the archive's file open after the archive itself is closed
+    with zipfile.ZipFile(file_path) as archive:
+        return archive.open(_xml_member(archive))
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    A binary file object whose source is read ahead on a background thread.
+
+    The zlib, bz2 and lzma decompressors release the GIL, so reading a compressed
+    stream on its own thread lets decompression overlap with parsing. At most
+    QUEUE_CHUNKS chunks are read ahead.
+    """
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE, queue_chunks=QUEUE_CHUNKS):
+        self._source = source
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(queue_chunks)
+        self._stopping = threading.Event()
+        self._chunk = memoryview(b'')
+        self._position = 0
+        self._finished = False
+        self._thread = threading.Thread(target=self._read_ahead, name='naptan-decompress', daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        try:
+            while not self._stopping.is_set():
+                chunk = self._source.read(self._chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Give up when the reader is closed while the queue is full
+        while not self._stopping.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and not self._finished:
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                self._finished = True
+                raise chunk
+            if not chunk:
+                self._finished = True
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        self._position += size
+        return size
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self.closed:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._source.close()
+        super().close()
+
+
+def open_naptan(file_path):
+    """
+    Open a NaPTAN file for streaming, plain or compressed.
+
+    Compressed files (zip, gzip, bz2 or xz, detected from their contents) are
+    decompressed on a background thread as they are read, with no temporary file.
+    Plain files are opened directly.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file, or to a compressed copy of it.
+
+    Returns:
+    file object: A binary file object reading the XML.
+    """
+    if compression_of(file_path) is None:
+        return open(file_path, 'rb')
+    return ThreadedReader(open_decompressed(file_path))
+
+
+@contextlib.contextmanager
+def map_naptan(file_path):
+    """
+    Give random access to the raw bytes of a NaPTAN file, plain or compressed.
+
+    Plain files are memory mapped. Compressed files are decompressed into memory,
+    since byte offsets into the XML can't be reached without decompressing.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file, or to a compressed copy of it.
+
+    Yields:
+    mmap or bytes: The XML.
+    """
+    if compression_of(file_path) is None:
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+    else:
+        with open_decompressed(file_path) as source:
+            data = source.read()
+        yield data
@@ -0,0 +1,146 @@
+import numpy as np
+
+# Ellipsoids as (semi-major axis, semi-minor axis) in metres
+AIRY_1830 = (6377563.396, 6356256.909)
+WGS84 = (6378137.000, 6356752.314245)
+
+# National Grid transverse Mercator projection on the Airy 1830 ellipsoid
+SCALE_FACTOR = 0.9996012717
+TRUE_ORIGIN = (np.radians(49.0), np.radians(-2.0))
+FALSE_ORIGIN = (400000.0, -100000.0)
+
+# Helmert transformation from WGS84 to OSGB36: translations (m), scale (ppm), rotations (arc seconds).
+# Accurate to around 5 m across Great Britain, which is ample for spotting bad coordinates.
+HELMERT = {'tx': -446.448, 'ty': 125.157, 'tz': -542.060, 's': 20.4894, 'rx': -0.1502, 'ry': -0.2470, 'rz': -0.8421}
+
+
+def _to_cartesian(latitudes, longitudes, ellipsoid):
+    a, b = ellipsoid
+    e2 = 1 - (b * b) / (a * a)
+    sin_lat = np.sin(latitudes)
+    nu = a / np.sqrt(1 - e2 * sin_lat * sin_lat)
+    return (nu * np.cos(latitudes) * np.cos(longitudes),
+            nu * np.cos(latitudes) * np.sin(longitudes),
+            (1 - e2) * nu * sin_lat)
+
+
+def _from_cartesian(x, y, z, ellipsoid, iterations=4):
+    a, b = ellipsoid
+    e2 = 1 - (b * b) / (a * a)
+    p = np.hypot(x, y)
+    latitudes = np.arctan2(z, p * (1 - e2))
+    for _ in range(iterations):
+        sin_lat = np.sin(latitudes)
+        nu = a / np.sqrt(1 - e2 * sin_lat * sin_lat)
+        latitudes = np.arctan2(z + e2 * nu * sin_lat, p)
+    return latitudes, np.arctan2(y, x)
+
+
+def _helmert(x, y, z, inverse=False):
+    sign = -1.0 if inverse else 1.0
+    tx, ty, tz = (sign * HELMERT[key] for key in ('tx', 'ty', 'tz'))
+    s = sign * HELMERT['s'] * 1e-6
+    rx, ry, rz = (sign * np.radians(HELMERT[key] / 3600) for key in ('rx', 'ry', 'rz'))
+    return (tx + (1 + s) * x - rz * y + ry * z,
+            ty + rz * x + (1 + s) * y - rx * z,
+            tz - ry * x + rx * y + (1 + s) * z)
+
+
+def _meridional_arc(latitudes):
+    a, b = AIRY_1830
+    n = (a - b) / (a + b)
+    lat0 = TRUE_ORIGIN[0]
+    d, s = latitudes - lat0, latitudes + lat0
+    return b * SCALE_FACTOR * (
+        (1 + n + 1.25 * n ** 2 + 1.25 * n ** 3) * d
+        - (3 * n + 3 * n ** 2 + 21 / 8 * n ** 3) * np.sin(d) * np.cos(s)
+        + (15 / 8 * n ** 2 + 15 / 8 * n ** 3) * np.sin(2 * d) * np.cos(2 * s)
+        - 35 / 24 * n ** 3 * np.sin(3 * d) * np.cos(3 * s))
+
+
+def _radii(latitudes):
+    a, b = AIRY_1830
+    e2 = 1 - (b * b) / (a * a)
+    sin2 = np.sin(latitudes) ** 2
+    nu = a * SCALE_FACTOR / np.sqrt(1 - e2 * sin2)
+    rho = a * SCALE_FACTOR * (1 - e2) / (1 - e2 * sin2) ** 1.5
+    return nu, rho, nu / rho - 1
+
+
+def _project(latitudes, longitudes):
+    nu, rho, eta2 = _radii(latitudes)
+    sin_lat, cos_lat, tan2 = np.sin(latitudes), np.cos(latitudes), np.tan(latitudes) ** 2
+    dl = longitudes - TRUE_ORIGIN[1]
+
+    northings = (_meridional_arc(latitudes) + FALSE_ORIGIN[1]
+                 + nu / 2 * sin_lat * cos_lat * dl ** 2
+                 + nu / 24 * sin_lat * cos_lat ** 3 * (5 - tan2 + 9 * eta2) * dl ** 4
+                 + nu / 720 * sin_lat * cos_lat ** 5 * (61 - 58 * tan2 + tan2 ** 2) * dl ** 6)
+    eastings = (FALSE_ORIGIN[0]
+                + nu * cos_lat * dl
+                + nu / 6 * cos_lat ** 3 * (nu / rho - tan2) * dl ** 3
+                + nu / 120 * cos_lat ** 5 * (5 - 18 * tan2 + tan2 ** 2 + 14 * eta2 - 58 * tan2 * eta2) * dl ** 5)
+    return eastings, northings
+
+
+def _unproject(eastings, northings, iterations=8):
+    a = AIRY_1830[0]
+    offset = northings - FALSE_ORIGIN[1]
+    latitudes = offset / (a * SCALE_FACTOR) + TRUE_ORIGIN[0]
+    for _ in range(iterations):
+        latitudes = latitudes + (offset - _meridional_arc(latitudes)) / (a * SCALE_FACTOR)
+
+    nu, rho, eta2 = _radii(latitudes)
+    tan_lat, sec_lat = np.tan(latitudes), 1 / np.cos(latitudes)
+    tan2 = tan_lat ** 2
+    de = eastings - FALSE_ORIGIN[0]
+
+    latitudes = (latitudes
+                 - tan_lat / (2 * rho * nu) * de ** 2
+                 + tan_lat / (24 * rho * nu ** 3) * (5 + 3 * tan2 + eta2 - 9 * tan2 * eta2) * de ** 4
+                 - tan_lat / (720 * rho * nu ** 5) * (61 + 90 * tan2 + 45 * tan2 ** 2) * de ** 6)
+    longitudes = (TRUE_ORIGIN[1]
+                  + sec_lat / nu * de
+                  - sec_lat / (6 * nu ** 3) * (nu / rho + 2 * tan2) * de ** 3
+                  + sec_lat / (120 * nu ** 5) * (5 + 28 * tan2 + 24 * tan2 ** 2) * de ** 5
+                  - sec_lat / (5040 * nu ** 7) * (61 + 662 * tan2 + 1320 * tan2 ** 2 + 720 * tan2 ** 3) * de ** 7)
+    return latitudes, longitudes
+
+
+def wgs84_to_osgb36(latitudes, longitudes):
+    """
+    Convert WGS84 latitudes and longitudes to OSGB36 National Grid eastings and northings.
+
+    Works on whole arrays at once; NaN inputs give NaN outputs.
+
+    Args:
+    latitudes (array): WGS84 latitudes in degrees.
+    longitudes (array): WGS84 longitudes in degrees.
+
+    Returns:
+    ndarray: Eastings in metres.
+    ndarray: Northings in metres.
+    """
+    x, y, z = _to_cartesian(np.radians(latitudes), np.radians(longitudes), WGS84)
+    latitudes, longitudes = _from_cartesian(*_helmert(x, y, z), AIRY_1830)
+    return _project(latitudes, longitudes)
+
+
+def osgb36_to_wgs84(eastings, northings):
+    """
+    Convert OSGB36 National Grid eastings and northings to WGS84 latitudes and longitudes.
+
+    Works on whole arrays at once; NaN inputs give NaN outputs.
+
+    Args:
+    eastings (array): Eastings in metres.
+    northings (array): Northings in metres.
+
+    Returns:
+    ndarray: WGS84 latitudes in degrees.
+    ndarray: WGS84 longitudes in degrees.
+    """
+    latitudes, longitudes = _unproject(np.asarray(eastings, dtype=np.float64), np.asarray(northings, dtype=np.float64))
+    x, y, z = _to_cartesian(latitudes, longitudes, AIRY_1830)
+    latitudes, longitudes = _from_cartesian(*_helmert(x, y, z, inverse=True), WGS84)
+    return np.degrees(latitudes), np.degrees(longitudes)
@@ -1,6 +1,30 @@
-import xml.etree.ElementTree as ET
 import datetime
 
+from naptan_stream import scan
+
+
+class TotalStopsAnalysis:
+    """
+    Count the total number of stops, one StopPoint at a time.
+    """
+    name = 'count'
+
+    def __init__(self):
+        self.total_stops = 0
+
+    def process(self, stop_point):
+        self.total_stops += 1
+
+    def merge(self, other):
+        self.total_stops += other.total_stops
+
+    def result(self):
+        return self.total_stops
+
+    def export(self, timestamp):
+        export_results(self.result(), timestamp)
+
+
 def count_total_stops(file_path):
     """
     Count the total number of stops in the NaPTAN XML file.
@@ -12,29 +36,36 @@ def count_total_stops(file_path):
     int: The total number of stops in the dataset.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-
-        # Count the number of StopPoint elements
-        stop_points = root.findall('.//{http://www.naptan.org.uk/}StopPoints/{http://www.naptan.org.uk/}StopPoint')
-        return len(stop_points)
+        # Stream the XML file and count the StopPoint elements
+        analysis = TotalStopsAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
         return None
 
-if __name__ == "__main__":
-    # Replace this with the absolute path to your NaPTAN XML file
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-
-    total_stops = count_total_stops(file_path)
+def export_results(total_stops, timestamp):
+    """
+    Output the total number of stops.
 
-    # Output the total number of stops
+    Args:
+    total_stops (int): The total number of stops in the dataset.
+    timestamp (str): Timestamp used in exported filenames.
+    """
     print(f"Total number of stops in the dataset: {total_stops}")
 
     # Optionally, you can also export this count to a file if needed
-    # timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
     # with open(f'total_stops_count_{timestamp}.txt', 'w') as file:
     #     file.write(str(total_stops))
     #     print(f"Total stops count exported to total_stops_count_{timestamp}.txt")
+
+if __name__ == "__main__":
+    # Replace this with the absolute path to your NaPTAN XML file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+
+    total_stops = count_total_stops(file_path)
+
+    # Output the total number of stops
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(total_stops, timestamp)
@@ -1,33 +1,106 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 
+from naptan_stream import scan
+from stop_record import StopPointRecord, attach_source
+from subset_writer import SubsetWriter
+
+
+class BusStopTypesAnalysis:
+    """
+    Collect BCT/FLX stops and their ATCO codes, one StopPoint at a time.
+
+    Given a SubsetWriter over the same file, matching stops are copied straight to its
+    output instead of being kept in memory. Otherwise each matching stop is kept as a
+    StopPointRecord, and its bytes copied from the source by a SubsetWriter when exported,
+    so both ways write the same document.
+    """
+    name = 'count_FLX'
+
+    def __init__(self, writer=None):
+        self.atco_codes = []
+        self.matching_stops = []
+        self.writer = writer
+        # File the records point into, and the number of StopPoints seen, to place them in it
+        self.source = None
+        self.stop_count = 0
+
+    def process(self, stop_point):
+        position = self.stop_count
+        self.stop_count += 1
+        if self.writer is not None:
+            self.writer.next_stop_point()
+
+        stop_type = stop_point.find(
+            './/{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}StopType')
+        bus_stop_type = stop_point.find(
+            './/{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}OnStreet/{http://www.naptan.org.uk/}Bus/{http://www.naptan.org.uk/}BusStopType')
+
+        if stop_type is not None and stop_type.text == 'BCT' and bus_stop_type is not None and bus_stop_type.text == 'FLX':
+            atco_code = stop_point.find('.//{http://www.naptan.org.uk/}AtcoCode')
+            if atco_code is not None:
+                self.atco_codes.append(atco_code.text)
+                if self.writer is not None:
+                    self.writer.write_current(atco_code.text)
+                else:
+                    self.matching_stops.append(StopPointRecord.from_element(stop_point, position))
+
+    def merge(self, other):
+        # The other analysis carries on from this one in document order
+        for record in other.matching_stops:
+            record.position += self.stop_count
+        self.stop_count += other.stop_count
+        self.atco_codes.extend(other.atco_codes)
+        self.matching_stops.extend(other.matching_stops)
+
+    def result(self):
+        return self.atco_codes, self.matching_stops
+
+    def export(self, timestamp):
+        export_results(*self.result(), timestamp, self.source)
 
-def analyze_bus_stop_types(file_path):
-    atco_codes = []
-    matching_stops = []
 
+def analyze_bus_stop_types(file_path):
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+        analysis = BusStopTypesAnalysis()
+        scan(file_path, [analysis])
+        attach_source([analysis], file_path)
+        return analysis.result()
+
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return None, None
+
 
-        for stop_point in root.findall('.//{http://www.naptan.org.uk/}StopPoints/{http://www.naptan.org.uk/}StopPoint'):
-            stop_type = stop_point.find(
-                './/{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}StopType')
-            bus_stop_type = stop_point.find(
-                './/{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}OnStreet/{http://www.naptan.org.uk/}Bus/{http://www.naptan.org.uk/}BusStopType')
+def analyze_and_export_bus_stop_types(file_path, timestamp):
+    """
+    Find the BCT/FLX stops and stream them to timestamped CSV and XML files as they are found.
 
-            if stop_type is not None and stop_type.text == 'BCT' and bus_stop_type is not None and bus_stop_type.text == 'FLX':
-                atco_code = stop_point.find('.//{http://www.naptan.org.uk/}AtcoCode')
-                if atco_code is not None:
-                    atco_codes.append(atco_code.text)
-                    matching_stops.append(stop_point)
+    The XML file is a NaPTAN document with the source's own root element, holding the
+    original bytes of each matching StopPoint.
 
-        return atco_codes, matching_stops
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    timestamp (str): Timestamp used in exported filenames.
+
+    Returns:
+    list: ATCO codes of the matching stops.
+    """
+    try:
+        xml_filename = f'bct_flx_stops_{timestamp}.xml'
+        with SubsetWriter(file_path, xml_filename) as writer:
+            analysis = BusStopTypesAnalysis(writer)
+            scan(file_path, [analysis])
+
+        csv_filename = f'bct_flx_atco_codes_{timestamp}.csv'
+        export_to_csv(analysis.atco_codes, csv_filename)
+        print(f"Exported ATCO codes to {csv_filename}")
+        print(f"Exported matching stops to {xml_filename}")
+        return analysis.atco_codes
 
     except Exception as e:
         print(f"Error occurred: {e}")
-        return None, None
+        return None
 
 
 def export_to_csv(data, filename):
@@ -38,36 +111,33 @@ def export_to_csv(data, filename):
             writer.writerow([item])
 
 
-def export_to_xml(stops, filename, original_namespace):
-    # Register the original namespace
-    ET.register_namespace('', original_namespace)
-
-    root = ET.Element('StopPoints')
-    for stop in stops:
-        root.append(stop)
-
-    tree = ET.ElementTree(root)
-    tree.write(filename, encoding='utf-8', xml_declaration=True)
-
-
-if __name__ == "__main__":
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-
-    # Specify the original namespace (replace 'http://www.naptan.org.uk/' with the correct namespace from your data)
-    original_namespace = 'http://www.naptan.org.uk/'
-
-    atco_codes, matching_stops = analyze_bus_stop_types(file_path)
+def export_results(atco_codes, matching_stops, timestamp, source):
+    """
+    Export the BCT/FLX stops to timestamped CSV and XML files.
 
+    Args:
+    atco_codes (list): ATCO codes of the matching stops.
+    matching_stops (list): StopPointRecords of the matching stops.
+    timestamp (str): Timestamp used in exported filenames.
+    source (str): Path to the NaPTAN XML file the records were taken from, to copy the stops from.
+    """
     if atco_codes is not None and matching_stops is not None:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-
+        if source is None:
+            raise ValueError('The file the matching stops were read from is not known')
         csv_filename = f'bct_flx_atco_codes_{timestamp}.csv'
         export_to_csv(atco_codes, csv_filename)
         print(f"Exported ATCO codes to {csv_filename}")
 
         xml_filename = f'bct_flx_stops_{timestamp}.xml'
-        export_to_xml(matching_stops, xml_filename, original_namespace)
+        with SubsetWriter(source, xml_filename) as writer:
+            writer.write_records(matching_stops)
         print(f"Exported matching stops to {xml_filename}")
     else:
         print("No data to export.")
 
+
+if __name__ == "__main__":
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    analyze_and_export_bus_stop_types(file_path, timestamp)
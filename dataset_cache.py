@@ -0,0 +1,266 @@
+import argparse
+import gc
+import glob
+import hashlib
+import os
+import pickle
+import time
+
+from naptan_stream import STOP_FIELDS
+from parsers import PREFERENCE, iter_stop_fields
+
+# Directory holding cached datasets, the same whatever directory a script is run from;
+# override with the NAPTAN_CACHE_DIR environment variable
+CACHE_DIR = os.path.abspath(os.environ.get('NAPTAN_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'naptan'))
+
+# Bump whenever STOP_FIELDS or the way they are extracted changes, so old entries are never reused
+SCHEMA_VERSION = 1
+
+# Total size the cache directory may grow to before the least recently used entries are evicted
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+CACHE_PREFIX = 'stop_fields'
+
+# Raised by reading a truncated, corrupt or incompatible pickle; any of them is a cache miss
+READ_ERRORS = (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError, ImportError, IndexError,
+               TypeError)
+
+# Stands in for the path in the names of entries keyed on a content hash, which any copy of the release can use
+CONTENT_KEY = 'content'
+
+
+def _path_key(file_path):
+    return hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+
+
+def source_key(file_path, use_hash=False):
+    """
+    Build the key identifying the current contents of a NaPTAN XML file.
+
+    By default the key is derived from the file's size and modification time, which is
+    instant to compute. With use_hash the whole file is hashed instead, so the cache
+    survives the same release being copied or re-downloaded elsewhere (cache_path then
+    leaves the path out of the entry's name).
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    use_hash (bool): Key on a SHA-256 of the file contents rather than size and mtime.
+
+    Returns:
+    str: The source key.
+    """
+    if use_hash:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return 'sha256-' + digest.hexdigest()[:32]
+
+    stat = os.stat(file_path)
+    return f'stat-{stat.st_size}-{stat.st_mtime_ns}'
+
+
+def cache_path(file_path, cache_dir=CACHE_DIR, use_hash=False):
+    """
+    Return the path of the cache entry for the current contents of a NaPTAN XML file.
+
+    Entries keyed on size and mtime are named after the file's path as well. Entries keyed
+    on a content hash are not, so every copy of the same release shares one entry.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    cache_dir (str): Cache directory.
+    use_hash (bool): Key on a SHA-256 of the file contents rather than size and mtime.
+
+    Returns:
+    str: Path of the cache entry (which may not exist yet).
+    """
+    key = source_key(file_path, use_hash)
+    owner = CONTENT_KEY if use_hash else _path_key(file_path)
+    return os.path.join(cache_dir, f'{CACHE_PREFIX}_v{SCHEMA_VERSION}_{owner}_{key}.pickle')
+
+
+def _entries(cache_dir, pattern='*'):
+    return glob.glob(os.path.join(cache_dir, f'{CACHE_PREFIX}_{pattern}.pickle'))
+
+
+def _parse_columns(file_path, backend=None):
+    columns = {field: [] for field in STOP_FIELDS}
+    appends = [(field, columns[field].append) for field in STOP_FIELDS]
+    for fields in iter_stop_fields(file_path, backend):
+        for field, append in appends:
+            append(fields[field])
+    return columns
+
+
+def _read_entry(path):
+    try:
+        with open(path, 'rb') as file:
+            header = pickle.load(file)
+            if header.get('schema') != SCHEMA_VERSION:
+                return None
+
+            # Unpickling millions of small objects is much faster without the cyclic GC running
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                columns = pickle.load(file)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+    except READ_ERRORS:
+        return None
+
+    # Record the hit so eviction keeps recently used releases
+    os.utime(path)
+    return columns
+
+
+def _write_entry(path, columns, file_path):
+    header = {
+        'schema': SCHEMA_VERSION,
+        'source': os.path.abspath(file_path),
+        'created': time.time(),
+        'stops': len(columns['AtcoCode']),
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(columns, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def load_stop_fields(file_path, cache_dir=CACHE_DIR, use_hash=False, use_cache=True, max_bytes=MAX_CACHE_BYTES,
+                     backend=None):
+    """
+    Load the extracted StopPoint fields of a NaPTAN XML file, from the cache when possible.
+
+    On a miss the file is streamed once, the fields are written to the cache and the
+    cache is trimmed back under max_bytes. Any earlier entries for the same path (an
+    older release that has since been replaced) are dropped at the same time.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    cache_dir (str): Cache directory.
+    use_hash (bool): Key on a SHA-256 of the file contents rather than size and mtime.
+    use_cache (bool): Set to False to always parse the file and leave the cache untouched.
+    max_bytes (int): Size cap for the cache directory.
+    backend (str): Parser backend used on a miss (see parsers.py). Defaults to the fastest available.
+
+    Returns:
+    dict: Each of STOP_FIELDS mapped to a list with one value per StopPoint, in document order.
+    """
+    if not use_cache:
+        return _parse_columns(file_path, backend)
+
+    path = cache_path(file_path, cache_dir, use_hash)
+    columns = _read_entry(path) if os.path.exists(path) else None
+    if columns is not None:
+        return columns
+
+    columns = _parse_columns(file_path, backend)
+    invalidate(file_path, cache_dir)
+    _write_entry(path, columns, file_path)
+    evict(cache_dir, max_bytes, keep=path)
+    return columns
+
+
+def invalidate(file_path, cache_dir=CACHE_DIR, use_hash=False):
+    """
+    Remove every cache entry built from the given path, whatever release it held.
+
+    Entries keyed on a content hash belong to no path; with use_hash the entry for the
+    file's current contents is removed as well.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    cache_dir (str): Cache directory.
+    use_hash (bool): Also remove the content-keyed entry of the file's current contents.
+
+    Returns:
+    int: Number of entries removed.
+    """
+    paths = _entries(cache_dir, f'v*_{_path_key(file_path)}_*')
+    if use_hash and os.path.exists(cache_path(file_path, cache_dir, use_hash=True)):
+        paths.append(cache_path(file_path, cache_dir, use_hash=True))
+    for path in paths:
+        os.remove(path)
+    return len(paths)
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """
+    Remove every cache entry.
+
+    Args:
+    cache_dir (str): Cache directory.
+
+    Returns:
+    int: Number of entries removed.
+    """
+    removed = 0
+    for path in _entries(cache_dir):
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, keep=None):
+    """
+    Trim the cache: drop entries from older schema versions, then the least recently used
+    entries until the directory is under max_bytes.
+
+    Args:
+    cache_dir (str): Cache directory.
+    max_bytes (int): Size cap for the cache directory.
+    keep (str): Path of an entry that must not be evicted.
+
+    Returns:
+    int: Number of entries removed.
+    """
+    removed = 0
+    entries = []
+    for path in _entries(cache_dir):
+        if not os.path.basename(path).startswith(f'{CACHE_PREFIX}_v{SCHEMA_VERSION}_'):
+            os.remove(path)
+            removed += 1
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or manage the parsed NaPTAN dataset cache.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--hash', action='store_true', help='Key the cache on a content hash instead of size and mtime')
+    parser.add_argument('--max-bytes', type=int, default=MAX_CACHE_BYTES)
+    parser.add_argument('--backend', choices=PREFERENCE, help='Parser backend (default: fastest available)')
+    parser.add_argument('--invalidate', action='store_true', help='Drop cached entries for this file')
+    parser.add_argument('--clear', action='store_true', help='Drop every cached entry')
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"Removed {clear_cache(args.cache_dir)} cache entries")
+    elif args.invalidate:
+        print(f"Removed {invalidate(args.file_path, args.cache_dir, args.hash)} cache entries for {args.file_path}")
+    else:
+        start = time.perf_counter()
+        columns = load_stop_fields(args.file_path, args.cache_dir, args.hash, max_bytes=args.max_bytes,
+                                   backend=args.backend)
+        print(f"Loaded {len(columns['AtcoCode'])} stops in {time.perf_counter() - start:.2f}s")
@@ -1,8 +1,42 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 import re
 
+from naptan_stream import scan
+
+# Regex pattern for 'delete' or variations in any case
+DELETE_PATTERN = re.compile(r'delet\w*', re.IGNORECASE)
+
+
+class DeletedCommonNameAnalysis:
+    """
+    Collect ATCO codes whose Descriptor's CommonName mentions 'DELETE', one StopPoint at a time.
+    """
+    name = 'deleted_common_name'
+
+    def __init__(self):
+        # List to store ATCO codes with 'DELETE' or variations in Descriptor's CommonName
+        self.atco_with_delete = []
+
+    def process(self, stop_point):
+        # Extract ATCO code and Descriptor's CommonName
+        atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
+        descriptor_elem = stop_point.find('{http://www.naptan.org.uk/}Descriptor')
+        if atco_code_elem is not None and atco_code_elem.text and descriptor_elem is not None:
+            common_name_elem = descriptor_elem.find('{http://www.naptan.org.uk/}CommonName')
+            if common_name_elem is not None and common_name_elem.text and DELETE_PATTERN.search(common_name_elem.text):
+                self.atco_with_delete.append((atco_code_elem.text, common_name_elem.text))
+
+    def merge(self, other):
+        self.atco_with_delete.extend(other.atco_with_delete)
+
+    def result(self):
+        return self.atco_with_delete
+
+    def export(self, timestamp):
+        export_results(self.result(), timestamp)
+
+
 def find_atco_with_delete_in_descriptor(file_path):
     """
     Find ATCO codes with 'DELETE' or variations in the Descriptor's CommonName in the NaPTAN XML file.
@@ -14,28 +48,10 @@ def find_atco_with_delete_in_descriptor(file_path):
     list of tuples: A list of tuples with ATCO codes and the corresponding CommonName values.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        stop_points = root.find('{http://www.naptan.org.uk/}StopPoints')
-
-        # List to store ATCO codes with 'DELETE' or variations in Descriptor's CommonName
-        atco_with_delete = []
-
-        # Regex pattern for 'delete' or variations in any case
-        delete_pattern = re.compile(r'delet\w*', re.IGNORECASE)
-
-        # Iterate over all StopPoint elements
-        for stop_point in stop_points.findall('{http://www.naptan.org.uk/}StopPoint'):
-            # Extract ATCO code and Descriptor's CommonName
-            atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
-            descriptor_elem = stop_point.find('{http://www.naptan.org.uk/}Descriptor')
-            if atco_code_elem is not None and atco_code_elem.text and descriptor_elem is not None:
-                common_name_elem = descriptor_elem.find('{http://www.naptan.org.uk/}CommonName')
-                if common_name_elem is not None and common_name_elem.text and delete_pattern.search(common_name_elem.text):
-                    atco_with_delete.append((atco_code_elem.text, common_name_elem.text))
-
-        return atco_with_delete
+        # Stream over all StopPoint elements
+        analysis = DeletedCommonNameAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
@@ -54,18 +70,29 @@ def export_to_csv(data, filename):
         for atco_code, common_name in data:
             writer.writerow([atco_code, common_name])
 
-if __name__ == "__main__":
-    # Replace this with the absolute path to your NaPTAN XML file
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-
-    atco_with_delete = find_atco_with_delete_in_descriptor(file_path)
+def export_results(atco_with_delete, timestamp):
+    """
+    Print the number of 'DELETE' CommonNames and export them to a timestamped CSV file.
 
+    Args:
+    atco_with_delete (list of tuples): ATCO codes and the corresponding CommonName values.
+    timestamp (str): Timestamp used in exported filenames.
+    """
     # Count and print the number of records with 'DELETE' or variations in the Descriptor's CommonName
     count_delete = len(atco_with_delete)
     print(f"Number of ATCO codes with 'DELETE' or variations in Descriptor's CommonName: {count_delete}")
 
-    # Export to a CSV file with a timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    # Export to a CSV file
     csv_filename = f'atco_with_delete_{timestamp}.csv'
     export_to_csv(atco_with_delete, csv_filename)
     print(f"Exported data to {csv_filename}")
+
+if __name__ == "__main__":
+    # Replace this with the absolute path to your NaPTAN XML file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+
+    atco_with_delete = find_atco_with_delete_in_descriptor(file_path)
+
+    # Export to a CSV file with a timestamp
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(atco_with_delete, timestamp)
@@ -1,8 +1,46 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 from collections import Counter
 
+from naptan_stream import scan
+
+
+class DuplicatesAnalysis:
+    """
+    Count ATCO and NaPTAN codes one StopPoint at a time and report those seen more than once.
+    """
+    name = 'duplicates'
+
+    def __init__(self):
+        # Counters for ATCO and NaPTAN codes
+        self.atco_counter = Counter()
+        self.naptan_counter = Counter()
+
+    def process(self, stop_point):
+        # Extract ATCO and NaPTAN codes
+        atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
+        naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
+        if atco_code_elem is not None and atco_code_elem.text:
+            self.atco_counter[atco_code_elem.text] += 1
+        if naptan_code_elem is not None and naptan_code_elem.text:
+            self.naptan_counter[naptan_code_elem.text] += 1
+
+    def merge(self, other):
+        # Adding later chunks in order keeps each code where it first appeared, as in a serial pass
+        self.atco_counter.update(other.atco_counter)
+        self.naptan_counter.update(other.naptan_counter)
+
+    def result(self):
+        # Extract duplicates
+        atco_duplicates = [(code, count) for code, count in self.atco_counter.items() if count > 1]
+        naptan_duplicates = [(code, count) for code, count in self.naptan_counter.items() if count > 1]
+
+        return atco_duplicates, naptan_duplicates
+
+    def export(self, timestamp):
+        export_results(*self.result(), timestamp)
+
+
 def find_duplicates(file_path):
     """
     Find duplicate ATCO and NaPTAN codes in the NaPTAN XML file.
@@ -15,30 +53,10 @@ def find_duplicates(file_path):
     list of tuples: A list of tuples with duplicate NaPTAN codes.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        stop_points = root.find('{http://www.naptan.org.uk/}StopPoints')
-
-        # Counters for ATCO and NaPTAN codes
-        atco_counter = Counter()
-        naptan_counter = Counter()
-
-        # Iterate over all StopPoint elements
-        for stop_point in stop_points.findall('{http://www.naptan.org.uk/}StopPoint'):
-            # Extract ATCO and NaPTAN codes
-            atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
-            naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
-            if atco_code_elem is not None and atco_code_elem.text:
-                atco_counter[atco_code_elem.text] += 1
-            if naptan_code_elem is not None and naptan_code_elem.text:
-                naptan_counter[naptan_code_elem.text] += 1
-
-        # Extract duplicates
-        atco_duplicates = [(code, count) for code, count in atco_counter.items() if count > 1]
-        naptan_duplicates = [(code, count) for code, count in naptan_counter.items() if count > 1]
-
-        return atco_duplicates, naptan_duplicates
+        # Stream over all StopPoint elements
+        analysis = DuplicatesAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
@@ -59,14 +77,15 @@ def export_to_csv(data, filename, column_names):
         for row in data:
             writer.writerow(row)
 
-if __name__ == "__main__":
-    # Replace this with the absolute path to your NaPTAN XML file
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-
-    atco_duplicates, naptan_duplicates = find_duplicates(file_path)
+def export_results(atco_duplicates, naptan_duplicates, timestamp):
+    """
+    Export duplicate ATCO and NaPTAN codes to timestamped CSV files.
 
-    # Export duplicates to CSV files with a timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    Args:
+    atco_duplicates (list of tuples): Duplicate ATCO codes and their counts.
+    naptan_duplicates (list of tuples): Duplicate NaPTAN codes and their counts.
+    timestamp (str): Timestamp used in exported filenames.
+    """
     csv_filename_atco = f'atco_duplicates_{timestamp}.csv'
     export_to_csv(atco_duplicates, csv_filename_atco, ['ATCO Code', 'Count'])
     print(f"Exported ATCO duplicates to {csv_filename_atco}")
@@ -74,3 +93,13 @@ if __name__ == "__main__":
     csv_filename_naptan = f'naptan_duplicates_{timestamp}.csv'
     export_to_csv(naptan_duplicates, csv_filename_naptan, ['NaPTAN Code', 'Count'])
     print(f"Exported NaPTAN duplicates to {csv_filename_naptan}")
+
+if __name__ == "__main__":
+    # Replace this with the absolute path to your NaPTAN XML file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+
+    atco_duplicates, naptan_duplicates = find_duplicates(file_path)
+
+    # Export duplicates to CSV files with a timestamp
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(atco_duplicates, naptan_duplicates, timestamp)
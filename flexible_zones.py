@@ -0,0 +1,296 @@
+import argparse
+import csv
+import datetime
+import time
+
+import numpy as np
+
+from coordinates import wgs84_to_osgb36
+from dataset_cache import load_stop_fields
+from spatial_index import SpatialIndex
+from stop_table import StopTable
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _edge_crossings(px, py, x1, y1, x2, y2):
+    """
+    Count, for each point, the polygon edges crossed by a ray cast from it towards increasing easting.
+    """
+    straddles = (y1 > py[:, None]) != (y2 > py[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = (x2 - x1) * (py[:, None] - y1) / (y2 - y1) + x1
+    return (straddles & (px[:, None] < crossing_x)).sum(axis=1)
+
+
+class FlexibleZones:
+    """
+    Polygons of the FlexibleZones of FLX stops, in Easting/Northing.
+
+    Vertices of every zone are stored end to end, with zone i at
+    vertex_offsets[i]:vertex_offsets[i + 1]. Area, centroid and bounding box are worked out
+    once up front. Zone vertices given only as Latitude/Longitude are converted to the
+    National Grid; zones with fewer than three usable vertices have no area and are left out.
+    """
+
+    def __init__(self, atco_codes, rows, vertex_offsets, eastings, northings):
+        self.atco_codes = atco_codes
+        self.rows = rows
+        self.vertex_offsets = vertex_offsets
+        self.eastings = eastings
+        self.northings = northings
+
+        starts, ends = vertex_offsets[:-1], vertex_offsets[1:]
+        # Next vertex of each vertex, wrapping round to the first of its own zone
+        following = np.arange(1, len(eastings) + 1)
+        following[ends - 1] = starts
+        self._following = following
+
+        x1, y1 = eastings, northings
+        x2, y2 = eastings[following], northings[following]
+        cross = x1 * y2 - x2 * y1
+        signed_area = np.add.reduceat(cross, starts) / 2 if len(starts) else np.empty(0)
+        self.areas = np.abs(signed_area)
+
+        counts = ends - starts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            centroid_eastings = np.add.reduceat((x1 + x2) * cross, starts) / (6 * signed_area) if len(starts) else np.empty(0)
+            centroid_northings = np.add.reduceat((y1 + y2) * cross, starts) / (6 * signed_area) if len(starts) else np.empty(0)
+        # Collinear zones have no area-weighted centroid, so fall back to the mean vertex
+        flat = signed_area == 0
+        if flat.any():
+            centroid_eastings[flat] = (np.add.reduceat(x1, starts) / counts)[flat]
+            centroid_northings[flat] = (np.add.reduceat(y1, starts) / counts)[flat]
+        self.centroids = np.column_stack([centroid_eastings, centroid_northings]) if len(starts) else np.empty((0, 2))
+
+        self.bboxes = np.column_stack([
+            np.minimum.reduceat(eastings, starts), np.minimum.reduceat(northings, starts),
+            np.maximum.reduceat(eastings, starts), np.maximum.reduceat(northings, starts),
+        ]) if len(starts) else np.empty((0, 4))
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Build the zone polygons from the extracted field columns returned by load_stop_fields.
+
+        Args:
+        columns (dict): Field names mapped to one value per StopPoint.
+
+        Returns:
+        FlexibleZones: The zones, with rows pointing back at the stops they belong to.
+        """
+        atco_codes, rows, offsets = [], [], [0]
+        eastings, northings, latitudes, longitudes = [], [], [], []
+
+        for row, zone in enumerate(columns['FlexibleZone']):
+            if not zone:
+                continue
+            vertices = [tuple(_to_float(value) for value in location) for location in zone]
+            # Keep vertices with either a usable Easting/Northing or a usable Latitude/Longitude
+            vertices = [vertex for vertex in vertices
+                        if not (np.isnan(vertex[0]) or np.isnan(vertex[1])) or not (np.isnan(vertex[2]) or np.isnan(vertex[3]))]
+            if len(vertices) < 3:
+                continue
+            atco_codes.append(columns['AtcoCode'][row])
+            rows.append(row)
+            for easting, northing, latitude, longitude in vertices:
+                eastings.append(easting)
+                northings.append(northing)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+            offsets.append(len(eastings))
+
+        eastings = np.array(eastings, dtype=np.float64)
+        northings = np.array(northings, dtype=np.float64)
+        missing = np.isnan(eastings) | np.isnan(northings)
+        if missing.any():
+            converted_eastings, converted_northings = wgs84_to_osgb36(np.array(latitudes)[missing], np.array(longitudes)[missing])
+            eastings[missing] = converted_eastings
+            northings[missing] = converted_northings
+
+        return cls(atco_codes, np.array(rows, dtype=np.int64), np.array(offsets, dtype=np.int64), eastings, northings)
+
+    def __len__(self):
+        return len(self.atco_codes)
+
+    def _edges(self, zone):
+        start, end = self.vertex_offsets[zone], self.vertex_offsets[zone + 1]
+        following = self._following[start:end]
+        return (self.eastings[start:end], self.northings[start:end],
+                self.eastings[following], self.northings[following])
+
+    def contains(self, zone, eastings, northings):
+        """
+        Test which of a set of points lie inside one zone.
+
+        Args:
+        zone (int): Zone number.
+        eastings (array): Eastings of the points.
+        northings (array): Northings of the points.
+
+        Returns:
+        ndarray: True for each point inside the zone.
+        """
+        eastings = np.asarray(eastings, dtype=np.float64)
+        northings = np.asarray(northings, dtype=np.float64)
+        return _edge_crossings(eastings, northings, *self._edges(zone)) % 2 == 1
+
+    def zones_containing(self, easting, northing):
+        """
+        Find the zones containing a point.
+
+        Only zones whose bounding box holds the point are tested against their polygon.
+
+        Args:
+        easting (float): Easting of the point.
+        northing (float): Northing of the point.
+
+        Returns:
+        ndarray: Zone numbers, in ascending order.
+        """
+        bboxes = self.bboxes
+        candidates = np.flatnonzero((bboxes[:, 0] <= easting) & (bboxes[:, 2] >= easting)
+                                    & (bboxes[:, 1] <= northing) & (bboxes[:, 3] >= northing))
+        point_e, point_n = np.array([easting], dtype=np.float64), np.array([northing], dtype=np.float64)
+        return np.array([zone for zone in candidates.tolist() if self.contains(zone, point_e, point_n)[0]], dtype=np.int64)
+
+    def points_in_zones(self, eastings, northings, points=None):
+        """
+        Find every point that lies inside every zone, for many points at once.
+
+        Each zone's bounding box is looked up in a spatial index over the points, and
+        only the points it returns are tested against the zone polygon.
+
+        Args:
+        eastings (array): Eastings of the points (NaN for points to leave out).
+        northings (array): Northings of the points.
+        points (SpatialIndex): Index over the same points, if one is already built.
+
+        Returns:
+        ndarray: Point numbers, in ascending order.
+        ndarray: The zone number containing each of them; a point in several zones appears once per zone.
+        """
+        eastings = np.asarray(eastings, dtype=np.float64)
+        northings = np.asarray(northings, dtype=np.float64)
+        if points is None:
+            points = SpatialIndex(eastings, northings)
+
+        point_numbers, zones = [], []
+        for zone, bbox in enumerate(self.bboxes.tolist()):
+            candidates = points.within_bbox(*bbox)
+            if not len(candidates):
+                continue
+            inside = self.contains(zone, eastings[candidates], northings[candidates])
+            point_numbers.append(candidates[inside])
+            zones.append(np.full(int(inside.sum()), zone, dtype=np.int64))
+
+        if not point_numbers:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        point_numbers, zones = np.concatenate(point_numbers), np.concatenate(zones)
+        order = np.lexsort((zones, point_numbers))
+        return point_numbers[order], zones[order]
+
+    def zones_containing_batch(self, eastings, northings):
+        """
+        Find the zones containing each of many points, such as booking requests.
+
+        Args:
+        eastings (array): Eastings of the points.
+        northings (array): Northings of the points.
+
+        Returns:
+        ndarray: Point numbers, in ascending order.
+        ndarray: The zone number containing each of them; a point in several zones appears once per zone.
+        """
+        return self.points_in_zones(eastings, northings)
+
+
+def find_fixed_stops_in_zones(table, zones):
+    """
+    Find the fixed (non-FLX) stops whose position lies inside a flexible zone.
+
+    Args:
+    table (StopTable): The columnar table.
+    zones (FlexibleZones): Zones built from the same dataset.
+
+    Returns:
+    list of tuples: (ATCO code, StopType, zone ATCO code) for each stop and zone containing it, in document order.
+    """
+    # Leaving out the FLX stops' own positions keeps them from matching their zones
+    eastings = np.where(table.equals('BusStopType', 'FLX'), np.nan, table['Easting'])
+    rows, zone_numbers = zones.points_in_zones(eastings, table['Northing'])
+    return list(zip(table.decode('AtcoCode', rows), table.decode('StopType', rows),
+                    [zones.atco_codes[zone] for zone in zone_numbers.tolist()]))
+
+
+def export_to_csv(data, filename, header):
+    """
+    Export a list of tuples to a CSV file.
+
+    Args:
+    data (list of tuples): Rows to export.
+    filename (str): Filename for the CSV file.
+    header (list): Header row for the CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for row in data:
+            writer.writerow(row)
+
+
+def export_results(zones, fixed_stops_in_zones, timestamp):
+    """
+    Export the zone geometry and the fixed stops inside zones to timestamped CSV files.
+
+    Args:
+    zones (FlexibleZones): The zone polygons.
+    fixed_stops_in_zones (list of tuples): Result of find_fixed_stops_in_zones.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    geometry = [
+        (atco_code, int(end - start), f'{area:.1f}', f'{centroid[0]:.1f}', f'{centroid[1]:.1f}', *(f'{value:.1f}' for value in bbox))
+        for atco_code, start, end, area, centroid, bbox in zip(
+            zones.atco_codes, zones.vertex_offsets[:-1].tolist(), zones.vertex_offsets[1:].tolist(),
+            zones.areas.tolist(), zones.centroids.tolist(), zones.bboxes.tolist())
+    ]
+    csv_filename = f'flexible_zone_geometry_{timestamp}.csv'
+    export_to_csv(geometry, csv_filename, ['ATCOCode', 'Vertices', 'Area (m2)', 'Centroid Easting', 'Centroid Northing',
+                                           'Min Easting', 'Min Northing', 'Max Easting', 'Max Northing'])
+    print(f"Exported zone geometry to {csv_filename}")
+
+    csv_filename = f'stops_in_flexible_zones_{timestamp}.csv'
+    export_to_csv(fixed_stops_in_zones, csv_filename, ['ATCOCode', 'StopType', 'Zone ATCOCode'])
+    print(f"Exported fixed stops inside flexible zones to {csv_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build FlexibleZone polygons and find the stops inside them.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--point', nargs=2, type=float, metavar=('EASTING', 'NORTHING'),
+                        help='List the zones containing this point')
+    args = parser.parse_args()
+
+    columns = load_stop_fields(args.file_path)
+    start = time.perf_counter()
+    zones = FlexibleZones.from_columns(columns)
+    print(f"Built {len(zones)} flexible zones in {time.perf_counter() - start:.3f}s")
+
+    if args.point:
+        for zone in zones.zones_containing(*args.point).tolist():
+            print(f"Zone ATCO Code: {zones.atco_codes[zone]}, Area: {zones.areas[zone]:.0f} m2")
+    else:
+        table = StopTable.from_columns(columns)
+        start = time.perf_counter()
+        fixed_stops_in_zones = find_fixed_stops_in_zones(table, zones)
+        print(f"Fixed stops inside flexible zones: {len(fixed_stops_in_zones)} ({time.perf_counter() - start:.3f}s)")
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        export_results(zones, fixed_stops_in_zones, timestamp)
@@ -1,8 +1,40 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 from collections import defaultdict
 
+from naptan_stream import scan
+
+
+class FlexibleZoneStopTypeAnalysis:
+    """
+    Count stops with a FlexibleZone element by BusStopType, one StopPoint at a time.
+    """
+    name = 'flexiblezone_stoptype'
+
+    def __init__(self):
+        # Dictionary to store counts of stops with FlexibleZone, grouped by BusStopType
+        self.bus_stop_type_counts = defaultdict(int)
+
+    def process(self, stop_point):
+        # Check for FlexibleZone element
+        flexible_zone_elem = stop_point.find('{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}OnStreet/{http://www.naptan.org.uk/}Bus/{http://www.naptan.org.uk/}FlexibleZone')
+        if flexible_zone_elem is not None:
+            # Get BusStopType
+            bus_stop_type_elem = stop_point.find('{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}OnStreet/{http://www.naptan.org.uk/}Bus/{http://www.naptan.org.uk/}BusStopType')
+            bus_stop_type = bus_stop_type_elem.text if bus_stop_type_elem is not None else 'Unknown'
+            self.bus_stop_type_counts[bus_stop_type] += 1
+
+    def merge(self, other):
+        for bus_stop_type, count in other.bus_stop_type_counts.items():
+            self.bus_stop_type_counts[bus_stop_type] += count
+
+    def result(self):
+        return self.bus_stop_type_counts
+
+    def export(self, timestamp):
+        export_results(self.result(), timestamp)
+
+
 def analyze_stops_with_flexible_zone(file_path):
     """
     Analyze stops with FlexibleZone element in the NaPTAN XML file, counting them by BusStopType.
@@ -14,25 +46,10 @@ def analyze_stops_with_flexible_zone(file_path):
     dict: A dictionary with BusStopType as keys and counts of stops with FlexibleZone as values.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        stop_points = root.find('{http://www.naptan.org.uk/}StopPoints')
-
-        # Dictionary to store counts of stops with FlexibleZone, grouped by BusStopType
-        bus_stop_type_counts = defaultdict(int)
-
-        # Iterate over all StopPoint elements
-        for stop_point in stop_points.findall('{http://www.naptan.org.uk/}StopPoint'):
-            # Check for FlexibleZone element
-            flexible_zone_elem = stop_point.find('{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}OnStreet/{http://www.naptan.org.uk/}Bus/{http://www.naptan.org.uk/}FlexibleZone')
-            if flexible_zone_elem is not None:
-                # Get BusStopType
-                bus_stop_type_elem = stop_point.find('{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}OnStreet/{http://www.naptan.org.uk/}Bus/{http://www.naptan.org.uk/}BusStopType')
-                bus_stop_type = bus_stop_type_elem.text if bus_stop_type_elem is not None else 'Unknown'
-                bus_stop_type_counts[bus_stop_type] += 1
-
-        return bus_stop_type_counts
+        # Stream over all StopPoint elements
+        analysis = FlexibleZoneStopTypeAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
@@ -53,6 +70,18 @@ def export_to_csv(data, filename, column_names):
         for bus_stop_type, count in data:
             writer.writerow([bus_stop_type, count])
 
+def export_results(bus_stop_type_counts, timestamp):
+    """
+    Export counts of stops with a FlexibleZone by BusStopType to a timestamped CSV file.
+
+    Args:
+    bus_stop_type_counts (dict): BusStopType mapped to counts of stops with FlexibleZone.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    csv_filename = f'bus_stop_type_with_flexible_zone_{timestamp}.csv'
+    export_to_csv(bus_stop_type_counts.items(), csv_filename, ['BusStopType', 'Count of Stops with FlexibleZone'])
+    print(f"Exported data to {csv_filename}")
+
 if __name__ == "__main__":
     # Replace this with the absolute path to your NaPTAN XML file
     file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
@@ -61,6 +90,4 @@ if __name__ == "__main__":
 
     # Export to a CSV file with a timestamp
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    csv_filename = f'bus_stop_type_with_flexible_zone_{timestamp}.csv'
-    export_to_csv(bus_stop_type_counts.items(), csv_filename, ['BusStopType', 'Count of Stops with FlexibleZone'])
-    print(f"Exported data to {csv_filename}")
+    export_results(bus_stop_type_counts, timestamp)
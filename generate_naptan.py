@@ -0,0 +1,272 @@
+import argparse
+import random
+from collections import deque
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from coordinates import osgb36_to_wgs84
+
+# Number of StopPoints in the national NaPTAN release the mixes below were taken from
+NATIONAL_STOPS = 437779
+
+# Stop areas per stop point in the national release
+STOP_AREAS_PER_STOP = 0.11
+
+# Stops generated together; coordinates for a block are converted to WGS84 in one batch
+BLOCK_SIZE = 10000
+
+STOP_TYPES = {
+    'BCT': 0.86, 'BCS': 0.02, 'BCE': 0.003, 'BCQ': 0.002, 'TXR': 0.01, 'RSE': 0.02, 'RLY': 0.01, 'RPL': 0.01,
+    'PLT': 0.01, 'TMU': 0.01, 'MET': 0.01, 'FER': 0.005, 'FTD': 0.005, 'AIR': 0.001, 'GAT': 0.004, 'LCE': 0.001,
+}
+BUS_STOP_TYPES = {'MKD': 0.74, 'CUS': 0.17, 'HAR': 0.085, 'FLX': 0.005}
+TIMING_STATUSES = {'OTH': 0.7, 'TIP': 0.2, 'PTP': 0.1}
+COMPASS_POINTS = ('N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW')
+
+# Shares of stops with the data problems the analyses look for
+INACTIVE_SHARE = 0.117
+ZERO_COORDINATES_SHARE = 0.0007
+DUPLICATE_ATCO_SHARE = 0.0005
+DUPLICATE_NAPTAN_SHARE = 0.0003
+MISSING_NAPTAN_SHARE = 0.05
+DELETE_NAME_SHARE = 0.00015
+
+# Duplicated codes are copied from this many recently generated stops, keeping memory flat at any scale
+RECENT_CODES = 1000
+
+# How the Locations of a FlexibleZone are expressed
+ZONE_POSITIONS = {'both': 0.6, 'easting_northing': 0.3, 'lat_long': 0.1}
+
+PLACES = (
+    'Church', 'Station', 'Market', 'Park', 'Green', 'Bridge', 'Mill', 'Manor', 'Castle', 'Abbey', 'Cross', 'Hill',
+    'Farm', 'School', 'Hospital', 'Library', 'Post Office', 'Village Hall', 'Bus Station', 'Shopping Centre',
+)
+STREETS = (
+    'High Street', 'Station Road', 'Main Street', 'Church Road', 'Park Road', 'London Road', 'Victoria Road',
+    'Green Lane', 'Manor Road', 'Church Lane', 'Mill Lane', 'Queens Road', 'New Road', 'Kings Road', 'North Road',
+)
+INDICATORS = ('opp', 'adj', 'o/s', 'nr', 'Stop A', 'Stop B', 'Stand 1', 'Stand 2', 'NE-bound', 'SW-bound', 'after', 'before')
+TOWNS = (
+    'Ashford', 'Bramley', 'Carlton', 'Denton', 'Eastwood', 'Fairfield', 'Grafton', 'Hampton', 'Kingsley', 'Langley',
+    'Marston', 'Newton', 'Oakley', 'Preston', 'Radford', 'Stanton', 'Thornton', 'Upton', 'Walton', 'Weston',
+)
+
+
+class NaptanGenerator:
+    """
+    Deterministic generator of NaPTAN XML shaped like the national release.
+
+    The same seed and number of stops always give byte-identical output. Stops are
+    clustered around town centres across Great Britain, with StopType, BusStopType,
+    Status and data problems (inactive stops, zero coordinates, duplicate and missing
+    codes, "DELETE" names) mixed in at roughly their national shares. FLX stops carry
+    FlexibleZones and stops reference StopAreas listed after the StopPoints.
+    """
+
+    def __init__(self, stops, seed=0):
+        self.stops = stops
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.numpy_random = np.random.default_rng(seed)
+
+        towns = max(1, stops // 900)
+        self.town_eastings = self.numpy_random.uniform(150000, 650000, towns)
+        self.town_northings = self.numpy_random.uniform(20000, 1000000, towns)
+        self.stop_areas = max(1, int(stops * STOP_AREAS_PER_STOP))
+        self.atco_codes = deque(maxlen=RECENT_CODES)
+        self.naptan_codes = deque(maxlen=RECENT_CODES)
+
+    def _choice(self, weights):
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def _timestamp(self, first_year=2004):
+        return (f'{self.random.randint(first_year, 2023)}-{self.random.randint(1, 12):02d}-{self.random.randint(1, 28):02d}'
+                f'T{self.random.randint(0, 23):02d}:{self.random.randint(0, 59):02d}:{self.random.randint(0, 59):02d}')
+
+    def _positions(self, count):
+        towns = self.numpy_random.integers(0, len(self.town_eastings), count)
+        eastings = np.round(self.town_eastings[towns] + self.numpy_random.normal(0, 3000, count))
+        northings = np.round(self.town_northings[towns] + self.numpy_random.normal(0, 3000, count))
+        latitudes, longitudes = osgb36_to_wgs84(eastings, northings)
+        return eastings, northings, np.round(latitudes, 6), np.round(longitudes, 6)
+
+    def _atco_code(self, number, area):
+        if self.atco_codes and self.random.random() < DUPLICATE_ATCO_SHARE:
+            return self.random.choice(self.atco_codes)
+        code = f'{area:03d}0{number:07d}'
+        self.atco_codes.append(code)
+        return code
+
+    def _naptan_code(self):
+        if self.random.random() < MISSING_NAPTAN_SHARE:
+            return None
+        if self.naptan_codes and self.random.random() < DUPLICATE_NAPTAN_SHARE:
+            return self.random.choice(self.naptan_codes)
+        code = ''.join(self.random.choices('abcdefghjkmpstwxyz', k=8))
+        self.naptan_codes.append(code)
+        return code
+
+    def _translation(self, easting, northing, latitude, longitude):
+        return (f'<Translation><GridType>UKOS</GridType><Easting>{easting:.0f}</Easting><Northing>{northing:.0f}</Northing>'
+                f'<Longitude>{longitude}</Longitude><Latitude>{latitude}</Latitude></Translation>')
+
+    def _flexible_zone(self, easting, northing):
+        vertices = self.random.randint(3, 12)
+        radius = self.random.uniform(300, 3000)
+        angles = sorted(self.random.uniform(0, 2 * np.pi) for _ in range(vertices))
+        zone_eastings = np.round(easting + radius * np.cos(angles))
+        zone_northings = np.round(northing + radius * np.sin(angles))
+        latitudes, longitudes = osgb36_to_wgs84(zone_eastings, zone_northings)
+
+        positions = self._choice(ZONE_POSITIONS)
+        locations = []
+        for zone_e, zone_n, latitude, longitude in zip(zone_eastings.tolist(), zone_northings.tolist(),
+                                                       np.round(latitudes, 6).tolist(), np.round(longitudes, 6).tolist()):
+            if positions == 'easting_northing':
+                locations.append(f'<Location><GridType>UKOS</GridType><Easting>{zone_e:.0f}</Easting>'
+                                 f'<Northing>{zone_n:.0f}</Northing></Location>')
+            elif positions == 'lat_long':
+                locations.append(f'<Location><Translation><Longitude>{longitude}</Longitude>'
+                                 f'<Latitude>{latitude}</Latitude></Translation></Location>')
+            else:
+                locations.append(f'<Location>{self._translation(zone_e, zone_n, latitude, longitude)}</Location>')
+        return f'<FlexibleZone>{"".join(locations)}</FlexibleZone>'
+
+    def _classification(self, stop_type, easting, northing):
+        if stop_type != 'BCT':
+            if stop_type in ('BCS', 'BCQ', 'BCE', 'TXR'):
+                return (f'<StopType>{stop_type}</StopType><OffStreet><BusAndCoach><Bay><TimingStatus>OTH</TimingStatus>'
+                        f'</Bay></BusAndCoach></OffStreet>')
+            if stop_type in ('RSE', 'RLY', 'RPL'):
+                return f'<StopType>{stop_type}</StopType><OffStreet><Rail><Entrance /></Rail></OffStreet>'
+            return f'<StopType>{stop_type}</StopType><OffStreet><Entrance /></OffStreet>'
+
+        bus_stop_type = self._choice(BUS_STOP_TYPES)
+        timing = f'<TimingStatus>{self._choice(TIMING_STATUSES)}</TimingStatus>'
+        if bus_stop_type == 'FLX':
+            # A few FLX stops have lost their zone, as in the national data
+            zone = self._flexible_zone(easting, northing) if self.random.random() < 0.97 else ''
+            detail = zone
+        else:
+            point = {'MKD': 'MarkedPoint', 'CUS': 'UnmarkedPoint', 'HAR': 'HailAndRideSection'}[bus_stop_type]
+            detail = f'<{point}><Bearing><CompassPoint>{self.random.choice(COMPASS_POINTS)}</CompassPoint></Bearing></{point}>'
+        return f'<StopType>BCT</StopType><OnStreet><Bus><BusStopType>{bus_stop_type}</BusStopType>{timing}{detail}</Bus></OnStreet>'
+
+    def _stop_point(self, number, easting, northing, latitude, longitude):
+        area = self.random.randint(1, 150)
+        stop_type = self._choice(STOP_TYPES)
+        status = 'inactive' if self.random.random() < INACTIVE_SHARE else 'active'
+        created = self._timestamp()
+        modified = max(created, self._timestamp())
+
+        if self.random.random() < ZERO_COORDINATES_SHARE:
+            easting = northing = 0
+            latitude = longitude = 0.0
+
+        town = self.random.choice(TOWNS)
+        common_name = f'{town} {self.random.choice(PLACES)}'
+        if self.random.random() < DELETE_NAME_SHARE:
+            common_name = f'{self.random.choice(("DELETE", "Deleted", "DELETED -"))} {common_name}'
+
+        parts = [
+            f'<StopPoint CreationDateTime="{created}" ModificationDateTime="{modified}" '
+            f'Modification="{self.random.choice(("new", "revise"))}" RevisionNumber="{self.random.randint(0, 12)}" Status="{status}">',
+            f'<AtcoCode>{self._atco_code(number, area)}</AtcoCode>',
+        ]
+        naptan_code = self._naptan_code()
+        if naptan_code is not None:
+            parts.append(f'<NaptanCode>{naptan_code}</NaptanCode>')
+        parts.append(
+            f'<Descriptor><CommonName xml:lang="en">{escape(common_name)}</CommonName>'
+            f'<Landmark xml:lang="en">{escape(self.random.choice(PLACES))}</Landmark>'
+            f'<Street xml:lang="en">{escape(self.random.choice(STREETS))}</Street>'
+            f'<Indicator xml:lang="en">{escape(self.random.choice(INDICATORS))}</Indicator></Descriptor>')
+        parts.append(
+            f'<Place><NptgLocalityRef>E00{self.random.randint(10000, 59999)}</NptgLocalityRef><LocalityCentre>false</LocalityCentre>'
+            f'<Location>{self._translation(easting, northing, latitude, longitude)}</Location></Place>')
+        parts.append(f'<StopClassification>{self._classification(stop_type, easting, northing)}</StopClassification>')
+
+        references = self.random.choices((0, 1, 2), weights=(0.6, 0.35, 0.05))[0]
+        if references:
+            refs = ''.join(
+                f'<StopAreaRef CreationDateTime="{created}" ModificationDateTime="{modified}" Modification="new" '
+                f'Status="active">{self._stop_area_code(self.random.randrange(self.stop_areas))}</StopAreaRef>'
+                for _ in range(references))
+            parts.append(f'<StopAreas>{refs}</StopAreas>')
+        parts.append(f'<AdministrativeAreaRef>{area:03d}</AdministrativeAreaRef></StopPoint>')
+        return ''.join(parts)
+
+    @staticmethod
+    def _stop_area_code(number):
+        return f'{number % 150 + 1:03d}G{number:06d}'
+
+    def _stop_area(self, number, easting, northing, latitude, longitude):
+        return (f'<StopArea CreationDateTime="{self._timestamp()}" ModificationDateTime="{self._timestamp(2015)}" '
+                f'Modification="new" RevisionNumber="{self.random.randint(0, 5)}" Status="active">'
+                f'<StopAreaCode>{self._stop_area_code(number)}</StopAreaCode>'
+                f'<Name xml:lang="en">{escape(self.random.choice(TOWNS))} {escape(self.random.choice(PLACES))}</Name>'
+                f'<AdministrativeAreaRef>{number % 150 + 1:03d}</AdministrativeAreaRef>'
+                f'<StopAreaType>{self.random.choice(("GBPS", "GCLS", "GBCS", "GRLS"))}</StopAreaType>'
+                f'<Location>{self._translation(easting, northing, latitude, longitude)}</Location></StopArea>')
+
+    def write(self, output_path):
+        """
+        Write the generated NaPTAN XML file.
+
+        Args:
+        output_path (str): Path of the file to write.
+        """
+        with open(output_path, 'w', encoding='utf-8', newline='\n') as file:
+            file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            file.write('<NaPTAN xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" CreationDateTime="2024-01-17T03:35:50" '
+                       'ModificationDateTime="2024-01-17T03:35:50" Modification="new" RevisionNumber="0" '
+                       'FileName="NaPTAN.xml" SchemaVersion="2.5" '
+                       'xsi:schemaLocation="http://www.naptan.org.uk/ http://www.naptan.org.uk/schema/2.5/NaPTAN.xsd" '
+                       'xmlns="http://www.naptan.org.uk/">')
+
+            file.write('<StopPoints>')
+            for block_start in range(0, self.stops, BLOCK_SIZE):
+                count = min(BLOCK_SIZE, self.stops - block_start)
+                positions = zip(*(values.tolist() for values in self._positions(count)))
+                file.write(''.join(self._stop_point(block_start + i, *position) for i, position in enumerate(positions)))
+            file.write('</StopPoints>')
+
+            file.write('<StopAreas>')
+            for block_start in range(0, self.stop_areas, BLOCK_SIZE):
+                count = min(BLOCK_SIZE, self.stop_areas - block_start)
+                positions = zip(*(values.tolist() for values in self._positions(count)))
+                file.write(''.join(self._stop_area(block_start + i, *position) for i, position in enumerate(positions)))
+            file.write('</StopAreas>')
+
+            file.write('</NaPTAN>')
+
+
+def generate(output_path, scale=1.0, seed=0, stops=None):
+    """
+    Write a synthetic NaPTAN XML file.
+
+    Args:
+    output_path (str): Path of the file to write.
+    scale (float): Size relative to the national release (1, 5 and 20 are used by the benchmarks).
+    seed (int): Random seed; the same seed and size always give the same file.
+    stops (int): Exact number of StopPoints, overriding scale.
+
+    Returns:
+    int: Number of StopPoints written.
+    """
+    stops = stops if stops is not None else int(NATIONAL_STOPS * scale)
+    NaptanGenerator(stops, seed).write(output_path)
+    return stops
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic NaPTAN XML file.')
+    parser.add_argument('output_path', nargs='?', default='synthetic_naptan.xml')
+    parser.add_argument('--scale', type=float, default=1.0, help='Size relative to the national release (default: 1)')
+    parser.add_argument('--stops', type=int, help='Exact number of StopPoints, overriding --scale')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stops = generate(args.output_path, args.scale, args.seed, args.stops)
+    print(f"Generated {stops} stops to {args.output_path}")
@@ -0,0 +1,281 @@
+import argparse
+import csv
+import datetime
+import time
+
+import numpy as np
+
+from stop_table import CODED_FIELDS, MISSING, load_stop_table
+
+# Groups a key combination may have before the counts are taken over the groups that
+# actually occur rather than a dense bincount over every possible combination
+DENSE_GROUPS_LIMIT = 1 << 22
+
+# Largest group number the combined int64 codes can hold
+MAX_GROUP_NUMBER = np.iinfo(np.int64).max
+
+
+def _missing_naptan_code(table):
+    return table['NaptanCode'] == MISSING
+
+
+def _has_flexible_zone(table):
+    return table.flexible_zone_sizes != MISSING
+
+
+# Keys derived from a table rather than read from one of its coded columns. Flags give
+# a boolean mask; FlexibleZoneLocations is the number of Locations in the stop's
+# FlexibleZone, 0 for a stop without one.
+FLAG_KEYS = {
+    'MissingNaptanCode': _missing_naptan_code,
+    'HasFlexibleZone': _has_flexible_zone,
+}
+
+KEYS = CODED_FIELDS + tuple(FLAG_KEYS) + ('FlexibleZoneLocations',)
+
+
+def key_column(table, key):
+    """
+    Return a group-by key as integer codes (MISSING where the stop has no value) and
+    the values the codes stand for.
+
+    Args:
+    table (StopTable): The columnar table.
+    key (str): One of KEYS.
+
+    Returns:
+    ndarray: int32 code for each stop.
+    list: The value of each code.
+    """
+    if key in CODED_FIELDS:
+        return table.codes[key], table.categories[key]
+    if key in FLAG_KEYS:
+        return FLAG_KEYS[key](table).astype(np.int32), [False, True]
+    if key == 'FlexibleZoneLocations':
+        sizes = np.maximum(table.flexible_zone_sizes, 0)
+        return sizes, list(range(int(sizes.max(initial=0)) + 1))
+    raise ValueError(f'Unknown group-by key {key!r}; expected one of {", ".join(KEYS)}')
+
+
+class GroupBy:
+    """
+    The stops of a StopTable grouped on one or more categorical keys.
+
+    Each key is a dictionary encoded column, so a group is a combination of integer codes.
+    The codes of all keys are folded into a single integer per stop, and every aggregate
+    is a bincount (or a sort) over those integers: no strings are compared and nothing is
+    reparsed, so any cross-tab of the dataset is a cheap in-memory operation.
+
+    Groups are reported in the order of their first stop in the file, as a dict filled while
+    reading the file would be. A missing value (no element, or an empty one) is a group of
+    its own, reported as None.
+    """
+
+    def __init__(self, table, keys, mask=None):
+        """
+        Args:
+        table (StopTable): The columnar table.
+        keys (list): Keys to group on, from KEYS.
+        mask (ndarray): Optional boolean mask of the stops to include.
+        """
+        self.table = table
+        self.keys = tuple(keys)
+        if not self.keys:
+            raise ValueError('At least one group-by key is needed')
+        self.rows = np.arange(len(table)) if mask is None else np.flatnonzero(mask)
+
+        # Mixed radix: each key's code (shifted so MISSING is 0) is a digit of the group number.
+        # When the next digit would overflow int64, the groups seen so far are renumbered
+        # 0..n-1 first, which keeps the number below the number of stops times the radix.
+        combined = np.zeros(len(self.rows), dtype=np.int64)
+        self._categories = []
+        size = 1
+        for key in self.keys:
+            codes, categories = key_column(table, key)
+            radix = len(categories) + 1
+            if size > MAX_GROUP_NUMBER // radix:
+                combined = np.unique(combined, return_inverse=True)[1].astype(np.int64).reshape(-1)
+                size = int(combined.max(initial=-1)) + 1
+            combined *= radix
+            combined += codes[self.rows] + 1
+            size *= radix
+            self._categories.append(categories)
+
+        if size <= DENSE_GROUPS_LIMIT:
+            counts = np.bincount(combined, minlength=size)
+            groups = np.flatnonzero(counts)
+            lookup = np.zeros(size, dtype=np.int64)
+            lookup[groups] = np.arange(len(groups))
+            ids = lookup[combined]
+            counts = counts[groups]
+        else:
+            groups, ids = np.unique(combined, return_inverse=True)
+            counts = np.bincount(ids, minlength=len(groups))
+
+        # Renumber the groups in order of their first stop (every group occurs, so the
+        # first indices line up with the groups)
+        first = np.unique(ids, return_index=True)[1]
+        order = np.argsort(first, kind='stable')
+        renumber = np.empty(len(groups), dtype=np.int64)
+        renumber[order] = np.arange(len(groups))
+
+        self.ids = renumber[ids]
+        self._counts = counts[order]
+        # A stop of each group, to read the group's key values from
+        self._first_rows = self.rows[first[order]]
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _group_codes(self):
+        # The code of each key (shifted so MISSING is 0) for every group, in order
+        return [key_column(self.table, key)[0][self._first_rows] + 1 for key in self.keys]
+
+    def group_keys(self):
+        """
+        Return the key values of every group, in order.
+
+        Returns:
+        list of tuples: One value per key (None where missing) for each group.
+        """
+        digits = []
+        for codes, categories in zip(self._group_codes(), self._categories):
+            digits.append([None if code == 0 else categories[code - 1] for code in codes.tolist()])
+        return list(zip(*digits))
+
+    def _by_group(self, values):
+        keys = self.group_keys()
+        if len(self.keys) == 1:
+            keys = [key[0] for key in keys]
+        return dict(zip(keys, values))
+
+    def counts(self):
+        """
+        Count the stops in each group.
+
+        Returns:
+        dict: Group key mapped to its count. The key is the value itself when grouping on
+            one key, otherwise a tuple of values.
+        """
+        return self._by_group(self._counts.tolist())
+
+    def members(self, field='AtcoCode'):
+        """
+        List the values of a coded field for the stops of each group, in document order.
+
+        Returns:
+        dict: Group key mapped to a list of values (None where missing).
+        """
+        order = np.argsort(self.ids, kind='stable')
+        values = self.table.decode(field, self.rows[order])
+        bounds = np.cumsum(self._counts).tolist()
+        return self._by_group(values[start:end] for start, end in zip([0] + bounds, bounds))
+
+    def sets(self, field):
+        """
+        Collect the distinct values of a coded field in each group.
+
+        Returns:
+        dict: Group key mapped to a set of values, without missing ones.
+        """
+        return {key: set(values) - {None} for key, values in self.members(field).items()}
+
+    def distinct_counts(self, field):
+        """
+        Count the distinct values of a coded field in each group, without decoding them.
+
+        Returns:
+        dict: Group key mapped to the number of distinct values, not counting missing ones.
+        """
+        codes = self.table.codes[field][self.rows]
+        present = codes != MISSING
+        pairs = np.unique(self.ids[present] * (len(self.table.categories[field]) + 1) + codes[present])
+        counts = np.bincount(pairs // (len(self.table.categories[field]) + 1), minlength=len(self))
+        return self._by_group(counts.tolist())
+
+    def crosstab(self):
+        """
+        Return the counts as a dense array with one axis per key.
+
+        Returns:
+        ndarray: Counts indexed by each key's code plus one; index 0 of an axis holds the
+            stops missing that key.
+        list of lists: The values along each axis, starting with None.
+        """
+        shape = tuple(len(categories) + 1 for categories in self._categories)
+        cube = np.zeros(int(np.prod(shape)), dtype=np.int64)
+        cube[np.ravel_multi_index(self._group_codes(), shape)] = self._counts
+        return cube.reshape(shape), [[None] + list(categories) for categories in self._categories]
+
+
+def group_counts(table, keys, mask=None):
+    """
+    Count the stops of a table by one or more keys.
+
+    Args:
+    table (StopTable): The columnar table.
+    keys (list): Keys to group on, from KEYS.
+    mask (ndarray): Optional boolean mask of the stops to include.
+
+    Returns:
+    dict: Group key mapped to its count, as GroupBy.counts.
+    """
+    return GroupBy(table, keys, mask).counts()
+
+
+def parse_filters(table, filters):
+    """
+    Turn FIELD=VALUE filters on coded fields into a boolean mask of the matching stops.
+    """
+    mask = np.ones(len(table), dtype=bool)
+    for condition in filters:
+        field, _, value = condition.partition('=')
+        if field not in CODED_FIELDS:
+            raise ValueError(f'Cannot filter on {field!r}; expected one of {", ".join(CODED_FIELDS)}')
+        mask &= table.equals(field, value)
+    return mask
+
+
+def export_to_csv(keys, counts, filename):
+    """
+    Export group counts to a CSV file.
+
+    Args:
+    keys (list): The keys grouped on, one column each.
+    counts (dict): Result of GroupBy.counts.
+    filename (str): Filename for the CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(list(keys) + ['Count'])
+        for group, count in counts.items():
+            values = group if len(keys) > 1 else (group,)
+            writer.writerow(['' if value is None else value for value in values] + [count])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Count the stops of NaPTAN.xml by any combination of categorical keys.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--by', nargs='+', choices=KEYS, default=['StopType', 'Status', 'AdministrativeAreaRef', 'MissingNaptanCode'],
+                        help='Keys to group on (default: StopType Status AdministrativeAreaRef MissingNaptanCode)')
+    parser.add_argument('--where', nargs='+', default=[], metavar='FIELD=VALUE',
+                        help='Only count stops whose coded fields have these values, e.g. StopType=BCT')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = load_stop_table(args.file_path)
+    print(f"Loaded {len(table)} stops in {time.perf_counter() - start:.2f}s")
+
+    try:
+        start = time.perf_counter()
+        counts = GroupBy(table, args.by, parse_filters(table, args.where)).counts()
+        print(f"Counted {len(counts)} groups in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        csv_filename = f'group_counts_{timestamp}.csv'
+        export_to_csv(args.by, counts, csv_filename)
+        print(f"Exported group counts to {csv_filename}")
+    except ValueError as e:
+        print(f"Error occurred: {e}")
@@ -1,4 +1,35 @@
-import xml.etree.ElementTree as ET
+from query import Query
+
+
+class InactiveStopsAnalysis:
+    """
+    Count stops with the status "inactive", one StopPoint at a time.
+    """
+    name = 'inactive'
+    # The fields process_record reads
+    fields = ('Status',)
+
+    def __init__(self):
+        # Counter for inactive stops
+        self.inactive_stops_count = 0
+
+    def process(self, stop_point):
+        self.process_record({'Status': stop_point.get('Status')})
+
+    def process_record(self, record):
+        # Count one stop, given as a Query record of its fields
+        status = record['Status']
+        if status and status.lower() == 'inactive':
+            self.inactive_stops_count += 1
+
+    def merge(self, other):
+        self.inactive_stops_count += other.inactive_stops_count
+
+    def result(self):
+        return self.inactive_stops_count
+
+    def export(self, timestamp):
+        export_results(self.result(), timestamp)
 
 
 def count_inactive_stops(xml_file_path):
@@ -8,30 +39,29 @@ def count_inactive_stops(xml_file_path):
     :param xml_file_path: Path to the XML file
     :return: Count of inactive stops
     """
-    # Parse the XML file
-    tree = ET.parse(xml_file_path)
-    root = tree.getroot()
-
-    # Namespace handling for tags
-    ns = {'naptan': 'http://www.naptan.org.uk/'}
+    # Only the Status attribute is read, so the parser never looks inside the StopPoints
+    analysis = InactiveStopsAnalysis()
+    for record in Query(analysis.fields).run(xml_file_path):
+        analysis.process_record(record)
+    return analysis.result()
 
-    # Counter for inactive stops
-    inactive_stops_count = 0
 
-    # Iterate through each StopPoint element
-    for stop_point in root.findall('.//naptan:StopPoint', ns):
-        status = stop_point.get('Status')
-        if status and status.lower() == 'inactive':
-            inactive_stops_count += 1
+def export_results(inactive_stops_count, timestamp):
+    """
+    Print the count of inactive stops.
 
-    return inactive_stops_count
+    :param inactive_stops_count: Count of inactive stops
+    :param timestamp: Timestamp used in exported filenames
+    """
+    print(f"Number of inactive stops: {inactive_stops_count}")
 
 
-# Path to your NaPTAN XML dataset file
-file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+if __name__ == "__main__":
+    # Path to your NaPTAN XML dataset file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
 
-# Count inactive stops
-inactive_stops_count = count_inactive_stops(file_path)
+    # Count inactive stops
+    inactive_stops_count = count_inactive_stops(file_path)
 
-# Print the count of inactive stops
-print(f"Number of inactive stops: {inactive_stops_count}")
+    # Print the count of inactive stops
+    export_results(inactive_stops_count, None)
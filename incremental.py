@@ -0,0 +1,327 @@
+import argparse
+import datetime
+import os
+import pickle
+import time
+from collections import Counter, defaultdict
+
+from dataset_cache import CACHE_DIR, READ_ERRORS
+from release_diff import Release, _fingerprint, _revision
+from run_all import ANALYSES, export_analyses
+from stop_index import parse_stop_point, scan_stop_points
+from stop_record import attach_source
+
+# Bump whenever the contributions kept for an analysis change, so old state is never reused
+STATE_VERSION = 4
+
+# Where the per-stop contributions of the last run are kept between releases
+STATE_PATH = os.path.join(CACHE_DIR, 'incremental_state.pickle')
+
+
+class RunningTotal:
+    """
+    Contributions of an analysis whose result is a sum over stops, independent of their order.
+
+    The total is kept with the state and moved to a new release by subtracting the
+    contributions of the stops that changed or disappeared and adding those of the stops
+    that changed or appeared, without touching the rest.
+    """
+    reversible = True
+
+    def __init__(self, attribute, keys=None):
+        """
+        Args:
+        attribute (str): The analysis attribute holding the count, or a dict of counts.
+        keys (tuple): The keys of that dict, when it is one.
+        """
+        self.attribute = attribute
+        self.keys = keys
+
+    def extract(self, analysis):
+        value = getattr(analysis, self.attribute)
+        if self.keys is None:
+            return value or None
+        counts = tuple(value[key] for key in self.keys)
+        return counts if any(counts) else None
+
+    def empty(self):
+        return 0 if self.keys is None else (0,) * len(self.keys)
+
+    def add(self, total, contribution, sign=1):
+        if contribution is None:
+            return total
+        if self.keys is None:
+            return total + sign * contribution
+        return tuple(count + sign * part for count, part in zip(total, contribution))
+
+    def restore(self, analysis, total):
+        if self.keys is None:
+            setattr(analysis, self.attribute, total)
+        else:
+            getattr(analysis, self.attribute).update(zip(self.keys, total))
+
+
+class InOrder:
+    """
+    Contributions of an analysis whose result depends on the order of the stops: one small
+    tuple per stop (None for a stop it records nothing for), replayed in document order.
+    """
+    reversible = False
+
+    def __init__(self, extract, replay):
+        """
+        Args:
+        extract (function): Reads the contribution from an analysis that has processed one stop.
+        replay (function): Fills a new analysis from (row, contribution) pairs in document
+            order, given the byte range of the stop at each row.
+        """
+        self.extract = extract
+        self.replay = replay
+
+
+def _single(values):
+    return next(iter(values), None)
+
+
+def _replay_unique_codes(analysis, contributions, ranges):
+    analysis.atco_codes = {atco_code for _, (atco_code, _) in contributions if atco_code}
+    analysis.naptan_codes = {naptan_code for _, (_, naptan_code) in contributions if naptan_code}
+
+
+def _replay_duplicates(analysis, contributions, ranges):
+    analysis.atco_counter = Counter(atco_code for _, (atco_code, _) in contributions if atco_code)
+    analysis.naptan_counter = Counter(naptan_code for _, (_, naptan_code) in contributions if naptan_code)
+
+
+def _replay_missing_naptan_code(analysis, contributions, ranges):
+    for _, (atco_code, stop_type) in contributions:
+        analysis.counts_by_type[stop_type] += 1
+        analysis.atco_and_type.append((atco_code, stop_type))
+
+
+def _replay_deleted_common_name(analysis, contributions, ranges):
+    analysis.atco_with_delete = [contribution for _, contribution in contributions]
+
+
+def _replay_flexiblezone_stoptype(analysis, contributions, ranges):
+    for _, (bus_stop_type,) in contributions:
+        analysis.bus_stop_type_counts[bus_stop_type] += 1
+
+
+def _replay_flexible_zone_count(analysis, contributions, ranges):
+    for _, (num_locations, atco_code) in contributions:
+        analysis.counts[num_locations] = analysis.counts.get(num_locations, 0) + 1
+        analysis.atco_codes_by_group.setdefault(num_locations, []).append(atco_code)
+
+
+def _replay_multiple_naptan(analysis, contributions, ranges):
+    analysis.atco_to_naptan = defaultdict(list)
+    for _, (atco_code, naptan_code) in contributions:
+        analysis.atco_to_naptan[atco_code].append(naptan_code)
+
+
+def _replay_matching_stops(codes_attribute, records_attribute):
+    # Kept records are moved to the stop's place in the new release
+    def replay(analysis, contributions, ranges):
+        for row, (_, record) in contributions:
+            record.position = row
+            record.start, record.end = ranges[row]
+        setattr(analysis, codes_attribute, [atco_code for _, (atco_code, _) in contributions])
+        setattr(analysis, records_attribute, [record for _, (_, record) in contributions])
+    return replay
+
+
+# How the per-stop contribution of each analysis is read and put back together. Each
+# contribution is taken from a new analysis that has processed just that stop.
+CONTRIBUTIONS = {
+    'count': RunningTotal('total_stops'),
+    'inactive': RunningTotal('inactive_stops_count'),
+    'FLX_LL_vs_NE': RunningTotal('counts', ('easting_northing_only_stops', 'lat_long_only_stops', 'both_stops',
+                                            'easting_northing_zero_stops', 'lat_long_zero_stops')),
+    'main': InOrder(
+        lambda analysis: (_single(analysis.atco_codes), _single(analysis.naptan_codes))
+        if analysis.atco_codes or analysis.naptan_codes else None,
+        _replay_unique_codes),
+    'duplicates': InOrder(
+        lambda analysis: (_single(analysis.atco_counter), _single(analysis.naptan_counter))
+        if analysis.atco_counter or analysis.naptan_counter else None,
+        _replay_duplicates),
+    'missing_naptan_code': InOrder(lambda analysis: _single(analysis.atco_and_type), _replay_missing_naptan_code),
+    'deleted_common_name': InOrder(lambda analysis: _single(analysis.atco_with_delete), _replay_deleted_common_name),
+    'flexiblezone_stoptype': InOrder(
+        lambda analysis: (_single(analysis.bus_stop_type_counts),) if analysis.bus_stop_type_counts else None,
+        _replay_flexiblezone_stoptype),
+    'FLX_zone_count': InOrder(
+        lambda analysis: (_single(analysis.counts), _single(analysis.atco_codes_by_group.values())[0])
+        if analysis.counts else None,
+        _replay_flexible_zone_count),
+    'one_atco_many_naptan': InOrder(
+        lambda analysis: next(((atco_code, naptan_codes[0]) for atco_code, naptan_codes in analysis.atco_to_naptan.items()),
+                              None),
+        _replay_multiple_naptan),
+    'zero_coords': InOrder(
+        lambda analysis: (analysis.invalid_stops[0], analysis.invalid_stop_records[0]) if analysis.invalid_stops else None,
+        _replay_matching_stops('invalid_stops', 'invalid_stop_records')),
+    'count_FLX': InOrder(
+        lambda analysis: (analysis.atco_codes[0], analysis.matching_stops[0]) if analysis.atco_codes else None,
+        _replay_matching_stops('atco_codes', 'matching_stops')),
+}
+
+
+def _load_state(state_path, names):
+    try:
+        with open(state_path, 'rb') as file:
+            header = pickle.load(file)
+            if header.get('version') != STATE_VERSION or header.get('analyses') != list(names):
+                return None
+            return pickle.load(file)
+    except READ_ERRORS:
+        return None
+
+
+def _save_state(state_path, names, file_path, state):
+    header = {'version': STATE_VERSION, 'analyses': list(names), 'source': os.path.abspath(file_path),
+              'created': time.time()}
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    temp_path = f'{state_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, state_path)
+
+
+def run_incremental(file_path, names=None, state_path=STATE_PATH, fast_path=True):
+    """
+    Run the analyses over a release, reprocessing only the stops that changed since the last run.
+
+    Every StopPoint of the release is located by scanning the raw bytes and matched to the
+    previous run's stops on AtcoCode. A stop whose ModificationDateTime and RevisionNumber
+    are both given and unchanged (unless fast_path is False), or whose raw bytes hash the
+    same, keeps the
+    contributions it made last time. Only the other stops, and the stops that appeared,
+    are parsed and processed. Totals are moved by the difference of the contributions of
+    the changed, added and removed stops; order dependent results are replayed from the
+    kept contributions in the new document order. The analyses come out exactly as a
+    full run of run_all.py would leave them.
+
+    Without a previous state (or with one for other analyses), every stop is processed.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file, plain or compressed.
+    names (list): Names of the analyses to run. Defaults to all of them.
+    state_path (str): Where the contributions of the last run are kept.
+    fast_path (bool): Trust ModificationDateTime and RevisionNumber to tell a stop is unchanged.
+
+    Returns:
+    list: The completed analyses, ready to export.
+    dict: Number of stops in the release, and of those unchanged, changed and added since the
+        last run, and of the stops removed.
+    """
+    names = list(names or ANALYSES)
+    contributions = {name: CONTRIBUTIONS[name] for name in names}
+    old = _load_state(state_path, names)
+    if old is None:
+        old = {'keys': [], 'revisions': [], 'fingerprints': [],
+               'contributions': {name: [] for name in names},
+               'totals': {name: contribution.empty() for name, contribution in contributions.items()
+                          if contribution.reversible}}
+
+    # Rows of the previous run for each ATCO code, in document order, so duplicated codes pair up in turn
+    old_rows = defaultdict(list)
+    for row, key in enumerate(old['keys']):
+        if key is not None:
+            old_rows[key].append(row)
+    for rows in old_rows.values():
+        rows.reverse()
+
+    new = {'keys': [], 'revisions': [], 'fingerprints': [], 'contributions': {name: [] for name in names}}
+    totals = dict(old['totals'])
+    reused = [False] * len(old['keys'])
+    ranges = []
+    stats = {'stops': 0, 'unchanged': 0, 'changed': 0, 'added': 0, 'removed': 0}
+
+    with Release(file_path) as release:
+        data = release.data
+        for start, end, codes in scan_stop_points(data):
+            atco_code = codes[0] or None
+            revision = _revision(data[start:data.find(b'>', start) + 1])
+            matches = old_rows.get(atco_code)
+            old_row = matches.pop() if matches else None
+
+            if old_row is not None and fast_path and old['revisions'][old_row] == revision and None not in revision:
+                fingerprint = old['fingerprints'][old_row]
+                unchanged = True
+            else:
+                fingerprint = _fingerprint(data[start:end])
+                unchanged = old_row is not None and old['fingerprints'][old_row] == fingerprint
+
+            ranges.append((start, end))
+            new['keys'].append(atco_code)
+            new['revisions'].append(revision)
+            new['fingerprints'].append(fingerprint)
+
+            if unchanged:
+                reused[old_row] = True
+                for name in names:
+                    new['contributions'][name].append(old['contributions'][name][old_row])
+                stats['unchanged'] += 1
+                continue
+
+            stop_point = parse_stop_point(release.prefix, data[start:end], release.root_tag)
+            for name, contribution in contributions.items():
+                analysis = ANALYSES[name]()
+                analysis.process(stop_point)
+                value = contribution.extract(analysis)
+                new['contributions'][name].append(value)
+                if contribution.reversible:
+                    totals[name] = contribution.add(totals[name], value)
+            stats['added' if old_row is None else 'changed'] += 1
+
+        stats['stops'] = len(ranges)
+        stats['removed'] = sum(len(rows) for rows in old_rows.values())
+
+        # Take back what the stops that changed or disappeared contributed last time
+        for old_row, kept in enumerate(reused):
+            if kept:
+                continue
+            for name, contribution in contributions.items():
+                if contribution.reversible:
+                    totals[name] = contribution.add(totals[name], old['contributions'][name][old_row], -1)
+
+        analyses = []
+        for name, contribution in contributions.items():
+            analysis = ANALYSES[name]()
+            if contribution.reversible:
+                contribution.restore(analysis, totals[name])
+            else:
+                made = [(row, value) for row, value in enumerate(new['contributions'][name]) if value is not None]
+                contribution.replay(analysis, made, ranges)
+            analyses.append(analysis)
+        attach_source(analyses, file_path)
+
+    new['totals'] = totals
+    _save_state(state_path, names, file_path, new)
+    return analyses, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the NaPTAN analyses, reprocessing only the stops changed since the last run.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--only', nargs='+', choices=sorted(ANALYSES), help='Analyses to run (default: all)')
+    parser.add_argument('--state', default=STATE_PATH, help=f'Contributions kept from the last run (default: {STATE_PATH})')
+    parser.add_argument('--full', action='store_true',
+                        help='Compare the raw bytes of every stop rather than trusting ModificationDateTime and RevisionNumber')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        analyses, stats = run_incremental(args.file_path, args.only, args.state, not args.full)
+    except Exception as e:
+        print(f"Error occurred: {e}")
+    else:
+        print(f"{stats['stops']} stops: {stats['unchanged']} unchanged, {stats['changed']} changed, "
+              f"{stats['added']} added, {stats['removed']} removed ({time.perf_counter() - start:.2f}s)")
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        export_analyses(analyses, timestamp)
@@ -1,4 +1,44 @@
-import xml.etree.ElementTree as ET
+import datetime
+
+from query import Query
+
+
+class UniqueCodesAnalysis:
+    """
+    Collect the distinct ATCO and NaPTAN codes one StopPoint at a time.
+    """
+    name = 'main'
+    # The fields process_record reads
+    fields = ('AtcoCode', 'NaptanCode')
+
+    def __init__(self):
+        # Initialize sets to store unique codes
+        self.atco_codes = set()
+        self.naptan_codes = set()
+
+    def process(self, stop_point):
+        self.process_record({
+            'AtcoCode': stop_point.findtext('{http://www.naptan.org.uk/}AtcoCode'),
+            'NaptanCode': stop_point.findtext('{http://www.naptan.org.uk/}NaptanCode'),
+        })
+
+    def process_record(self, record):
+        # Add the ATCO and NaPTAN codes of one stop, given as a Query record of its fields
+        if record['AtcoCode']:
+            self.atco_codes.add(record['AtcoCode'])
+        if record['NaptanCode']:
+            self.naptan_codes.add(record['NaptanCode'])
+
+    def merge(self, other):
+        self.atco_codes |= other.atco_codes
+        self.naptan_codes |= other.naptan_codes
+
+    def result(self):
+        return len(self.atco_codes), len(self.naptan_codes)
+
+    def export(self, timestamp):
+        export_results(*self.result(), timestamp)
+
 
 def count_unique_codes(file_path):
     """
@@ -11,39 +51,34 @@ def count_unique_codes(file_path):
     tuple: A tuple containing the count of unique ATCO codes and unique NaPTAN codes.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        stop_points = root.find('{http://www.naptan.org.uk/}StopPoints')
-
-        # Initialize sets to store unique codes
-        atco_codes = set()
-        naptan_codes = set()
-
-        # Iterate over all StopPoint elements
-        for stop_point in stop_points.findall('{http://www.naptan.org.uk/}StopPoint'):
-            # Extract ATCO code
-            atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
-            if atco_code_elem is not None and atco_code_elem.text:
-                atco_codes.add(atco_code_elem.text)
-
-            # Extract NaPTAN code
-            naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
-            if naptan_code_elem is not None and naptan_code_elem.text:
-                naptan_codes.add(naptan_code_elem.text)
-
-        return len(atco_codes), len(naptan_codes)
+        # Only AtcoCode and NaptanCode are read from each StopPoint
+        analysis = UniqueCodesAnalysis()
+        for record in Query(analysis.fields).run(file_path):
+            analysis.process_record(record)
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
         return None
 
+def export_results(unique_atco_count, unique_naptan_count, timestamp):
+    """
+    Output the unique ATCO and NaPTAN code counts.
+
+    Args:
+    unique_atco_count (int): Count of unique ATCO codes.
+    unique_naptan_count (int): Count of unique NaPTAN codes.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    if unique_atco_count is not None and unique_naptan_count is not None:
+        print(f"Unique ATCO Codes: {unique_atco_count}")
+        print(f"Unique NaPTAN Codes: {unique_naptan_count}")
+
 if __name__ == "__main__":
     # Replace this with the absolute path to your NaPTAN XML file
     file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
 
 
     unique_atco_count, unique_naptan_count = count_unique_codes(file_path)
-    if unique_atco_count is not None and unique_naptan_count is not None:
-        print(f"Unique ATCO Codes: {unique_atco_count}")
-        print(f"Unique NaPTAN Codes: {unique_naptan_count}")
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(unique_atco_count, unique_naptan_count, timestamp)
@@ -0,0 +1,250 @@
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+import traceback
+
+from compressed import open_naptan
+from naptan_stream import iter_stop_points
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then reported as unknown
+    resource = None
+
+# StopPoints between checks of the progress clock, so progress reporting costs nothing per stop
+PROGRESS_CHECK_EVERY = 1000
+
+# Phases a run is broken into, in the order they are reported
+PHASES = ('open', 'parse', 'aggregate', 'export')
+
+
+def peak_rss_bytes(who=None):
+    """
+    Return the peak resident set size in bytes, or None where it can't be measured.
+
+    Args:
+    who (int): resource.RUSAGE_SELF (the default) or resource.RUSAGE_CHILDREN, the largest
+        of the finished child processes.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RunMetrics:
+    """
+    Timings, throughput, memory and errors of one run of the analyses.
+
+    Time is broken into phases: open (opening the source), parse (the XML parser producing
+    StopPoints), aggregate (the analyses processing them) and export (writing the outputs).
+    Each phase records wall clock and CPU time, and aggregate and export are also broken
+    down by analysis. CPU time is measured per thread, so it only counts the work of the
+    thread doing it.
+
+    Like the analyses, metrics from runs over separate chunks of a file can be merged.
+    """
+
+    def __init__(self, file_path=None, progress_interval=None):
+        """
+        Args:
+        file_path (str): Path to the NaPTAN XML file, recorded in the output.
+        progress_interval (float): Seconds between progress lines printed during the scan.
+            No progress is printed when None.
+        """
+        self.file_path = file_path if isinstance(file_path, str) else None
+        self.progress_interval = progress_interval
+        self.started = datetime.datetime.now()
+        self.stop_points = 0
+        self.phases = {}
+        self.analyses = {}
+        self.errors = []
+        # Wall clock seconds each analysis has spent processing StopPoints
+        self._process_seconds = {}
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._last_progress = self._start_wall
+
+    def add_time(self, phase, wall, cpu, analysis=None):
+        """
+        Add wall clock and CPU seconds to a phase, and to an analysis' share of it.
+        """
+        totals = self.phases.setdefault(phase, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+        if analysis is not None:
+            totals = self.analyses.setdefault(analysis, {}).setdefault(phase, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+
+    @contextlib.contextmanager
+    def phase(self, phase, analysis=None):
+        """
+        Time the body of a with statement as part of a phase.
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - wall, time.thread_time() - cpu, analysis)
+
+    def iter_stop_points(self, file_path):
+        """
+        Stream the StopPoints of a NaPTAN XML file as naptan_stream.iter_stop_points does,
+        counting StopPoints and printing progress.
+
+        The time spent producing each StopPoint is added to the parse phase, and the time
+        until the caller asks for the next one to the aggregate phase, so the clocks are
+        read twice per StopPoint however many analyses there are.
+        """
+        opened = not hasattr(file_path, 'read')
+        with self.phase('open'):
+            source = open_naptan(file_path) if opened else file_path
+            try:
+                total_bytes = os.fstat(source.fileno()).st_size
+            except (AttributeError, OSError, ValueError):
+                total_bytes = None
+
+        try:
+            stop_points = iter_stop_points(source)
+            parse = self.phases.setdefault('parse', [0.0, 0.0])
+            aggregate = self.phases.setdefault('aggregate', [0.0, 0.0])
+            wall, cpu = time.perf_counter(), time.thread_time()
+            while True:
+                stop_point = next(stop_points, None)
+                parsed_wall, parsed_cpu = time.perf_counter(), time.thread_time()
+                parse[0] += parsed_wall - wall
+                parse[1] += parsed_cpu - cpu
+                if stop_point is None:
+                    return
+                self.stop_points += 1
+                if self.progress_interval and self.stop_points % PROGRESS_CHECK_EVERY == 0:
+                    self.report_progress(source, total_bytes)
+                yield stop_point
+                wall, cpu = time.perf_counter(), time.thread_time()
+                aggregate[0] += wall - parsed_wall
+                aggregate[1] += cpu - parsed_cpu
+        finally:
+            if opened:
+                source.close()
+
+    def process(self, analysis, stop_point):
+        """
+        Hand a StopPoint to an analysis, adding the wall clock time it takes to the analysis' total.
+
+        Only the wall clock is read here, as it is much cheaper than the thread CPU clock;
+        each analysis' CPU time is its share of the aggregate phase's.
+        """
+        start = time.perf_counter()
+        try:
+            analysis.process(stop_point)
+        finally:
+            self._process_seconds[analysis.name] = (self._process_seconds.get(analysis.name, 0.0)
+                                                    + time.perf_counter() - start)
+
+    def record_error(self, phase, analysis, error):
+        """
+        Record an exception raised by an analysis, with its traceback.
+        """
+        self.errors.append({
+            'phase': phase,
+            'analysis': analysis,
+            'type': type(error).__name__,
+            'message': str(error),
+            'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+        })
+
+    def report_progress(self, source=None, total_bytes=None):
+        """
+        Print a progress line if progress_interval seconds have passed since the last one.
+        """
+        now = time.perf_counter()
+        if now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        elapsed = now - self._start_wall
+        line = f"{self.stop_points} stops, {self.stop_points / elapsed if elapsed else 0:.0f} stops/s"
+        if total_bytes and source is not None:
+            try:
+                line += f", {source.tell() / total_bytes:.0%} of file"
+            except (AttributeError, OSError, ValueError):
+                pass
+        print(f"{line}, {elapsed:.1f}s elapsed", flush=True)
+
+    def merge(self, other):
+        """
+        Fold in the metrics of a run over a later chunk of the same file.
+        """
+        self.stop_points += other.stop_points
+        for analysis, seconds in other._process_seconds.items():
+            self._process_seconds[analysis] = self._process_seconds.get(analysis, 0.0) + seconds
+        for phase, (wall, cpu) in other.phases.items():
+            self.add_time(phase, wall, cpu)
+        for analysis, phases in other.analyses.items():
+            for phase, (wall, cpu) in phases.items():
+                totals = self.analyses.setdefault(analysis, {}).setdefault(phase, [0.0, 0.0])
+                totals[0] += wall
+                totals[1] += cpu
+        self.errors.extend(other.errors)
+
+    def result(self):
+        """
+        Return the metrics as plain data, ready to be written as JSON.
+        """
+        wall = time.perf_counter() - self._start_wall
+        parse_wall = self.phases.get('parse', [0.0, 0.0])[0]
+        ordered = [phase for phase in PHASES if phase in self.phases] + sorted(set(self.phases) - set(PHASES))
+        return {
+            'file_path': self.file_path,
+            'started': self.started.isoformat(timespec='seconds'),
+            'wall_seconds': wall,
+            'cpu_seconds': time.process_time() - self._start_cpu,
+            'stop_points': self.stop_points,
+            'stop_points_per_second': self.stop_points / wall if wall else None,
+            'parse_stop_points_per_second': self.stop_points / parse_wall if parse_wall else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'peak_rss_children_bytes': peak_rss_bytes(resource.RUSAGE_CHILDREN) if resource is not None else None,
+            'phases': {phase: {'wall_seconds': self.phases[phase][0], 'cpu_seconds': self.phases[phase][1]}
+                       for phase in ordered},
+            'analyses': self._analysis_times(),
+            'errors': self.errors,
+        }
+
+    def _analysis_times(self):
+        """
+        Break the aggregate and export phases down by analysis.
+        """
+        times = {}
+        process_total = sum(self._process_seconds.values())
+        aggregate_cpu = self.phases.get('aggregate', [0.0, 0.0])[1]
+        for analysis, seconds in self._process_seconds.items():
+            times[analysis] = {
+                'aggregate_wall_seconds': seconds,
+                'aggregate_cpu_seconds': aggregate_cpu * seconds / process_total if process_total else 0.0,
+            }
+        for analysis, phases in self.analyses.items():
+            for phase, (wall, cpu) in phases.items():
+                times.setdefault(analysis, {}).update({f'{phase}_wall_seconds': wall, f'{phase}_cpu_seconds': cpu})
+        return times
+
+    def export(self, timestamp):
+        export_results(self.result(), timestamp)
+
+
+def export_results(metrics, timestamp):
+    """
+    Write run metrics to a timestamped JSON file.
+
+    Args:
+    metrics (dict): Result of RunMetrics.result().
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    json_filename = f'run_metrics_{timestamp}.json'
+    with open(json_filename, 'w', encoding='utf-8') as file:
+        json.dump(metrics, file, indent=2)
+    print(f"Exported run metrics to {json_filename}")
@@ -1,8 +1,43 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 from collections import defaultdict
 
+from naptan_stream import scan
+
+
+class MissingNaptanCodeAnalysis:
+    """
+    Collect ATCO codes with no NaPTAN code one StopPoint at a time, grouped by stop type.
+    """
+    name = 'missing_naptan_code'
+
+    def __init__(self):
+        # Dictionary to store counts and list to store details of ATCO codes with no NaPTAN codes, grouped by stop type
+        self.counts_by_type = defaultdict(int)
+        self.atco_and_type = []
+
+    def process(self, stop_point):
+        # Extract ATCO, NaPTAN codes, and StopType
+        atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
+        naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
+        stop_type_elem = stop_point.find('{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}StopType')
+        if atco_code_elem is not None and atco_code_elem.text and (naptan_code_elem is None or not naptan_code_elem.text):
+            stop_type = stop_type_elem.text if stop_type_elem is not None else 'Unknown'
+            self.counts_by_type[stop_type] += 1
+            self.atco_and_type.append((atco_code_elem.text, stop_type))
+
+    def merge(self, other):
+        for stop_type, count in other.counts_by_type.items():
+            self.counts_by_type[stop_type] += count
+        self.atco_and_type.extend(other.atco_and_type)
+
+    def result(self):
+        return self.counts_by_type, self.atco_and_type
+
+    def export(self, timestamp):
+        export_results(*self.result(), timestamp)
+
+
 def find_atco_with_no_naptan_and_grouped_by_type(file_path):
     """
     Find ATCO codes that have no associated NaPTAN codes in the NaPTAN XML file,
@@ -16,27 +51,10 @@ def find_atco_with_no_naptan_and_grouped_by_type(file_path):
     list of tuples: A list of tuples with ATCO codes and stop types for stops with no NaPTAN codes.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        stop_points = root.find('{http://www.naptan.org.uk/}StopPoints')
-
-        # Dictionary to store counts and list to store details of ATCO codes with no NaPTAN codes, grouped by stop type
-        counts_by_type = defaultdict(int)
-        atco_and_type = []
-
-        # Iterate over all StopPoint elements
-        for stop_point in stop_points.findall('{http://www.naptan.org.uk/}StopPoint'):
-            # Extract ATCO, NaPTAN codes, and StopType
-            atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
-            naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
-            stop_type_elem = stop_point.find('{http://www.naptan.org.uk/}StopClassification/{http://www.naptan.org.uk/}StopType')
-            if atco_code_elem is not None and atco_code_elem.text and (naptan_code_elem is None or not naptan_code_elem.text):
-                stop_type = stop_type_elem.text if stop_type_elem is not None else 'Unknown'
-                counts_by_type[stop_type] += 1
-                atco_and_type.append((atco_code_elem.text, stop_type))
-
-        return counts_by_type, atco_and_type
+        # Stream over all StopPoint elements
+        analysis = MissingNaptanCodeAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
@@ -57,14 +75,16 @@ def export_to_csv(data, filename, column_names):
         for row in data:
             writer.writerow(row)
 
-if __name__ == "__main__":
-    # Replace this with the absolute path to your NaPTAN XML file
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-
-    counts_by_type, atco_and_type = find_atco_with_no_naptan_and_grouped_by_type(file_path)
+def export_results(counts_by_type, atco_and_type, timestamp):
+    """
+    Export counts by stop type and details of stops with no NaPTAN code to timestamped CSV files.
 
-    # Export counts by type to a CSV file with a timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    Args:
+    counts_by_type (dict): Stop types mapped to counts of ATCO codes with no NaPTAN code.
+    atco_and_type (list of tuples): ATCO codes and stop types for stops with no NaPTAN code.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    # Export counts by type to a CSV file
     csv_filename_counts = f'atco_with_no_naptan_by_type_{timestamp}.csv'
     export_to_csv(counts_by_type.items(), csv_filename_counts, ['Stop Type', 'Count'])
     print(f"Exported counts to {csv_filename_counts}")
@@ -73,3 +93,13 @@ if __name__ == "__main__":
     csv_filename_details = f'atco_with_no_naptan_details_{timestamp}.csv'
     export_to_csv(atco_and_type, csv_filename_details, ['ATCO Code', 'Stop Type'])
     print(f"Exported details to {csv_filename_details}")
+
+if __name__ == "__main__":
+    # Replace this with the absolute path to your NaPTAN XML file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+
+    counts_by_type, atco_and_type = find_atco_with_no_naptan_and_grouped_by_type(file_path)
+
+    # Export to CSV files with a timestamp
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(counts_by_type, atco_and_type, timestamp)
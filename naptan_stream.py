@@ -0,0 +1,188 @@
+import xml.etree.ElementTree as ET
+import sys
+
+from compressed import open_naptan
+
+# Default NaPTAN namespace used throughout the dataset
+NAPTAN_NS = 'http://www.naptan.org.uk/'
+STOP_POINT_TAG = f'{{{NAPTAN_NS}}}StopPoint'
+ns = {'n': NAPTAN_NS}
+
+# Fields extracted from each StopPoint by extract_stop_fields, in order
+STOP_FIELDS = (
+    'AtcoCode', 'NaptanCode',
+    'CommonName', 'ShortCommonName', 'Landmark', 'Street', 'Indicator',
+    'StopType', 'BusStopType', 'TimingStatus',
+    'Status', 'CreationDateTime', 'ModificationDateTime', 'Modification', 'RevisionNumber',
+    'Easting', 'Northing', 'Latitude', 'Longitude',
+    'AdministrativeAreaRef', 'NptgLocalityRef',
+    'StopAreaRefs', 'FlexibleZone',
+)
+
+# Low cardinality fields whose values are interned so repeats share one string
+CATEGORICAL_FIELDS = (
+    'StopType', 'BusStopType', 'TimingStatus', 'Status', 'Modification', 'RevisionNumber',
+    'AdministrativeAreaRef', 'NptgLocalityRef',
+)
+
+
+def iter_stop_points(file_path):
+    """
+    Stream the StopPoint elements of a NaPTAN XML file one at a time.
+
+    The file is read with iterparse rather than building the whole tree, and every
+    StopPoint is cleared and detached from its parent once the caller has moved on to
+    the next one, so memory stays flat whatever the size of the file. Other top level
+    records (such as StopAreas/StopArea) are discarded in the same way as they complete.
+
+    An element is only valid until the next one is requested. Callers that need to keep
+    a StopPoint beyond the current iteration should take a copy with copy.deepcopy.
+
+    A zip, gzip, bz2 or xz compressed file is decompressed on a background thread as it
+    is parsed, without unpacking it to disk first.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file (plain or compressed), or a binary file object to read it from.
+
+    Yields:
+    Element: Each StopPoint element, in document order.
+    """
+    if hasattr(file_path, 'read'):
+        yield from _iter_stop_points(file_path)
+    else:
+        with open_naptan(file_path) as source:
+            yield from _iter_stop_points(source)
+
+
+def _iter_stop_points(source):
+    # Stack of currently open elements, so completed records can be detached from their parent
+    open_elements = []
+    # Number of StopPoints currently open, so nothing inside one is released before it is yielded
+    open_stop_points = 0
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            open_elements.append(elem)
+            if elem.tag == STOP_POINT_TAG:
+                open_stop_points += 1
+            continue
+
+        open_elements.pop()
+        if elem.tag == STOP_POINT_TAG:
+            open_stop_points -= 1
+            yield elem
+        elif open_stop_points or len(open_elements) != 2:
+            # Only whole records directly below a top level container are released
+            continue
+
+        elem.clear()
+        if open_elements:
+            open_elements[-1].remove(elem)
+
+
+def scan(file_path, analyses, metrics=None):
+    """
+    Feed every StopPoint in the NaPTAN XML file to each analysis in a single pass.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    analyses (list): Analysis objects exposing a process(stop_point) method.
+    metrics (RunMetrics): Optional metrics.RunMetrics to record the pass's timings in.
+
+    Returns:
+    list: The same analyses, once every StopPoint has been processed.
+    """
+    if metrics is not None:
+        for stop_point in metrics.iter_stop_points(file_path):
+            for analysis in analyses:
+                metrics.process(analysis, stop_point)
+        return analyses
+
+    for stop_point in iter_stop_points(file_path):
+        for analysis in analyses:
+            analysis.process(stop_point)
+    return analyses
+
+
+def _location_values(location):
+    """
+    Read Easting, Northing, Latitude and Longitude from a Location, with or without a Translation.
+    """
+    translation = location.find('n:Translation', ns)
+    source = translation if translation is not None else location
+    return (
+        source.findtext('n:Easting', namespaces=ns),
+        source.findtext('n:Northing', namespaces=ns),
+        source.findtext('n:Latitude', namespaces=ns),
+        source.findtext('n:Longitude', namespaces=ns),
+    )
+
+
+def extract_stop_fields(stop_point):
+    """
+    Extract the fields used by the analyses from a StopPoint into a plain dictionary.
+
+    Values are kept as the text found in the XML (None when the element is missing) so
+    that analyses run on the extracted fields behave exactly as they do on the Element.
+    StopAreaRefs is a tuple of StopArea codes. FlexibleZone is None when the stop has no
+    FlexibleZone element, otherwise a tuple of (Easting, Northing, Latitude, Longitude)
+    for each of its Locations.
+
+    Args:
+    stop_point (Element): A StopPoint element.
+
+    Returns:
+    dict: The values of STOP_FIELDS for this stop.
+    """
+    location = stop_point.find('n:Place/n:Location', ns)
+    easting, northing, latitude, longitude = _location_values(location) if location is not None else (None, None, None, None)
+
+    flexible_zone = stop_point.find('n:StopClassification/n:OnStreet/n:Bus/n:FlexibleZone', ns)
+    if flexible_zone is not None:
+        flexible_zone = tuple(_location_values(zone_location) for zone_location in flexible_zone.findall('n:Location', ns))
+
+    fields = {
+        'AtcoCode': stop_point.findtext('n:AtcoCode', namespaces=ns),
+        'NaptanCode': stop_point.findtext('n:NaptanCode', namespaces=ns),
+        'CommonName': stop_point.findtext('n:Descriptor/n:CommonName', namespaces=ns),
+        'ShortCommonName': stop_point.findtext('n:Descriptor/n:ShortCommonName', namespaces=ns),
+        'Landmark': stop_point.findtext('n:Descriptor/n:Landmark', namespaces=ns),
+        'Street': stop_point.findtext('n:Descriptor/n:Street', namespaces=ns),
+        'Indicator': stop_point.findtext('n:Descriptor/n:Indicator', namespaces=ns),
+        'StopType': stop_point.findtext('n:StopClassification/n:StopType', namespaces=ns),
+        'BusStopType': stop_point.findtext('n:StopClassification/n:OnStreet/n:Bus/n:BusStopType', namespaces=ns),
+        'TimingStatus': stop_point.findtext('n:StopClassification/n:OnStreet/n:Bus/n:TimingStatus', namespaces=ns),
+        'Status': stop_point.get('Status'),
+        'CreationDateTime': stop_point.get('CreationDateTime'),
+        'ModificationDateTime': stop_point.get('ModificationDateTime'),
+        'Modification': stop_point.get('Modification'),
+        'RevisionNumber': stop_point.get('RevisionNumber'),
+        'Easting': easting,
+        'Northing': northing,
+        'Latitude': latitude,
+        'Longitude': longitude,
+        'AdministrativeAreaRef': stop_point.findtext('n:AdministrativeAreaRef', namespaces=ns),
+        'NptgLocalityRef': stop_point.findtext('n:Place/n:NptgLocalityRef', namespaces=ns),
+        'StopAreaRefs': tuple(ref.text for ref in stop_point.findall('n:StopAreas/n:StopAreaRef', namespaces=ns)),
+        'FlexibleZone': flexible_zone,
+    }
+
+    for field in CATEGORICAL_FIELDS:
+        if fields[field] is not None:
+            fields[field] = sys.intern(fields[field])
+
+    return fields
+
+
+def iter_stop_fields(file_path):
+    """
+    Stream the extracted fields of every StopPoint in a NaPTAN XML file.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+
+    Yields:
+    dict: The values of STOP_FIELDS for each stop, in document order.
+    """
+    for stop_point in iter_stop_points(file_path):
+        yield extract_stop_fields(stop_point)
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import datetime
+import math
+import re
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from dataset_cache import load_stop_fields
+from stop_table import StopTable, zero_coordinates_mask
+
+# Stops further apart than this, in metres, are never compared
+MAX_DISTANCE = 30.0
+
+# Pairs scoring below this are not reported
+MIN_SCORE = 0.7
+
+# Weights of the name similarity, matching indicator and closeness in a pair's score
+SCORE_WEIGHTS = {'name': 0.5, 'indicator': 0.2, 'distance': 0.3}
+
+# Spellings folded together before names are compared
+ABBREVIATIONS = {
+    'rd': 'road', 'st': 'street', 'ave': 'avenue', 'av': 'avenue', 'ln': 'lane', 'cres': 'crescent',
+    'dr': 'drive', 'gdns': 'gardens', 'sq': 'square', 'pl': 'place', 'ct': 'court', 'terr': 'terrace',
+    'stn': 'station', 'hosp': 'hospital', 'ctr': 'centre', 'center': 'centre', 'nr': 'near', '&': 'and',
+}
+
+# Words left out of the blocking key, so "Bus Station" and "The Station (Bus)" land in the same block
+STOP_WORDS = {'the', 'and', 'of', 'bus', 'stop', 'opp', 'adj', 'os', 'o', 's', 'near', 'nr'}
+
+# Cells compared with each cell: itself and the half of its neighbours that come after it
+NEIGHBOURS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+TOKEN = re.compile(r'[a-z0-9]+|&')
+
+
+def normalize_name(name):
+    """
+    Lower-case a stop name, drop punctuation and expand common abbreviations.
+
+    Args:
+    name (str): CommonName or Indicator as found in the XML.
+
+    Returns:
+    str: The normalized name, or an empty string for a missing one.
+    """
+    if not name:
+        return ''
+    return ' '.join(ABBREVIATIONS.get(token, token) for token in TOKEN.findall(name.lower()))
+
+
+def name_key(normalized_name):
+    """
+    Build the blocking key of a normalized name: its significant words, sorted.
+    """
+    return ' '.join(sorted(set(normalized_name.split()) - STOP_WORDS))
+
+
+def score_pair(name_1, name_2, indicator_1, indicator_2, distance, max_distance=MAX_DISTANCE):
+    """
+    Score how likely two nearby stops are to be the same physical stop, from 0 to 1.
+
+    Args:
+    name_1, name_2 (str): Normalized CommonNames.
+    indicator_1, indicator_2 (str): Normalized Indicators.
+    distance (float): Distance between the stops in metres.
+    max_distance (float): Distance at which the closeness component reaches zero.
+
+    Returns:
+    float: The score.
+    """
+    name_similarity = 1.0 if name_1 == name_2 else SequenceMatcher(None, name_1, name_2).ratio()
+    indicator_match = 1.0 if indicator_1 == indicator_2 else 0.0
+    closeness = max(0.0, 1.0 - distance / max_distance)
+    return (SCORE_WEIGHTS['name'] * name_similarity
+            + SCORE_WEIGHTS['indicator'] * indicator_match
+            + SCORE_WEIGHTS['distance'] * closeness)
+
+
+def find_near_duplicates(columns, max_distance=MAX_DISTANCE, min_score=MIN_SCORE):
+    """
+    Find pairs of stops with different ATCO codes that are probably the same physical stop.
+
+    Stops are grouped into blocks by their name key and a grid cell max_distance wide,
+    so a pair is only compared when the stops share a name key and sit in the same or
+    adjacent cells. Candidate pairs within max_distance are then scored on name
+    similarity, matching Indicator and distance. Stops without a usable position (no
+    Easting/Northing, or any coordinate set to zero) are left out; they would otherwise all
+    meet at the grid origin as exact matches.
+
+    Args:
+    columns (dict): Field names mapped to one value per StopPoint, from load_stop_fields.
+    max_distance (float): Largest distance in metres between the stops of a pair.
+    min_score (float): Smallest score reported.
+
+    Returns:
+    list of tuples: (row 1, row 2, distance, score) for each pair, highest score first.
+    """
+    table = StopTable.from_columns(columns)
+    eastings, northings = table['Easting'], table['Northing']
+    names = [normalize_name(name) for name in columns['CommonName']]
+    indicators = [normalize_name(indicator) for indicator in columns['Indicator']]
+    atco_codes = columns['AtcoCode']
+
+    blocks = defaultdict(list)
+    located = ~(np.isnan(eastings) | np.isnan(northings) | zero_coordinates_mask(table))
+    cells_x = np.floor(np.where(located, eastings, 0) / max_distance).astype(np.int64).tolist()
+    cells_y = np.floor(np.where(located, northings, 0) / max_distance).astype(np.int64).tolist()
+    for row in np.flatnonzero(located).tolist():
+        key = name_key(names[row])
+        if key:
+            blocks[key, cells_x[row], cells_y[row]].append(row)
+
+    eastings, northings = eastings.tolist(), northings.tolist()
+    pairs = []
+    for (key, cell_x, cell_y), rows in blocks.items():
+        for dx, dy in NEIGHBOURS:
+            if (dx, dy) == (0, 0):
+                candidates = ((row_1, row_2) for i, row_1 in enumerate(rows) for row_2 in rows[i + 1:])
+            else:
+                others = blocks.get((key, cell_x + dx, cell_y + dy))
+                if not others:
+                    continue
+                candidates = ((row_1, row_2) for row_1 in rows for row_2 in others)
+
+            for row_1, row_2 in candidates:
+                if atco_codes[row_1] == atco_codes[row_2]:
+                    continue
+                distance = math.hypot(eastings[row_1] - eastings[row_2], northings[row_1] - northings[row_2])
+                if distance > max_distance:
+                    continue
+                score = score_pair(names[row_1], names[row_2], indicators[row_1], indicators[row_2], distance, max_distance)
+                if score >= min_score:
+                    pairs.append((min(row_1, row_2), max(row_1, row_2), distance, score))
+
+    pairs.sort(key=lambda pair: (-pair[3], pair[0], pair[1]))
+    return pairs
+
+
+def export_to_csv(columns, pairs, filename):
+    """
+    Export scored pairs to a CSV file.
+
+    Args:
+    columns (dict): The field columns the pairs were found in.
+    pairs (list of tuples): Result of find_near_duplicates.
+    filename (str): Filename for the CSV file.
+    """
+    fields = ('AtcoCode', 'CommonName', 'Indicator', 'Status')
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['ATCO Code 1', 'ATCO Code 2', 'CommonName 1', 'CommonName 2', 'Indicator 1', 'Indicator 2',
+                         'Status 1', 'Status 2', 'Distance (m)', 'Score'])
+        for row_1, row_2, distance, score in pairs:
+            values = [value for field in fields for value in (columns[field][row_1], columns[field][row_2])]
+            writer.writerow(values + [f'{distance:.1f}', f'{score:.3f}'])
+
+
+def export_results(columns, pairs, timestamp):
+    """
+    Export scored near-duplicate pairs to a timestamped CSV file.
+
+    Args:
+    columns (dict): The field columns the pairs were found in.
+    pairs (list of tuples): Result of find_near_duplicates.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    csv_filename = f'near_duplicates_{timestamp}.csv'
+    export_to_csv(columns, pairs, csv_filename)
+    print(f"Exported near-duplicate pairs to {csv_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find stops with different codes that are probably the same physical stop.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--max-distance', type=float, default=MAX_DISTANCE, help='Metres (default: %(default)s)')
+    parser.add_argument('--min-score', type=float, default=MIN_SCORE, help='Between 0 and 1 (default: %(default)s)')
+    args = parser.parse_args()
+
+    columns = load_stop_fields(args.file_path)
+    start = time.perf_counter()
+    pairs = find_near_duplicates(columns, args.max_distance, args.min_score)
+    print(f"Near-duplicate pairs: {len(pairs)} ({time.perf_counter() - start:.2f}s)")
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(columns, pairs, timestamp)
@@ -1,5 +1,36 @@
 from collections import defaultdict
-import xml.etree.ElementTree as ET
+
+from naptan_stream import scan
+
+
+class MultipleNaptanAnalysis:
+    """
+    Map ATCO codes to their NaPTAN codes one StopPoint at a time and report those with more than one.
+    """
+    name = 'one_atco_many_naptan'
+
+    def __init__(self):
+        # Dictionary to store ATCO codes mapped to NaPTAN codes
+        self.atco_to_naptan = defaultdict(list)
+
+    def process(self, stop_point):
+        # Extract ATCO and NaPTAN codes
+        atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
+        naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
+        if atco_code_elem is not None and atco_code_elem.text and naptan_code_elem is not None and naptan_code_elem.text:
+            self.atco_to_naptan[atco_code_elem.text].append(naptan_code_elem.text)
+
+    def merge(self, other):
+        for atco_code, naptan_codes in other.atco_to_naptan.items():
+            self.atco_to_naptan[atco_code].extend(naptan_codes)
+
+    def result(self):
+        # Filter out ATCO codes with only one corresponding NaPTAN code
+        return {k: v for k, v in self.atco_to_naptan.items() if len(v) > 1}
+
+    def export(self, timestamp):
+        export_results(self.result(), timestamp)
+
 
 def find_atco_with_multiple_naptan(file_path):
     """
@@ -12,35 +43,29 @@ def find_atco_with_multiple_naptan(file_path):
     dict: A dictionary mapping ATCO codes to a list of corresponding NaPTAN codes.
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        stop_points = root.find('{http://www.naptan.org.uk/}StopPoints')
-
-        # Dictionary to store ATCO codes mapped to NaPTAN codes
-        atco_to_naptan = defaultdict(list)
-
-        # Iterate over all StopPoint elements
-        for stop_point in stop_points.findall('{http://www.naptan.org.uk/}StopPoint'):
-            # Extract ATCO and NaPTAN codes
-            atco_code_elem = stop_point.find('{http://www.naptan.org.uk/}AtcoCode')
-            naptan_code_elem = stop_point.find('{http://www.naptan.org.uk/}NaptanCode')
-            if atco_code_elem is not None and atco_code_elem.text and naptan_code_elem is not None and naptan_code_elem.text:
-                atco_to_naptan[atco_code_elem.text].append(naptan_code_elem.text)
-
-        # Filter out ATCO codes with only one corresponding NaPTAN code
-        multiple_naptan_atco = {k: v for k, v in atco_to_naptan.items() if len(v) > 1}
-
-        return multiple_naptan_atco
+        # Stream over all StopPoint elements
+        analysis = MultipleNaptanAnalysis()
+        scan(file_path, [analysis])
+        return analysis.result()
 
     except Exception as e:
         print(f"Error occurred: {e}")
         return None
 
+def export_results(multiple_naptan_atco, timestamp):
+    """
+    Print each ATCO code associated with multiple NaPTAN codes.
+
+    Args:
+    multiple_naptan_atco (dict): ATCO codes mapped to a list of corresponding NaPTAN codes.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    for atco_code, naptan_codes in multiple_naptan_atco.items():
+        print(f"ATCO Code: {atco_code}, NaPTAN Codes: {naptan_codes}")
+
 if __name__ == "__main__":
     # Replace this with the absolute path to your NaPTAN XML file
     file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan\\data\\271023\\NaPTAN.xml'
 
     multiple_naptan_atco = find_atco_with_multiple_naptan(file_path)
-    for atco_code, naptan_codes in multiple_naptan_atco.items():
-        print(f"ATCO Code: {atco_code}, NaPTAN Codes: {naptan_codes}")
+    export_results(multiple_naptan_atco, None)
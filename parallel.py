@@ -0,0 +1,155 @@
+import argparse
+import datetime
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from compressed import compression_of, map_naptan
+from metrics import RunMetrics
+from run_all import ANALYSES, export_analyses, run_analyses
+from stop_index import STOP_POINT_CLOSE, find_stop_point, root_start_tag
+from stop_record import attach_source
+
+# Chunks handed out per worker, so a slow chunk doesn't leave the other cores idle
+CHUNKS_PER_WORKER = 4
+
+
+def split_stop_points(file_path, chunks):
+    """
+    Split the StopPoints of a NaPTAN XML file into byte ranges aligned to StopPoint boundaries.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    chunks (int): Number of ranges to aim for.
+
+    Returns:
+    list of tuples: (start, end) byte ranges, in document order, that together cover every StopPoint.
+    """
+    with map_naptan(file_path) as data:
+        return _split_data(data, chunks)
+
+
+def _split_data(data, chunks):
+    first = find_stop_point(data)
+    if first == -1:
+        return []
+    last = data.rfind(STOP_POINT_CLOSE) + len(STOP_POINT_CLOSE)
+
+    boundaries = [first]
+    for i in range(1, chunks):
+        boundary = find_stop_point(data, max(first + (last - first) * i // chunks, boundaries[-1] + 1))
+        if boundary == -1 or boundary >= last:
+            break
+        boundaries.append(boundary)
+    boundaries.append(last)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _chunk_xml(data, start, end):
+    """
+    Wrap one byte range of StopPoints in the file's own XML declaration and root element.
+    """
+    prefix_end, root_tag = root_start_tag(data)
+    return data[:prefix_end] + data[start:end] + b'</' + root_tag + b'>'
+
+
+def _run_chunk(file_path, start, end, names, with_metrics=False):
+    """
+    Run the analyses over one byte range of an uncompressed file.
+    """
+    with map_naptan(file_path) as data:
+        chunk = _chunk_xml(data, start, end)
+    return _run_chunk_xml(chunk, names, with_metrics)
+
+
+def _run_chunk_xml(chunk, names, with_metrics=False):
+    """
+    Run the analyses over a chunk of XML.
+
+    Returns the analyses, and the chunk's RunMetrics when with_metrics is set.
+    """
+    metrics = RunMetrics() if with_metrics else None
+    analyses = run_analyses(io.BytesIO(chunk), names, metrics)
+    return (analyses, metrics) if with_metrics else analyses
+
+
+def run_analyses_parallel(file_path, names=None, workers=None, metrics=None):
+    """
+    Run several analyses over a NaPTAN XML file split across a pool of processes.
+
+    Each process streams its own range of StopPoints through fresh analyses, and the
+    partial results are then merged in document order, so the output matches a serial
+    run exactly, including codes duplicated across chunks.
+
+    Workers map an uncompressed file themselves. A compressed file is decompressed once,
+    here, and each worker is sent its chunk of the XML.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    names (list): Names of the analyses to run. Defaults to all of them.
+    workers (int): Number of processes. Defaults to the number of CPUs.
+    metrics (RunMetrics): Optional metrics.RunMetrics to merge every chunk's timings and
+        errors into. Phase times are then summed over the workers.
+
+    Returns:
+    list: The analyses that completed successfully in every chunk, merged.
+    """
+    names = list(names or ANALYSES)
+    workers = workers or os.cpu_count()
+    if compression_of(file_path) is None:
+        ranges = split_stop_points(file_path, workers * CHUNKS_PER_WORKER)
+        run_chunk = _run_chunk
+        chunk_args = [[file_path] * len(ranges), [start for start, _ in ranges], [end for _, end in ranges]]
+    else:
+        with map_naptan(file_path) as data:
+            ranges = _split_data(data, workers * CHUNKS_PER_WORKER)
+            run_chunk = _run_chunk_xml
+            chunk_args = [[_chunk_xml(data, start, end) for start, end in ranges]]
+    if not ranges:
+        analyses = [ANALYSES[name]() for name in names]
+        attach_source(analyses, file_path)
+        return analyses
+
+    with ProcessPoolExecutor(workers) as pool:
+        partials = []
+        for partial in pool.map(run_chunk, *chunk_args, [names] * len(ranges), [metrics is not None] * len(ranges)):
+            if metrics is not None:
+                partial, chunk_metrics = partial
+                metrics.merge(chunk_metrics)
+                if metrics.progress_interval:
+                    metrics.report_progress()
+            partials.append(partial)
+
+    merged = []
+    for name in names:
+        chunk_analyses = [analysis for analyses in partials for analysis in analyses if analysis.name == name]
+        # An analysis that failed in any chunk is dropped, as it would be in a serial run
+        if len(chunk_analyses) != len(partials):
+            continue
+        analysis = chunk_analyses[0]
+        for other in chunk_analyses[1:]:
+            analysis.merge(other)
+        merged.append(analysis)
+    attach_source(merged, file_path)
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the NaPTAN analyses in parallel across all cores.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--only', nargs='+', choices=sorted(ANALYSES), help='Analyses to run (default: all)')
+    parser.add_argument('--workers', type=int, help='Number of processes (default: number of CPUs)')
+    parser.add_argument('--metrics', action='store_true', help='Export timings, throughput and memory to run_metrics_[timestamp].json')
+    parser.add_argument('--progress', type=float, metavar='SECONDS', help='Print progress at most every SECONDS as chunks finish')
+    args = parser.parse_args()
+
+    metrics = RunMetrics(args.file_path, args.progress) if args.metrics or args.progress else None
+    analyses = run_analyses_parallel(args.file_path, args.only, args.workers, metrics)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_analyses(analyses, timestamp, metrics)
+    if args.metrics:
+        metrics.export(timestamp)
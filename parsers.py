@@ -0,0 +1,528 @@
+import argparse
+import sys
+import time
+from xml.parsers import expat
+
+from compressed import open_naptan
+from naptan_stream import CATEGORICAL_FIELDS, NAPTAN_NS, STOP_FIELDS, extract_stop_fields, iter_stop_points
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Bytes fed to the expat parser at a time
+READ_SIZE = 64 * 1024
+
+# Backends in order of preference when none is asked for, fastest first. lxml is no
+# faster than expat on NaPTAN files, so the backend without a dependency comes first
+PREFERENCE = ('expat', 'lxml', 'elementtree')
+
+COORDINATE_FIELDS = ('Easting', 'Northing', 'Latitude', 'Longitude')
+
+# StopPoint attributes copied into each record
+ATTRIBUTE_FIELDS = ('Status', 'CreationDateTime', 'ModificationDateTime', 'Modification', 'RevisionNumber')
+
+# Text fields, each read from the first element at its path below StopPoint
+TEXT_PATHS = {
+    'AtcoCode': ('AtcoCode',),
+    'NaptanCode': ('NaptanCode',),
+    'CommonName': ('Descriptor', 'CommonName'),
+    'ShortCommonName': ('Descriptor', 'ShortCommonName'),
+    'Landmark': ('Descriptor', 'Landmark'),
+    'Street': ('Descriptor', 'Street'),
+    'Indicator': ('Descriptor', 'Indicator'),
+    'StopType': ('StopClassification', 'StopType'),
+    'BusStopType': ('StopClassification', 'OnStreet', 'Bus', 'BusStopType'),
+    'TimingStatus': ('StopClassification', 'OnStreet', 'Bus', 'TimingStatus'),
+    'AdministrativeAreaRef': ('AdministrativeAreaRef',),
+    'NptgLocalityRef': ('Place', 'NptgLocalityRef'),
+}
+PLACE_LOCATION_PATH = ('Place', 'Location')
+FLEXIBLE_ZONE_PATH = ('StopClassification', 'OnStreet', 'Bus', 'FlexibleZone')
+STOP_AREA_REF_PATH = ('StopAreas', 'StopAreaRef')
+
+# What an element inside a StopPoint holds, for the expat backend
+CONTAINER, TEXT, STOP_AREA_REF, PLACE_LOCATION, FLEXIBLE_ZONE, LOCATION, TRANSLATION, COORDINATE = range(8)
+
+
+def _element_tree(fields=STOP_FIELDS):
+    """
+    Build the tree of elements below StopPoint that hold one of the given fields, as nested
+    dicts of local name to child tree, with (kind, field) at the leaves.
+    """
+    tree = {}
+    paths = [(path, (TEXT, field)) for field, path in TEXT_PATHS.items() if field in fields]
+    if any(field in fields for field in COORDINATE_FIELDS):
+        paths.append((PLACE_LOCATION_PATH, (PLACE_LOCATION, None)))
+    if 'FlexibleZone' in fields:
+        paths.append((FLEXIBLE_ZONE_PATH, (FLEXIBLE_ZONE, None)))
+    if 'StopAreaRefs' in fields:
+        paths.append((STOP_AREA_REF_PATH, (STOP_AREA_REF, None)))
+    for path, leaf in paths:
+        node = tree
+        for tag in path[:-1]:
+            node = node.setdefault(tag, {})
+        node[path[-1]] = leaf
+    return tree
+
+
+def _intern_categories(record):
+    for field in CATEGORICAL_FIELDS:
+        if record.get(field) is not None:
+            record[field] = sys.intern(record[field])
+    return record
+
+
+def _projection(fields, where):
+    """
+    Return the fields to output and the fields that must be read to output and filter them, in STOP_FIELDS order.
+    """
+    fields = tuple(fields) if fields is not None else STOP_FIELDS
+    unknown = [field for field in fields if field not in STOP_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    needed = set(fields) | set(where.fields if where is not None else ())
+    return fields, tuple(field for field in STOP_FIELDS if field in needed)
+
+
+def _filter_and_project(records, fields, where):
+    """
+    Filter and project full records, for backends that can't push either into the parser.
+    """
+    for record in records:
+        if where is None or where(record):
+            yield record if fields == STOP_FIELDS else {field: record[field] for field in fields}
+
+
+class ElementTreeBackend:
+    """
+    Extract records by building each StopPoint as an ElementTree Element.
+
+    Always available, and the reference the other backends must match. Every field is
+    extracted; projection and filtering are applied to the finished records.
+    """
+    name = 'elementtree'
+
+    @staticmethod
+    def available():
+        return True
+
+    def iter_stop_fields(self, file_path, fields=None, where=None):
+        fields, _ = _projection(fields, where)
+        records = (extract_stop_fields(stop_point) for stop_point in iter_stop_points(file_path))
+        yield from _filter_and_project(records, fields, where)
+
+
+class ExpatBackend:
+    """
+    Extract records straight from expat parser events, without creating any Elements.
+
+    Each element inside a StopPoint is matched against the paths of the fields asked
+    for, and text is only collected for elements that hold one of them; everything else,
+    such as FlexibleZone or StopAreas when they aren't wanted, is passed over. As in
+    ElementTree, an element's text is the character data before its first child, each
+    field comes from the first element on its path, and a Location's coordinates come
+    from its first Translation when it has one.
+
+    A filter is evaluated as soon as the attributes and text fields it reads are known,
+    and the rest of a StopPoint that fails it is skipped.
+    """
+    name = 'expat'
+
+    @staticmethod
+    def available():
+        return True
+
+    def iter_stop_fields(self, file_path, fields=None, where=None):
+        records = []
+        parser = _expat_parser(records, fields, where)
+        source = file_path if hasattr(file_path, 'read') else open_naptan(file_path)
+        try:
+            while True:
+                data = source.read(READ_SIZE)
+                parser.Parse(data, not data)
+                yield from records
+                records.clear()
+                if not data:
+                    return
+        finally:
+            if source is not file_path:
+                source.close()
+
+
+def _expat_parser(records, fields=None, where=None):
+    """
+    Create an expat parser that appends a record to records as each StopPoint ends.
+
+    Args:
+    records (list): List the records are appended to.
+    fields (list): Fields each record holds. Defaults to STOP_FIELDS.
+    where (callable): Optional filter called with each record, with a fields attribute
+        naming the fields it reads.
+    """
+    fields, needed = _projection(fields, where)
+    project = fields != needed
+    element_tree = _element_tree(needed)
+    attribute_fields = [field for field in ATTRIBUTE_FIELDS if field in needed]
+    needs_location = any(field in needed for field in COORDINATE_FIELDS)
+    needs_refs = 'StopAreaRefs' in needed
+    needs_zone = 'FlexibleZone' in needed
+
+    # The filter can run before the StopPoint ends if it only reads attributes and text
+    # fields, once the text fields it reads have been found
+    where_text_fields = frozenset(field for field in (where.fields if where is not None else ()) if field in TEXT_PATHS)
+    early_where = where is not None and all(field in ATTRIBUTE_FIELDS or field in TEXT_PATHS for field in where.fields)
+
+    prefix = NAPTAN_NS + '}'
+    prefix_length = len(prefix)
+    stop_point_name = prefix + 'StopPoint'
+
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.buffer_text = True
+
+    if not element_tree:
+        # Only StopPoint attributes are needed, so each record is complete at its start tag
+        def start_tag(name, attributes):
+            if name == stop_point_name:
+                record = _intern_categories({field: attributes.get(field) for field in needed})
+                if where is None or where(record):
+                    records.append({field: record[field] for field in fields} if project else record)
+
+        parser.StartElementHandler = start_tag
+        return parser
+
+    # One frame per open element of the current StopPoint: [kind, payload, text parts, collecting].
+    # Text parts is None for elements whose text isn't wanted; collecting stops at the first child.
+    stack = []
+    # The record being filled and the text fields already claimed by an element. Pending
+    # counts the filter's text fields not yet found; checked is set once the filter has passed.
+    current = {'record': None, 'claimed': None, 'location': None, 'zone': None, 'pending': 0, 'checked': False}
+    # Depth inside a subtree being skipped
+    skipped = [0]
+
+    def location_values(location):
+        values = location['translation'] if location['translation'] is not None else location['direct']
+        return tuple(values.get(field) for field in COORDINATE_FIELDS)
+
+    def skip(depth):
+        """
+        Pass over the elements of a subtree with handlers that only track its depth.
+        """
+        skipped[0] = depth
+        parser.StartElementHandler = skip_start
+        parser.EndElementHandler = skip_end
+
+    def skip_start(name, attributes):
+        skipped[0] += 1
+
+    def skip_end(name):
+        skipped[0] -= 1
+        if not skipped[0]:
+            parser.StartElementHandler = start
+            parser.EndElementHandler = end
+
+    def check():
+        """
+        Run the filter, skipping the rest of the StopPoint if it fails.
+        """
+        if where(current['record']):
+            current['checked'] = True
+            return
+        depth = len(stack)
+        stack.clear()
+        current['record'] = None
+        skip(depth)
+
+    def start(name, attributes):
+        if not stack:
+            if name == stop_point_name:
+                record = dict.fromkeys(needed)
+                for field in attribute_fields:
+                    record[field] = attributes.get(field)
+                if needs_refs:
+                    record['StopAreaRefs'] = []
+                current.update(record=record, claimed=set(), location=None, zone=None,
+                               pending=len(where_text_fields), checked=False)
+                stack.append([CONTAINER, element_tree, None, False])
+                if early_where and not where_text_fields:
+                    check()
+            return
+
+        parent = stack[-1]
+        parent[3] = False
+        if not name.startswith(prefix):
+            skip(1)
+            return
+        kind = parent[0]
+        tag = name[prefix_length:]
+
+        if kind == CONTAINER:
+            child = parent[1].get(tag)
+            if child is None:
+                skip(1)
+            elif isinstance(child, dict):
+                stack.append([CONTAINER, child, None, False])
+            elif child[0] == TEXT:
+                if child[1] in current['claimed']:
+                    skip(1)
+                else:
+                    current['claimed'].add(child[1])
+                    stack.append([TEXT, child[1], [], True])
+            elif child[0] == STOP_AREA_REF:
+                stack.append([STOP_AREA_REF, None, [], True])
+            elif child[0] == PLACE_LOCATION:
+                if current['location'] is None:
+                    current['location'] = {'direct': {}, 'translation': None}
+                    stack.append([LOCATION, current['location'], None, False])
+                else:
+                    skip(1)
+            elif current['zone'] is None:
+                current['zone'] = []
+                stack.append([FLEXIBLE_ZONE, current['zone'], None, False])
+            else:
+                skip(1)
+        elif kind == FLEXIBLE_ZONE:
+            if tag == 'Location':
+                location = {'direct': {}, 'translation': None}
+                parent[1].append(location)
+                stack.append([LOCATION, location, None, False])
+            else:
+                skip(1)
+        elif kind == LOCATION:
+            location = parent[1]
+            if tag == 'Translation' and location['translation'] is None:
+                location['translation'] = {}
+                stack.append([TRANSLATION, location['translation'], None, False])
+            elif tag in COORDINATE_FIELDS and tag not in location['direct']:
+                location['direct'][tag] = ''
+                stack.append([COORDINATE, (location['direct'], tag), [], True])
+            else:
+                skip(1)
+        elif kind == TRANSLATION and tag in COORDINATE_FIELDS and tag not in parent[1]:
+            parent[1][tag] = ''
+            stack.append([COORDINATE, (parent[1], tag), [], True])
+        else:
+            skip(1)
+
+    def end(name):
+        if not stack:
+            return
+        kind, payload, parts, _ = stack.pop()
+        if kind == TEXT:
+            current['record'][payload] = ''.join(parts) if parts else ''
+            if payload in where_text_fields:
+                current['pending'] -= 1
+                if early_where and not current['pending']:
+                    check()
+                    if current['record'] is None:
+                        return
+        elif kind == COORDINATE:
+            values, tag = payload
+            values[tag] = ''.join(parts) if parts else ''
+        elif kind == STOP_AREA_REF:
+            current['record']['StopAreaRefs'].append(''.join(parts) if parts else None)
+
+        if not stack:
+            record = current['record']
+            current['record'] = None
+            if needs_refs:
+                record['StopAreaRefs'] = tuple(record['StopAreaRefs'])
+            if needs_location and current['location'] is not None:
+                for field, value in zip(COORDINATE_FIELDS, location_values(current['location'])):
+                    if field in record:
+                        record[field] = value
+            if needs_zone and current['zone'] is not None:
+                record['FlexibleZone'] = tuple(location_values(location) for location in current['zone'])
+            _intern_categories(record)
+            if where is not None and not current['checked'] and not where(record):
+                return
+            records.append({field: record[field] for field in fields} if project else record)
+
+    def character_data(data):
+        if stack:
+            frame = stack[-1]
+            if frame[3]:
+                frame[2].append(data)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = character_data
+    return parser
+
+
+class LxmlBackend:
+    """
+    Extract records with lxml's iterparse, reading fields through pre-compiled XPath expressions.
+
+    Comments and processing instructions are dropped while parsing, as ElementTree drops
+    them, so element text matches the other backends. Only the XPath expressions of the
+    fields asked for are evaluated. Requires lxml.
+    """
+    name = 'lxml'
+
+    def __init__(self):
+        if etree is None:
+            raise ImportError('The lxml backend requires lxml')
+        namespaces = {'n': NAPTAN_NS}
+
+        def xpath(path):
+            return etree.XPath('/'.join(f'n:{tag}' for tag in path), namespaces=namespaces)
+
+        self._text_paths = [(field, xpath(path)) for field, path in TEXT_PATHS.items()]
+        self._place_location = xpath(PLACE_LOCATION_PATH)
+        self._flexible_zone = xpath(FLEXIBLE_ZONE_PATH)
+        self._stop_area_refs = xpath(STOP_AREA_REF_PATH)
+        self._zone_locations = xpath(('Location',))
+        self._translation = xpath(('Translation',))
+        self._coordinates = [xpath((field,)) for field in COORDINATE_FIELDS]
+
+    @staticmethod
+    def available():
+        return etree is not None
+
+    def _location_values(self, location):
+        translation = self._translation(location)
+        source = translation[0] if translation else location
+        values = []
+        for coordinate in self._coordinates:
+            found = coordinate(source)
+            values.append((found[0].text or '') if found else None)
+        return tuple(values)
+
+    def extract(self, stop_point, fields=STOP_FIELDS):
+        """
+        Extract the given fields of a StopPoint element, matching naptan_stream.extract_stop_fields.
+        """
+        record = dict.fromkeys(fields)
+        for field, path in self._text_paths:
+            if field in record:
+                found = path(stop_point)
+                if found:
+                    record[field] = found[0].text or ''
+        for field in ATTRIBUTE_FIELDS:
+            if field in record:
+                record[field] = stop_point.get(field)
+
+        if any(field in record for field in COORDINATE_FIELDS):
+            location = self._place_location(stop_point)
+            if location:
+                for field, value in zip(COORDINATE_FIELDS, self._location_values(location[0])):
+                    if field in record:
+                        record[field] = value
+        if 'FlexibleZone' in record:
+            flexible_zone = self._flexible_zone(stop_point)
+            if flexible_zone:
+                record['FlexibleZone'] = tuple(self._location_values(zone_location)
+                                               for zone_location in self._zone_locations(flexible_zone[0]))
+        if 'StopAreaRefs' in record:
+            record['StopAreaRefs'] = tuple(ref.text for ref in self._stop_area_refs(stop_point))
+        return _intern_categories(record)
+
+    def iter_stop_fields(self, file_path, fields=None, where=None):
+        fields, needed = _projection(fields, where)
+        records = self._iter_records(file_path, needed)
+        yield from _filter_and_project(records, fields, where) if (where is not None or fields != needed) else records
+
+    def _iter_records(self, file_path, fields):
+        source = file_path if hasattr(file_path, 'read') else open_naptan(file_path)
+        stop_point_tag = f'{{{NAPTAN_NS}}}StopPoint'
+        try:
+            # StopAreas are only matched so they can be released as they complete
+            for _, elem in etree.iterparse(source, events=('end',), tag=(stop_point_tag, f'{{{NAPTAN_NS}}}StopArea'),
+                                           remove_comments=True, remove_pis=True):
+                if elem.tag == stop_point_tag:
+                    yield self.extract(elem, fields)
+                elem.clear(keep_tail=True)
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        finally:
+            if source is not file_path:
+                source.close()
+
+
+BACKENDS = {backend.name: backend for backend in (LxmlBackend, ExpatBackend, ElementTreeBackend)}
+
+
+def available_backends():
+    """
+    Return the names of the backends that can run here, fastest first.
+    """
+    return [name for name in PREFERENCE if BACKENDS[name].available()]
+
+
+def get_backend(name=None):
+    """
+    Return a parser backend.
+
+    Args:
+    name (str): 'lxml', 'expat' or 'elementtree'. Defaults to the fastest available.
+
+    Returns:
+    object: A backend with an iter_stop_fields(file_path, fields, where) method.
+    """
+    if name is None:
+        name = available_backends()[0]
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown parser backend {name}; expected one of {", ".join(PREFERENCE)}')
+    if not BACKENDS[name].available():
+        raise ValueError(f'Parser backend {name} is not available')
+    return BACKENDS[name]()
+
+
+def iter_stop_fields(file_path, backend=None, fields=None, where=None):
+    """
+    Stream the extracted fields of every StopPoint in a NaPTAN XML file.
+
+    Every backend yields exactly the records naptan_stream.extract_stop_fields builds,
+    restricted to the fields asked for.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file (plain or compressed), or a binary file object.
+    backend (str): Name of the backend to use. Defaults to the fastest available.
+    fields (list): Fields each record holds. Defaults to STOP_FIELDS.
+    where (callable): Optional filter called with each record, with a fields attribute
+        naming the fields it reads (see query.Where). Only matching records are yielded.
+
+    Yields:
+    dict: The values of the fields for each stop, in document order.
+    """
+    yield from get_backend(backend).iter_stop_fields(file_path, fields, where)
+
+
+def compare_backends(file_path, names=None):
+    """
+    Time each backend over a file and check that they all produce the same records.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    names (list): Backends to compare. Defaults to every available one.
+
+    Returns:
+    dict: Backend name mapped to (seconds, number of records, index of the first record
+        that differs from the ElementTree backend's, or None).
+    """
+    reference = list(ElementTreeBackend().iter_stop_fields(file_path))
+    results = {}
+    for name in names or available_backends():
+        start = time.perf_counter()
+        records = list(get_backend(name).iter_stop_fields(file_path))
+        seconds = time.perf_counter() - start
+        mismatch = next((i for i, (record, expected) in enumerate(zip(records, reference)) if record != expected),
+                        None if len(records) == len(reference) else min(len(records), len(reference)))
+        results[name] = (seconds, len(records), mismatch)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the StopPoint parser backends and check they agree.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--backends', nargs='+', choices=PREFERENCE, help='Backends to compare (default: all available)')
+    args = parser.parse_args()
+
+    print(f"Available backends, fastest first: {', '.join(available_backends())}")
+    for name, (seconds, count, mismatch) in compare_backends(args.file_path, args.backends).items():
+        status = 'identical records' if mismatch is None else f'records differ from elementtree at stop {mismatch}'
+        print(f"{name}: {count} stops in {seconds:.2f}s ({count / seconds:.0f} stops/s), {status}")
@@ -0,0 +1,146 @@
+import argparse
+import ast
+import csv
+import datetime
+import time
+
+from naptan_stream import STOP_FIELDS
+from parsers import PREFERENCE, iter_stop_fields
+
+# Expression nodes a where clause may use: comparisons of fields with constants, combined with and/or/not
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.Compare,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List, ast.Set,
+)
+
+
+class Where:
+    """
+    A filter on StopPoint records, written as a Python expression over field names.
+
+    For example "StopType == 'BCT' and BusStopType == 'FLX'" or
+    "Status != 'active' and AdministrativeAreaRef in ('110', '111')". Only comparisons
+    of fields with constants, combined with and, or and not, are accepted, so the
+    expression can name every field it reads up front.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f'Invalid where clause {expression!r}: {e.msg}') from None
+
+        fields = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(f'Unsupported {type(node).__name__} in where clause {expression!r}')
+            if isinstance(node, ast.Name):
+                if node.id not in STOP_FIELDS:
+                    raise ValueError(f'Unknown field {node.id} in where clause {expression!r}')
+                fields.add(node.id)
+
+        self.fields = tuple(field for field in STOP_FIELDS if field in fields)
+        self._code = compile(tree, '<where>', 'eval')
+
+    def __call__(self, record):
+        return bool(eval(self._code, {'__builtins__': {}}, record))
+
+    def __repr__(self):
+        return f'Where({self.expression!r})'
+
+
+class Query:
+    """
+    A declarative query over the StopPoints of a NaPTAN file: the fields wanted and an
+    optional filter.
+
+    Both are pushed down into the parser, which only reads the elements holding the fields
+    the query projects or filters on and skips the rest of a StopPoint once it fails the
+    filter, so narrow queries run much faster than a full extraction.
+    """
+
+    def __init__(self, fields=None, where=None):
+        """
+        Args:
+        fields (list): Fields each result holds. Defaults to STOP_FIELDS.
+        where (str or Where): Optional filter expression.
+        """
+        self.fields = tuple(fields) if fields else STOP_FIELDS
+        unknown = [field for field in self.fields if field not in STOP_FIELDS]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+        self.where = Where(where) if isinstance(where, str) else where
+
+    def run(self, file_path, backend=None):
+        """
+        Stream the matching records of a NaPTAN XML file.
+
+        Args:
+        file_path (str): Path to the NaPTAN XML file, plain or compressed.
+        backend (str): Parser backend (see parsers.py). Defaults to the fastest available.
+
+        Yields:
+        dict: The query's fields for each matching StopPoint, in document order.
+        """
+        return iter_stop_fields(file_path, backend, self.fields, self.where)
+
+    def count(self, file_path, backend=None):
+        """
+        Count the matching StopPoints of a NaPTAN XML file.
+        """
+        return sum(1 for _ in self.run(file_path, backend))
+
+
+def export_to_csv(records, fields, filename):
+    """
+    Export query results to a CSV file.
+
+    Args:
+    records (iterable): Records from Query.run.
+    fields (list): The query's fields, one column each.
+    filename (str): Filename for the CSV file.
+
+    Returns:
+    int: Number of records written.
+    """
+    count = 0
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        for record in records:
+            writer.writerow(_csv_value(record[field]) for field in fields)
+            count += 1
+    return count
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, tuple):
+        # StopAreaRefs are plain codes; FlexibleZone locations are tuples of coordinates
+        return ';'.join(','.join(part or '' for part in item) if isinstance(item, tuple) else item or '' for item in value)
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the StopPoints of NaPTAN.xml, reading only the fields needed.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--fields', nargs='+', choices=STOP_FIELDS, help='Fields to output (default: all)')
+    parser.add_argument('--where', help="Filter, e.g. \"StopType == 'BCT' and BusStopType == 'FLX'\"")
+    parser.add_argument('--count', action='store_true', help='Only count the matching stops')
+    parser.add_argument('--backend', choices=PREFERENCE, help='Parser backend (default: fastest available)')
+    args = parser.parse_args()
+
+    query = Query(args.fields, args.where)
+    start = time.perf_counter()
+    if args.count:
+        print(f"Matching stops: {query.count(args.file_path, args.backend)} ({time.perf_counter() - start:.2f}s)")
+    else:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        csv_filename = f'query_results_{timestamp}.csv'
+        count = export_to_csv(query.run(args.file_path, args.backend), query.fields, csv_filename)
+        print(f"Exported {count} stops to {csv_filename} ({time.perf_counter() - start:.2f}s)")
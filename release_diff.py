@@ -0,0 +1,254 @@
+import xml.etree.ElementTree as ET
+import argparse
+import csv
+import datetime
+import contextlib
+import hashlib
+import math
+import re
+from collections import Counter
+
+from compressed import map_naptan
+from deleted_common_name import DELETE_PATTERN
+from naptan_stream import STOP_FIELDS, extract_stop_fields
+from stop_index import parse_stop_point, root_start_tag, scan_stop_points
+
+# Bookkeeping fields that change on every revision and are not reported as field changes
+METADATA_FIELDS = ('CreationDateTime', 'ModificationDateTime', 'Modification', 'RevisionNumber')
+
+# Columns of the change report
+REPORT_COLUMNS = ['ATCO Code', 'Change', 'Field', 'Old Value', 'New Value', 'Distance (m)']
+
+MODIFICATION_DATE_TIME = re.compile(rb'\sModificationDateTime="([^"]*)"')
+REVISION_NUMBER = re.compile(rb'\sRevisionNumber="([^"]*)"')
+
+
+def _revision(start_tag):
+    """
+    Read (ModificationDateTime, RevisionNumber) from a StopPoint start tag.
+    """
+    modified = MODIFICATION_DATE_TIME.search(start_tag)
+    revision = REVISION_NUMBER.search(start_tag)
+    return (modified.group(1) if modified else None, revision.group(1) if revision else None)
+
+
+def _fingerprint(stop_point_bytes):
+    return hashlib.blake2b(stop_point_bytes, digest_size=16).digest()
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, tuple):
+        # StopAreaRefs are plain codes; FlexibleZone locations are tuples of coordinates
+        return ';'.join(','.join(part or '' for part in item) if isinstance(item, tuple) else item for item in value)
+    return value
+
+
+class Release:
+    """
+    A memory mapped NaPTAN release whose StopPoints can be parsed individually by byte range.
+
+    A compressed release is decompressed into memory instead.
+    """
+
+    def __init__(self, file_path):
+        self._stack = contextlib.ExitStack()
+        self.data = self._stack.enter_context(map_naptan(file_path))
+        prefix_end, self.root_tag = root_start_tag(self.data)
+        self.prefix = self.data[:prefix_end]
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stop_points(self):
+        """
+        Yield (AtcoCode, start, end, revision) for every StopPoint, scanning the raw bytes only.
+        """
+        for start, end, codes in scan_stop_points(self.data):
+            atco_code = codes[0]
+            if atco_code:
+                start_tag = self.data[start:self.data.find(b'>', start) + 1]
+                yield atco_code, start, end, _revision(start_tag)
+
+    def fields(self, start, end):
+        """
+        Parse the StopPoint at a byte range and return its extracted fields.
+        """
+        return extract_stop_fields(parse_stop_point(self.prefix, self.data[start:end], self.root_tag))
+
+
+def _distance(old_fields, new_fields):
+    try:
+        return math.hypot(float(new_fields['Easting']) - float(old_fields['Easting']),
+                          float(new_fields['Northing']) - float(old_fields['Northing']))
+    except (TypeError, ValueError):
+        return None
+
+
+def _compare(atco_code, old_fields, new_fields):
+    """
+    Return the change rows for a stop present in both releases.
+    """
+    changes = []
+    for field in STOP_FIELDS:
+        if field in METADATA_FIELDS or old_fields[field] == new_fields[field]:
+            continue
+        changes.append((atco_code, 'modified', field, _format_value(old_fields[field]), _format_value(new_fields[field]), ''))
+
+    if not changes:
+        return changes
+
+    old_status, new_status = old_fields['Status'], new_fields['Status']
+    if (new_status or '').lower() == 'inactive' and (old_status or '').lower() != 'inactive':
+        changes.append((atco_code, 'inactive', 'Status', old_status or '', new_status, ''))
+
+    if old_fields['Easting'] != new_fields['Easting'] or old_fields['Northing'] != new_fields['Northing']:
+        distance = _distance(old_fields, new_fields)
+        changes.append((atco_code, 'moved', 'Easting/Northing',
+                        f"{old_fields['Easting']} {old_fields['Northing']}",
+                        f"{new_fields['Easting']} {new_fields['Northing']}",
+                        '' if distance is None else f'{distance:.1f}'))
+
+    old_name, new_name = old_fields['CommonName'] or '', new_fields['CommonName'] or ''
+    if DELETE_PATTERN.search(new_name) and not DELETE_PATTERN.search(old_name):
+        changes.append((atco_code, 'delete_name', 'CommonName', old_name, new_name, ''))
+
+    return changes
+
+
+def diff_releases(old_file_path, new_file_path, fast_path=True):
+    """
+    Find the stops added, removed and modified between two NaPTAN releases.
+
+    Neither release is parsed as a whole. The old release is scanned once for the byte
+    range and revision of each StopPoint, keyed by AtcoCode. The new release is then
+    scanned and joined on AtcoCode: stops whose ModificationDateTime and RevisionNumber
+    are unchanged are skipped outright (unless fast_path is False), stops whose raw bytes
+    hash to the same fingerprint are skipped next, and only the remainder are parsed and
+    compared field by field.
+
+    Where an AtcoCode appears more than once in a release, its first occurrence is used.
+
+    Args:
+    old_file_path (str): Path to the earlier NaPTAN XML file.
+    new_file_path (str): Path to the later NaPTAN XML file.
+    fast_path (bool): Trust unchanged ModificationDateTime/RevisionNumber to mean an unchanged stop.
+
+    Returns:
+    list of tuples: Change rows matching REPORT_COLUMNS, in new release order, with removed stops last.
+    """
+    changes = []
+
+    with Release(old_file_path) as old_release, Release(new_file_path) as new_release:
+        old_stops = {}
+        for atco_code, start, end, revision in old_release.stop_points():
+            old_stops.setdefault(atco_code, (start, end, revision))
+
+        seen = set()
+        for atco_code, start, end, revision in new_release.stop_points():
+            if atco_code in seen:
+                continue
+            seen.add(atco_code)
+            old_stop = old_stops.get(atco_code)
+            if old_stop is None:
+                new_fields = new_release.fields(start, end)
+                changes.append((atco_code, 'added', '', '', _format_value(new_fields['CommonName']), ''))
+                if DELETE_PATTERN.search(new_fields['CommonName'] or ''):
+                    changes.append((atco_code, 'delete_name', 'CommonName', '', new_fields['CommonName'], ''))
+                continue
+
+            old_start, old_end, old_revision = old_stop
+            if fast_path and revision == old_revision and None not in revision:
+                continue
+            if _fingerprint(new_release.data[start:end]) == _fingerprint(old_release.data[old_start:old_end]):
+                continue
+
+            changes.extend(_compare(atco_code, old_release.fields(old_start, old_end), new_release.fields(start, end)))
+
+        for atco_code, (start, end, revision) in old_stops.items():
+            if atco_code not in seen:
+                old_fields = old_release.fields(start, end)
+                changes.append((atco_code, 'removed', '', _format_value(old_fields['CommonName']), '', ''))
+
+    return changes
+
+
+def export_to_csv(changes, filename):
+    """
+    Export change rows to a CSV file.
+
+    Args:
+    changes (list of tuples): Change rows matching REPORT_COLUMNS.
+    filename (str): Filename for the CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(REPORT_COLUMNS)
+        for row in changes:
+            writer.writerow(row)
+
+
+def export_to_xml(changes, filename):
+    """
+    Export change rows to an XML file, one Change element per row.
+
+    Args:
+    changes (list of tuples): Change rows matching REPORT_COLUMNS.
+    filename (str): Filename for the XML file.
+    """
+    root = ET.Element('Changes')
+    for atco_code, change, field, old_value, new_value, distance in changes:
+        change_element = ET.SubElement(root, 'Change', {'type': change, 'AtcoCode': atco_code})
+        if field:
+            change_element.set('field', field)
+        if distance:
+            change_element.set('distance', distance)
+        ET.SubElement(change_element, 'Old').text = old_value
+        ET.SubElement(change_element, 'New').text = new_value
+
+    tree = ET.ElementTree(root)
+    tree.write(filename, encoding='utf-8', xml_declaration=True)
+
+
+def export_results(changes, timestamp):
+    """
+    Print a summary of the changes and export them to timestamped CSV and XML files.
+
+    Args:
+    changes (list of tuples): Change rows matching REPORT_COLUMNS.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    counts = Counter(change for _, change, _, _, _, _ in changes)
+    counts['modified'] = len({atco_code for atco_code, change, _, _, _, _ in changes if change == 'modified'})
+    for change in ('added', 'removed', 'modified', 'inactive', 'moved', 'delete_name'):
+        print(f"Stops {change}: {counts[change]}")
+
+    csv_filename = f'naptan_changes_{timestamp}.csv'
+    export_to_csv(changes, csv_filename)
+    print(f"Exported changes to {csv_filename}")
+
+    xml_filename = f'naptan_changes_{timestamp}.xml'
+    export_to_xml(changes, xml_filename)
+    print(f"Exported changes to {xml_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report the changes between two NaPTAN releases.')
+    # Replace these with the absolute paths to your NaPTAN XML releases
+    parser.add_argument('old_file_path', nargs='?', default='C:\\Users\\benja\\PycharmProjects\\naptan\\data\\271023\\NaPTAN.xml')
+    parser.add_argument('new_file_path', nargs='?', default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--no-fast-path', action='store_true',
+                        help='Compare every stop, even when ModificationDateTime and RevisionNumber are unchanged')
+    args = parser.parse_args()
+
+    changes = diff_releases(args.old_file_path, args.new_file_path, fast_path=not args.no_fast_path)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(changes, timestamp)
@@ -0,0 +1,115 @@
+import argparse
+import datetime
+
+from metrics import RunMetrics
+from naptan_stream import iter_stop_points
+from stop_record import attach_source
+from count import TotalStopsAnalysis
+from count_FLX import BusStopTypesAnalysis
+from deleted_common_name import DeletedCommonNameAnalysis
+from duplicates import DuplicatesAnalysis
+from flexiblezone_stoptype import FlexibleZoneStopTypeAnalysis
+from FLX_LL_vs_NE import FlexibleZonePositionsAnalysis
+from FLX_zone_count import FlexibleZoneCountAnalysis
+from inactive import InactiveStopsAnalysis
+from main import UniqueCodesAnalysis
+from missing_naptan_code import MissingNaptanCodeAnalysis
+from one_atco_many_naptan import MultipleNaptanAnalysis
+from zero_coords import ZeroCoordsAnalysis
+
+# Every analysis that can run over a single shared scan, keyed by script name
+ANALYSES = {
+    analysis.name: analysis
+    for analysis in [
+        TotalStopsAnalysis,
+        UniqueCodesAnalysis,
+        DuplicatesAnalysis,
+        MissingNaptanCodeAnalysis,
+        DeletedCommonNameAnalysis,
+        FlexibleZoneStopTypeAnalysis,
+        FlexibleZoneCountAnalysis,
+        FlexibleZonePositionsAnalysis,
+        InactiveStopsAnalysis,
+        ZeroCoordsAnalysis,
+        BusStopTypesAnalysis,
+        MultipleNaptanAnalysis,
+    ]
+}
+
+
+def run_analyses(file_path, names=None, metrics=None):
+    """
+    Run several analyses over a single streaming pass of the NaPTAN XML file.
+
+    Each StopPoint is dispatched to every registered analysis in turn. An analysis that
+    raises is reported and dropped without affecting the others.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    names (list): Names of the analyses to run. Defaults to all of them.
+    metrics (RunMetrics): Optional metrics.RunMetrics to record timings and errors in.
+
+    Returns:
+    list: The analyses that completed successfully.
+    """
+    analyses = [ANALYSES[name]() for name in (names or ANALYSES)]
+    stop_points = iter_stop_points(file_path) if metrics is None else metrics.iter_stop_points(file_path)
+    process = (lambda analysis, stop_point: analysis.process(stop_point)) if metrics is None else metrics.process
+
+    for stop_point in stop_points:
+        failed = None
+        for analysis in analyses:
+            try:
+                process(analysis, stop_point)
+            except Exception as e:
+                print(f"Error occurred in {analysis.name}: {e}")
+                if metrics is not None:
+                    metrics.record_error('aggregate', analysis.name, e)
+                failed = failed or []
+                failed.append(analysis)
+        if failed:
+            analyses = [analysis for analysis in analyses if analysis not in failed]
+
+    attach_source(analyses, file_path)
+    return analyses
+
+
+def export_analyses(analyses, timestamp, metrics=None):
+    """
+    Write each analysis' output exactly as its own script would.
+
+    Args:
+    analyses (list): Completed analyses.
+    timestamp (str): Timestamp shared by every exported filename.
+    metrics (RunMetrics): Optional metrics.RunMetrics to record timings and errors in.
+    """
+    for analysis in analyses:
+        try:
+            if metrics is None:
+                analysis.export(timestamp)
+            else:
+                with metrics.phase('export', analysis.name):
+                    analysis.export(timestamp)
+        except Exception as e:
+            print(f"Error occurred exporting {analysis.name}: {e}")
+            if metrics is not None:
+                metrics.record_error('export', analysis.name, e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the NaPTAN analyses over a single pass of the XML file.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--only', nargs='+', choices=sorted(ANALYSES), help='Analyses to run (default: all)')
+    parser.add_argument('--metrics', action='store_true', help='Export timings, throughput and memory to run_metrics_[timestamp].json')
+    parser.add_argument('--progress', type=float, metavar='SECONDS', help='Print progress every SECONDS during the scan')
+    args = parser.parse_args()
+
+    metrics = RunMetrics(args.file_path, args.progress) if args.metrics or args.progress else None
+    analyses = run_analyses(args.file_path, args.only, metrics)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_analyses(analyses, timestamp, metrics)
+    if args.metrics:
+        metrics.export(timestamp)
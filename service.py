@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from dataset_cache import load_stop_fields, source_key
+from flexible_zones import FlexibleZones
+from group_by import KEYS, GroupBy, parse_filters
+from naptan_stream import STOP_FIELDS
+from stop_table import StopTable, find_zero_coordinate_stops
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Largest request body accepted, and the longest a client may take to send a request
+MAX_BODY_BYTES = 1024 * 1024
+REQUEST_TIMEOUT = 30
+
+
+class BadRequest(Exception):
+    """
+    A request that can't be read, answered with an error status before the connection is closed.
+    """
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+class Dataset:
+    """
+    One loaded NaPTAN release, immutable once built.
+
+    Everything a query needs is prepared up front: the extracted columns, the columnar
+    StopTable, ATCO and NaPTAN code lookups and the flexible zones. A reload builds a
+    new Dataset and swaps it in whole, so a query always sees a single release.
+    """
+
+    def __init__(self, file_path):
+        start = time.perf_counter()
+        self.file_path = file_path
+        self.source_key = source_key(file_path)
+        self.columns = load_stop_fields(file_path)
+        self.table = StopTable.from_columns(self.columns)
+        self.zones = FlexibleZones.from_columns(self.columns)
+        self.rows_by_atco = {}
+        self.rows_by_naptan = {}
+        for row, (atco_code, naptan_code) in enumerate(zip(self.columns['AtcoCode'], self.columns['NaptanCode'])):
+            if atco_code:
+                self.rows_by_atco.setdefault(atco_code, []).append(row)
+            if naptan_code:
+                self.rows_by_naptan.setdefault(naptan_code, []).append(row)
+        self.zero_coordinate_stops = find_zero_coordinate_stops(self.table)
+        self.loaded = datetime.datetime.now().isoformat(timespec='seconds')
+        self.load_seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return len(self.table)
+
+    def record(self, row):
+        """
+        Return the extracted fields of the stop at a row.
+        """
+        return {field: self.columns[field][row] for field in STOP_FIELDS}
+
+    def lookup(self, codes, field='AtcoCode'):
+        """
+        Return the records of the stops with each code, as {code: [records]}.
+        """
+        rows_by_code = self.rows_by_atco if field == 'AtcoCode' else self.rows_by_naptan
+        return {code: [self.record(row) for row in rows_by_code.get(code, ())] for code in codes}
+
+
+class QueryService:
+    """
+    A local HTTP/JSON service answering queries against a NaPTAN release held in memory.
+
+    Requests are served concurrently on one asyncio event loop; every query is answered from
+    the prepared Dataset without touching the file. A reload parses the new release on a
+    worker thread while queries continue against the current one, then replaces it with a
+    single assignment.
+    """
+
+    def __init__(self, file_path, watch_interval=None):
+        """
+        Args:
+        file_path (str): Path to the NaPTAN XML file, plain or compressed.
+        watch_interval (float): Seconds between checks of the file for a new release.
+            The file is only reloaded on request when None.
+        """
+        self.file_path = file_path
+        self.watch_interval = watch_interval
+        self.dataset = None
+        self.generation = 0
+        self.reload_task = None
+        self.last_reload_error = None
+        self.routes = {
+            ('GET', 'status'): self.status,
+            ('GET', 'stops'): self.stops,
+            ('GET', 'naptan'): self.naptan,
+            ('GET', 'lookup'): self.batch_lookup,
+            ('GET', 'counts'): self.counts,
+            ('GET', 'flexible-zones'): self.flexible_zones,
+            ('GET', 'zero-coordinates'): self.zero_coordinates,
+            ('POST', 'reload'): self.reload,
+        }
+
+    async def load(self):
+        """
+        Load the release for the first time.
+        """
+        self.dataset = await asyncio.to_thread(Dataset, self.file_path)
+        self.generation = 1
+
+    async def _reload(self, file_path):
+        try:
+            dataset = await asyncio.to_thread(Dataset, file_path)
+        except Exception as e:
+            self.last_reload_error = f'{type(e).__name__}: {e}'
+            print(f"Error occurred reloading {file_path}: {e}")
+            return
+        # Queries in flight keep the Dataset they started with
+        self.file_path = file_path
+        self.dataset = dataset
+        self.generation += 1
+        self.last_reload_error = None
+        print(f"Reloaded {len(dataset)} stops from {file_path} in {dataset.load_seconds:.2f}s")
+
+    def start_reload(self, file_path=None):
+        """
+        Start loading a release in the background, unless a reload is already running.
+
+        Returns:
+        bool: True if a reload was started.
+        """
+        if self.reload_task is not None and not self.reload_task.done():
+            return False
+        self.reload_task = asyncio.get_running_loop().create_task(self._reload(file_path or self.file_path))
+        return True
+
+    async def watch(self):
+        """
+        Reload whenever the file's size or modification time change.
+        """
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                changed = source_key(self.file_path) != self.dataset.source_key
+            except OSError:
+                continue
+            if changed:
+                self.start_reload()
+
+    # Handlers take the path segments after the route name and the query parameters, and
+    # return (status, JSON-serializable body)
+
+    def status(self, segments, params, body):
+        dataset = self.dataset
+        return HTTPStatus.OK, {
+            'file_path': dataset.file_path,
+            'stops': len(dataset),
+            'loaded': dataset.loaded,
+            'load_seconds': dataset.load_seconds,
+            'generation': self.generation,
+            'reloading': self.reload_task is not None and not self.reload_task.done(),
+            'last_reload_error': self.last_reload_error,
+        }
+
+    def stops(self, segments, params, body):
+        if len(segments) != 1:
+            return HTTPStatus.NOT_FOUND, {'error': 'Expected /stops/<AtcoCode>'}
+        records = self.dataset.lookup(segments, 'AtcoCode')[segments[0]]
+        if not records:
+            return HTTPStatus.NOT_FOUND, {'error': f'No stop with ATCO code {segments[0]}'}
+        return HTTPStatus.OK, records
+
+    def naptan(self, segments, params, body):
+        if len(segments) != 1:
+            return HTTPStatus.NOT_FOUND, {'error': 'Expected /naptan/<NaptanCode>'}
+        records = self.dataset.lookup(segments, 'NaptanCode')[segments[0]]
+        if not records:
+            return HTTPStatus.NOT_FOUND, {'error': f'No stop with NaPTAN code {segments[0]}'}
+        return HTTPStatus.OK, records
+
+    def batch_lookup(self, segments, params, body):
+        dataset = self.dataset
+        return HTTPStatus.OK, {
+            'AtcoCode': dataset.lookup(_split(params.get('atco', [])), 'AtcoCode'),
+            'NaptanCode': dataset.lookup(_split(params.get('naptan', [])), 'NaptanCode'),
+        }
+
+    def counts(self, segments, params, body):
+        dataset = self.dataset
+        keys = _split(params.get('by', [])) or ['StopType']
+        unknown = [key for key in keys if key not in KEYS]
+        if unknown:
+            return HTTPStatus.BAD_REQUEST, {'error': f'Unknown keys {", ".join(unknown)}; expected some of {", ".join(KEYS)}'}
+        try:
+            mask = parse_filters(dataset.table, params.get('where', []))
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        counts = GroupBy(dataset.table, keys, mask).counts()
+        return HTTPStatus.OK, [
+            dict(zip(keys, group if len(keys) > 1 else (group,)), Count=count) for group, count in counts.items()
+        ]
+
+    def flexible_zones(self, segments, params, body):
+        dataset = self.dataset
+        if segments:
+            rows = dataset.rows_by_atco.get(segments[0], ())
+            zones = [dataset.columns['FlexibleZone'][row] for row in rows]
+            if not any(zone is not None for zone in zones):
+                return HTTPStatus.NOT_FOUND, {'error': f'No flexible zone for ATCO code {segments[0]}'}
+            return HTTPStatus.OK, {'AtcoCode': segments[0], 'FlexibleZone': next(zone for zone in zones if zone is not None)}
+        if 'easting' in params or 'northing' in params:
+            try:
+                easting, northing = float(params['easting'][0]), float(params['northing'][0])
+            except (KeyError, ValueError):
+                return HTTPStatus.BAD_REQUEST, {'error': 'Give both easting and northing as numbers'}
+            zones = dataset.zones.zones_containing(easting, northing).tolist()
+            return HTTPStatus.OK, [dataset.zones.atco_codes[zone] for zone in zones]
+        # Same grouping as FLX_zone_count.py: BCT/FLX stops by number of zone locations
+        table = dataset.table
+        groups = GroupBy(table, ['FlexibleZoneLocations'], table.equals('StopType', 'BCT') & table.equals('BusStopType', 'FLX'))
+        members = groups.members('AtcoCode') if params.get('members') == ['true'] else None
+        return HTTPStatus.OK, [
+            dict({'NumberOfPositions': size, 'Count': count}, **({'AtcoCodes': members[size]} if members else {}))
+            for size, count in sorted(groups.counts().items())
+        ]
+
+    def zero_coordinates(self, segments, params, body):
+        return HTTPStatus.OK, self.dataset.zero_coordinate_stops
+
+    def reload(self, segments, params, body):
+        file_path = None
+        if body:
+            try:
+                file_path = json.loads(body).get('file_path')
+            except (ValueError, AttributeError):
+                return HTTPStatus.BAD_REQUEST, {'error': 'Body must be a JSON object'}
+        if file_path is not None and not os.path.exists(file_path):
+            return HTTPStatus.BAD_REQUEST, {'error': f'No such file {file_path}'}
+        started = self.start_reload(file_path)
+        return HTTPStatus.ACCEPTED, {'reloading': True, 'started': started, 'generation': self.generation}
+
+    def dispatch(self, method, target, body):
+        """
+        Answer one request.
+
+        Returns:
+        HTTPStatus: Response status.
+        object: Response body, to be sent as JSON.
+        """
+        url = urlsplit(target)
+        segments = [unquote(segment) for segment in url.path.split('/') if segment]
+        if not segments:
+            segments = ['status']
+        handler = self.routes.get((method, segments[0]))
+        if handler is None:
+            allowed = any(route == segments[0] for _, route in self.routes)
+            status = HTTPStatus.METHOD_NOT_ALLOWED if allowed else HTTPStatus.NOT_FOUND
+            return status, {'error': f'{status.phrase}: {method} {url.path}'}
+        return handler(segments[1:], parse_qs(url.query), body)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the requests of one connection, keeping it open between requests unless asked not to.
+        """
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), REQUEST_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except BadRequest as e:
+                    # The rest of the request can't be found, so the connection can't be reused
+                    await _respond(writer, e.status, {'error': str(e)}, 0.0, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, target, version, headers, body = request
+
+                start = time.perf_counter()
+                try:
+                    status, response = self.dispatch(method, target, body)
+                except Exception as e:
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(e).__name__}: {e}'}
+                elapsed = (time.perf_counter() - start) * 1000
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+                await _respond(writer, status, response, elapsed, keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Load the release and serve requests until cancelled.
+        """
+        await self.load()
+        print(f"Loaded {len(self.dataset)} stops from {self.file_path} in {self.dataset.load_seconds:.2f}s")
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        watcher = asyncio.get_running_loop().create_task(self.watch()) if self.watch_interval else None
+        print(f"Serving on http://{host}:{port}/")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+
+def _split(values):
+    """
+    Flatten repeated and comma separated query parameter values.
+    """
+    return [part for value in values for part in value.split(',') if part]
+
+
+async def _respond(writer, status, response, elapsed, keep_alive):
+    """
+    Write one JSON response.
+    """
+    payload = json.dumps(response).encode('utf-8')
+    writer.write(
+        f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+        f'Content-Type: application/json\r\n'
+        f'Content-Length: {len(payload)}\r\n'
+        f'X-Server-Time-Ms: {elapsed:.3f}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + payload)
+    await writer.drain()
+
+
+async def _read_line(reader):
+    # A line longer than the reader's limit can't be read, nor the rest of the request found
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise BadRequest('Request line or header too long', HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+
+async def _read_request(reader):
+    """
+    Read one HTTP request, returning None at the end of the connection.
+
+    Raises BadRequest for a request that is malformed, has a line too long to read or
+    whose body is too large.
+    """
+    request_line = await _read_line(reader)
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise BadRequest('Malformed request line')
+    headers = {}
+    while True:
+        line = await _read_line(reader)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get('content-length', '0') or '0'
+    if not (length.isascii() and length.isdigit()):
+        raise BadRequest(f'Invalid Content-Length {length!r}')
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise BadRequest(f'Body larger than {MAX_BODY_BYTES} bytes', HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, version, headers, body
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve queries against NaPTAN.xml held in memory, over local HTTP/JSON.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='Check the file for a new release every SECONDS and reload it in the background')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(QueryService(args.file_path, args.watch).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
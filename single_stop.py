@@ -1,49 +1,74 @@
 import xml.etree.ElementTree as ET
+import argparse
 import datetime
 
+from stop_index import StopIndex
 
-def extract_atco_code_data(file_path, atco_code):
+# Label and filename prefix used for each lookup field
+CODE_LABELS = {
+    'AtcoCode': ('ATCO code', 'atco_code'),
+    'NaptanCode': ('NaPTAN code', 'naptan_code'),
+}
+
+
+def extract_codes_data(file_path, codes, field='AtcoCode'):
     """
-    Extract and print data for a specific ATCO code to a .txt file, without namespace prefixes.
+    Extract and print data for a batch of ATCO (or NaPTAN) codes, one .txt file per code,
+    without namespace prefixes.
+
+    Lookups go through the byte-offset sidecar index, so only the matching StopPoints are
+    parsed. The index is built on the first lookup against a file and reused afterwards.
 
     Args:
     file_path (str): Path to the NaPTAN XML file.
-    atco_code (str): The ATCO code to search for.
+    codes (list): The codes to search for.
+    field (str): 'AtcoCode' or 'NaptanCode'.
     """
+    label, prefix = CODE_LABELS[field]
+
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-
-        # Define the namespace
-        ns = {'n': 'http://www.naptan.org.uk/'}
-
-        # Find the StopPoint with the specified ATCO code
-        stop_point = root.find(f".//n:StopPoints/n:StopPoint[n:AtcoCode='{atco_code}']", namespaces=ns)
-        if stop_point is not None:
-            # Register namespace to prevent ns0 prefix
-            ET.register_namespace('', 'http://www.naptan.org.uk/')
-
-            # Get all data for this StopPoint as a string
-            stop_point_data = ET.tostring(stop_point, encoding='unicode', method='xml')
-
-            # Export to a .txt file with a timestamp
-            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-            txt_filename = f'atco_code_{atco_code}_{timestamp}.txt'
-            with open(txt_filename, 'w') as file:
-                file.write(stop_point_data)
-                print(f"Data for ATCO code {atco_code} exported to {txt_filename}")
-        else:
-            print(f"No data found for ATCO code {atco_code}")
+        # Register namespace to prevent ns0 prefix
+        ET.register_namespace('', 'http://www.naptan.org.uk/')
+
+        with StopIndex(file_path) as index:
+            stop_points = index.stop_points(codes, field)
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        for code, stop_point in stop_points.items():
+            if stop_point is not None:
+                # Get all data for this StopPoint as a string
+                stop_point_data = ET.tostring(stop_point, encoding='unicode', method='xml')
+
+                # Export to a .txt file with a timestamp
+                txt_filename = f'{prefix}_{code}_{timestamp}.txt'
+                with open(txt_filename, 'w') as file:
+                    file.write(stop_point_data)
+                    print(f"Data for {label} {code} exported to {txt_filename}")
+            else:
+                print(f"No data found for {label} {code}")
 
     except Exception as e:
         print(f"Error occurred: {e}")
 
 
+def extract_atco_code_data(file_path, atco_code):
+    """
+    Extract and print data for a specific ATCO code to a .txt file, without namespace prefixes.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    atco_code (str): The ATCO code to search for.
+    """
+    extract_codes_data(file_path, [atco_code])
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the StopPoint data for one or more ATCO or NaPTAN codes.')
     # Replace this with the absolute path to your NaPTAN XML file
-    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
-    # Replace this with the ATCO code you want to search for
-    atco_code = '260000T11'
+    parser.add_argument('--file-path', default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    # Replace this with the ATCO code(s) you want to search for
+    parser.add_argument('codes', nargs='*', default=['260000T11'])
+    parser.add_argument('--naptan', action='store_true', help='Look up NaPTAN codes instead of ATCO codes')
+    args = parser.parse_args()
 
-    extract_atco_code_data(file_path, atco_code)
+    extract_codes_data(args.file_path, args.codes, 'NaptanCode' if args.naptan else 'AtcoCode')
@@ -0,0 +1,337 @@
+import argparse
+import csv
+import datetime
+import time
+
+import numpy as np
+
+from stop_table import load_stop_table
+
+# Grid cell size in metres; queries touch few cells at typical search radii of tens to hundreds of metres
+DEFAULT_CELL_SIZE = 250.0
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the Easting/Northing of every StopPoint.
+
+    Points are sorted by grid cell, with cells numbered row by row, so every row of
+    cells crossed by a query box is one contiguous slice of the sorted points, found
+    with a pair of binary searches. Stops without coordinates are left out. Results
+    are given as row numbers into the StopTable (or coordinate arrays) the index was
+    built from.
+    """
+
+    def __init__(self, eastings, northings, cell_size=DEFAULT_CELL_SIZE):
+        eastings = np.asarray(eastings, dtype=np.float64)
+        northings = np.asarray(northings, dtype=np.float64)
+        rows = np.flatnonzero(~(np.isnan(eastings) | np.isnan(northings)))
+
+        self.cell_size = float(cell_size)
+        if len(rows):
+            self.origin = (eastings[rows].min(), northings[rows].min())
+            self.shape = (int((eastings[rows].max() - self.origin[0]) // self.cell_size) + 1,
+                          int((northings[rows].max() - self.origin[1]) // self.cell_size) + 1)
+        else:
+            self.origin = (0.0, 0.0)
+            self.shape = (1, 1)
+
+        cell_ids = self._cell_ids(eastings[rows], northings[rows])
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_ids = cell_ids[order]
+        self.rows = rows[order]
+        self.eastings = eastings[self.rows]
+        self.northings = northings[self.rows]
+
+    @classmethod
+    def from_table(cls, table, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Build an index over the Easting/Northing columns of a StopTable.
+
+        Args:
+        table (StopTable): The columnar table.
+        cell_size (float): Grid cell size in metres.
+
+        Returns:
+        SpatialIndex: The index, returning row numbers into table.
+        """
+        return cls(table['Easting'], table['Northing'], cell_size)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _cells(self, eastings, northings):
+        nx, ny = self.shape
+        ix = np.clip((np.asarray(eastings) - self.origin[0]) // self.cell_size, 0, nx - 1).astype(np.int64)
+        iy = np.clip((np.asarray(northings) - self.origin[1]) // self.cell_size, 0, ny - 1).astype(np.int64)
+        return ix, iy
+
+    def _cell_ids(self, eastings, northings):
+        ix, iy = self._cells(eastings, northings)
+        return iy * self.shape[0] + ix
+
+    def _candidates(self, min_easting, min_northing, max_easting, max_northing):
+        """
+        Return the positions, in sorted order, of the points in every cell overlapping a box.
+        """
+        nx, ny = self.shape
+        if (not len(self.rows) or max_easting < self.origin[0] or max_northing < self.origin[1]
+                or min_easting >= self.origin[0] + nx * self.cell_size
+                or min_northing >= self.origin[1] + ny * self.cell_size):
+            return np.empty(0, dtype=np.int64)
+
+        (ix0, ix1), (iy0, iy1) = self._cells([min_easting, max_easting], [min_northing, max_northing])
+        row_starts = np.arange(iy0, iy1 + 1) * nx
+        lo = np.searchsorted(self.cell_ids, row_starts + ix0, 'left')
+        hi = np.searchsorted(self.cell_ids, row_starts + ix1, 'right')
+        if len(lo) == 1:
+            return np.arange(lo[0], hi[0])
+        return np.concatenate([np.arange(start, end) for start, end in zip(lo.tolist(), hi.tolist())])
+
+    def within_bbox(self, min_easting, min_northing, max_easting, max_northing):
+        """
+        Find the stops inside a bounding box (edges included).
+
+        Returns:
+        ndarray: Row numbers of the stops, in ascending order.
+        """
+        candidates = self._candidates(min_easting, min_northing, max_easting, max_northing)
+        eastings = self.eastings[candidates]
+        northings = self.northings[candidates]
+        inside = ((eastings >= min_easting) & (eastings <= max_easting)
+                  & (northings >= min_northing) & (northings <= max_northing))
+        return np.sort(self.rows[candidates[inside]])
+
+    def within_radius(self, easting, northing, radius):
+        """
+        Find the stops within a distance of a point.
+
+        Args:
+        easting (float): Easting of the point.
+        northing (float): Northing of the point.
+        radius (float): Search radius in metres.
+
+        Returns:
+        ndarray: Row numbers of the stops, nearest first.
+        ndarray: Their distances in metres.
+        """
+        candidates = self._candidates(easting - radius, northing - radius, easting + radius, northing + radius)
+        distances = np.hypot(self.eastings[candidates] - easting, self.northings[candidates] - northing)
+        inside = distances <= radius
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return self.rows[candidates[order]], distances[order]
+
+    def nearest(self, easting, northing, k=1, max_distance=None):
+        """
+        Find the k stops nearest to a point.
+
+        The search box starts at one cell and doubles until it holds k stops within its
+        radius, so sparse areas cost a few extra binary searches rather than a full scan.
+
+        Args:
+        easting (float): Easting of the point.
+        northing (float): Northing of the point.
+        k (int): Number of stops to return.
+        max_distance (float): Ignore stops further away than this, in metres.
+
+        Returns:
+        ndarray: Row numbers of up to k stops, nearest first.
+        ndarray: Their distances in metres.
+        """
+        rows, distances = self.nearest_batch([easting], [northing], k, max_distance)
+        found = rows[0] != -1
+        return rows[0][found], distances[0][found]
+
+    def _query_groups(self, eastings, northings):
+        """
+        Group query points by grid cell, so queries in the same cell share one candidate search.
+        """
+        cell_ids = self._cell_ids(eastings, northings)
+        order = np.argsort(cell_ids, kind='stable')
+        boundaries = np.flatnonzero(np.diff(cell_ids[order])) + 1
+        return np.split(order, boundaries)
+
+    def within_radius_batch(self, eastings, northings, radius):
+        """
+        Find the stops within a distance of each of many points.
+
+        Args:
+        eastings (array): Eastings of the query points.
+        northings (array): Northings of the query points.
+        radius (float): Search radius in metres.
+
+        Returns:
+        ndarray: offsets, where the matches of query i are at offsets[i]:offsets[i + 1].
+        ndarray: Row numbers of the matched stops, nearest first per query.
+        ndarray: Their distances in metres.
+        """
+        eastings = np.asarray(eastings, dtype=np.float64)
+        northings = np.asarray(northings, dtype=np.float64)
+        matches = [None] * len(eastings)
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+
+        for group in self._query_groups(eastings, northings):
+            group_eastings, group_northings = eastings[group], northings[group]
+            candidates = self._candidates(group_eastings.min() - radius, group_northings.min() - radius,
+                                          group_eastings.max() + radius, group_northings.max() + radius)
+            distances = np.hypot(self.eastings[candidates] - group_eastings[:, None],
+                                 self.northings[candidates] - group_northings[:, None])
+            for query, query_distances in zip(group.tolist(), distances):
+                inside = np.flatnonzero(query_distances <= radius)
+                inside = inside[np.argsort(query_distances[inside], kind='stable')]
+                matches[query] = (self.rows[candidates[inside]], query_distances[inside])
+
+        matches = [match or empty for match in matches]
+        offsets = np.zeros(len(matches) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows, _ in matches], out=offsets[1:])
+        if not matches:
+            return offsets, empty[0], empty[1]
+        return offsets, np.concatenate([rows for rows, _ in matches]), np.concatenate([d for _, d in matches])
+
+    def nearest_batch(self, eastings, northings, k=1, max_distance=None):
+        """
+        Find the k stops nearest to each of many points, such as AVL pings.
+
+        Args:
+        eastings (array): Eastings of the query points.
+        northings (array): Northings of the query points.
+        k (int): Number of stops to return per point.
+        max_distance (float): Ignore stops further away than this, in metres.
+
+        Returns:
+        ndarray: (n, k) row numbers, nearest first, padded with -1 where fewer than k stops were found.
+        ndarray: (n, k) distances in metres, padded with inf.
+        """
+        eastings = np.asarray(eastings, dtype=np.float64)
+        northings = np.asarray(northings, dtype=np.float64)
+        rows = np.full((len(eastings), k), -1, dtype=np.int64)
+        distances = np.full((len(eastings), k), np.inf)
+        if not len(self.rows) or not len(eastings):
+            return rows, distances
+
+        nx, ny = self.shape
+        extent = (self.origin[0] + nx * self.cell_size, self.origin[1] + ny * self.cell_size)
+        wanted = min(k, len(self.rows))
+        # Start at the radius expected to hold k stops at the average density, and never below one cell
+        start_radius = max(self.cell_size, np.sqrt(wanted * nx * ny / (np.pi * len(self.rows))) * self.cell_size)
+
+        for group in self._query_groups(eastings, northings):
+            group_eastings, group_northings = eastings[group], northings[group]
+            radius = start_radius
+            while True:
+                if max_distance is not None:
+                    radius = min(radius, max_distance)
+                box = (group_eastings.min() - radius, group_northings.min() - radius,
+                       group_eastings.max() + radius, group_northings.max() + radius)
+                candidates = self._candidates(*box)
+                candidate_distances = np.hypot(self.eastings[candidates] - group_eastings[:, None],
+                                               self.northings[candidates] - group_northings[:, None])
+                covers_grid = (box[0] <= self.origin[0] and box[1] <= self.origin[1]
+                               and box[2] >= extent[0] and box[3] >= extent[1])
+                # Any stop within radius of a query lies in the box, so k of them within radius are the true k nearest
+                if (radius == max_distance or covers_grid
+                        or ((candidate_distances <= radius).sum(axis=1) >= wanted).all()):
+                    break
+                radius *= 2
+
+            if max_distance is not None:
+                candidate_distances[candidate_distances > max_distance] = np.inf
+            found = min(k, len(candidates))
+            nearest = np.argpartition(candidate_distances, found - 1, axis=1)[:, :found] if found else \
+                np.empty((len(group), 0), dtype=np.int64)
+            nearest_distances = np.take_along_axis(candidate_distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1, kind='stable')
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+
+            group_rows = np.where(np.isinf(nearest_distances), -1, self.rows[candidates[nearest]])
+            rows[group, :found] = group_rows
+            distances[group, :found] = nearest_distances
+
+        return rows, distances
+
+
+def read_points(filename):
+    """
+    Read query points from a CSV file with Easting and Northing columns.
+
+    Args:
+    filename (str): Path to the CSV file.
+
+    Returns:
+    ndarray: Eastings of the points.
+    ndarray: Northings of the points.
+    """
+    with open(filename, newline='', encoding='utf-8') as file:
+        points = [(float(row['Easting']), float(row['Northing'])) for row in csv.DictReader(file)]
+    points = np.array(points, dtype=np.float64).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def export_nearest_stops(table, eastings, northings, rows, distances, timestamp):
+    """
+    Export the nearest stops to each query point to a timestamped CSV file.
+
+    Args:
+    table (StopTable): The table the index was built from.
+    eastings (array): Eastings of the query points.
+    northings (array): Northings of the query points.
+    rows (ndarray): (n, k) row numbers from nearest_batch.
+    distances (ndarray): (n, k) distances from nearest_batch.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    csv_filename = f'nearest_stops_{timestamp}.csv'
+    with open(csv_filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Easting', 'Northing', 'Rank', 'ATCO Code', 'Distance (m)'])
+        for easting, northing, point_rows, point_distances in zip(eastings.tolist(), northings.tolist(), rows, distances):
+            found = point_rows != -1
+            atco_codes = table.decode('AtcoCode', point_rows[found])
+            for rank, (atco_code, distance) in enumerate(zip(atco_codes, point_distances[found].tolist()), 1):
+                writer.writerow([easting, northing, rank, atco_code, f'{distance:.1f}'])
+    print(f"Exported nearest stops to {csv_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query NaPTAN stops by location.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--point', nargs=2, type=float, metavar=('EASTING', 'NORTHING'), help='Query point')
+    parser.add_argument('--radius', type=float, help='List the stops within this many metres of --point')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_E', 'MIN_N', 'MAX_E', 'MAX_N'),
+                        help='List the stops inside a bounding box')
+    parser.add_argument('--points-csv', help='CSV of Easting,Northing query points; exports the nearest stops to each')
+    parser.add_argument('-k', type=int, default=1, help='Number of nearest stops to find (default: 1)')
+    parser.add_argument('--max-distance', type=float, help='Ignore stops further away than this, in metres')
+    parser.add_argument('--cell-size', type=float, default=DEFAULT_CELL_SIZE)
+    args = parser.parse_args()
+
+    table = load_stop_table(args.file_path)
+    start = time.perf_counter()
+    index = SpatialIndex.from_table(table, args.cell_size)
+    print(f"Indexed {len(index)} stops in {time.perf_counter() - start:.3f}s")
+
+    if args.bbox:
+        rows = index.within_bbox(*args.bbox)
+        print(f"Stops in bounding box: {len(rows)}")
+        for atco_code in table.decode('AtcoCode', rows):
+            print(atco_code)
+
+    if args.point:
+        if args.radius is not None:
+            rows, distances = index.within_radius(*args.point, args.radius)
+        else:
+            rows, distances = index.nearest(*args.point, args.k, args.max_distance)
+        for atco_code, distance in zip(table.decode('AtcoCode', rows), distances.tolist()):
+            print(f"ATCO Code: {atco_code}, Distance: {distance:.1f} m")
+
+    if args.points_csv:
+        eastings, northings = read_points(args.points_csv)
+        start = time.perf_counter()
+        rows, distances = index.nearest_batch(eastings, northings, args.k, args.max_distance)
+        print(f"Matched {len(eastings)} points in {time.perf_counter() - start:.3f}s")
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        export_nearest_stops(table, eastings, northings, rows, distances, timestamp)
@@ -0,0 +1,376 @@
+import argparse
+import csv
+import datetime
+import functools
+import os
+import re
+import sqlite3
+import time
+
+from dataset_cache import source_key
+from deleted_common_name import DELETE_PATTERN
+from naptan_stream import NAPTAN_NS, extract_stop_fields, iter_stop_points, ns
+
+# Bump whenever the tables or the way they are filled change, so old databases are rebuilt
+DATABASE_VERSION = 1
+
+# StopPoints inserted per transaction during the load
+BATCH_SIZE = 10000
+
+# Elements of a StopValidity giving the stop's state over its DateRange
+VALIDITY_STATES = {f'{{{NAPTAN_NS}}}{state}': state for state in ('Active', 'Suspended', 'Transferred')}
+
+# Tables the StopPoints are normalized into. stop_id is the StopPoint's position in the file,
+# starting from 1, and links each stop's rows in the other tables. Coordinates are declared
+# REAL so SQLite stores them as numbers; anything that isn't a number is kept as text.
+SCHEMA = """
+CREATE TABLE metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE stops (
+    stop_id INTEGER PRIMARY KEY,
+    atco_code TEXT,
+    naptan_code TEXT,
+    stop_type TEXT,
+    bus_stop_type TEXT,
+    timing_status TEXT,
+    status TEXT,
+    creation_date_time TEXT,
+    modification_date_time TEXT,
+    modification TEXT,
+    revision_number INTEGER,
+    easting REAL,
+    northing REAL,
+    latitude REAL,
+    longitude REAL,
+    administrative_area_ref TEXT,
+    nptg_locality_ref TEXT,
+    has_flexible_zone INTEGER NOT NULL
+);
+CREATE TABLE descriptors (
+    stop_id INTEGER PRIMARY KEY REFERENCES stops,
+    common_name TEXT,
+    short_common_name TEXT,
+    landmark TEXT,
+    street TEXT,
+    indicator TEXT
+);
+CREATE TABLE flexible_zone_vertices (
+    stop_id INTEGER NOT NULL REFERENCES stops,
+    vertex INTEGER NOT NULL,
+    easting REAL,
+    northing REAL,
+    latitude REAL,
+    longitude REAL,
+    PRIMARY KEY (stop_id, vertex)
+) WITHOUT ROWID;
+CREATE TABLE stop_area_refs (
+    stop_id INTEGER NOT NULL REFERENCES stops,
+    position INTEGER NOT NULL,
+    stop_area_code TEXT,
+    PRIMARY KEY (stop_id, position)
+) WITHOUT ROWID;
+CREATE TABLE validity_ranges (
+    stop_id INTEGER NOT NULL REFERENCES stops,
+    position INTEGER NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    state TEXT,
+    PRIMARY KEY (stop_id, position)
+) WITHOUT ROWID;
+"""
+
+# Created once the load is finished, which is much faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX stops_atco_code ON stops (atco_code);
+CREATE INDEX stops_naptan_code ON stops (naptan_code);
+CREATE INDEX stops_stop_type ON stops (stop_type, bus_stop_type);
+CREATE INDEX stops_administrative_area_ref ON stops (administrative_area_ref);
+CREATE INDEX stops_nptg_locality_ref ON stops (nptg_locality_ref);
+CREATE INDEX stop_area_refs_stop_area_code ON stop_area_refs (stop_area_code);
+ANALYZE;
+"""
+
+INSERTS = {
+    'stops': 'INSERT INTO stops VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+    'descriptors': 'INSERT INTO descriptors VALUES (?, ?, ?, ?, ?, ?)',
+    'flexible_zone_vertices': 'INSERT INTO flexible_zone_vertices VALUES (?, ?, ?, ?, ?, ?)',
+    'stop_area_refs': 'INSERT INTO stop_area_refs VALUES (?, ?, ?)',
+    'validity_ranges': 'INSERT INTO validity_ranges VALUES (?, ?, ?, ?, ?)',
+}
+
+# The analyses of this repository as SQL, named after their scripts. Each is answered from
+# the indexes above rather than by reparsing the XML.
+ANALYSIS_QUERIES = {
+    'count': "SELECT COUNT(*) AS total_stops FROM stops",
+    'main': """
+        SELECT (SELECT COUNT(DISTINCT atco_code) FROM stops WHERE atco_code <> '') AS unique_atco_codes,
+               (SELECT COUNT(DISTINCT naptan_code) FROM stops WHERE naptan_code <> '') AS unique_naptan_codes
+    """,
+    'inactive': "SELECT COUNT(*) AS inactive_stops FROM stops WHERE lower(status) = 'inactive'",
+    'duplicates': """
+        SELECT 'ATCO' AS code_type, atco_code AS code, COUNT(*) AS count
+        FROM stops WHERE atco_code <> '' GROUP BY atco_code HAVING COUNT(*) > 1
+        UNION ALL
+        SELECT 'NaPTAN', naptan_code, COUNT(*)
+        FROM stops WHERE naptan_code <> '' GROUP BY naptan_code HAVING COUNT(*) > 1
+    """,
+    'missing_naptan_code': """
+        SELECT COALESCE(stop_type, 'Unknown') AS stop_type, COUNT(*) AS count
+        FROM stops WHERE atco_code <> '' AND COALESCE(naptan_code, '') = ''
+        GROUP BY 1 ORDER BY 1
+    """,
+    'one_atco_many_naptan': """
+        SELECT atco_code, group_concat(naptan_code, ';') AS naptan_codes
+        FROM stops WHERE atco_code <> '' AND naptan_code <> ''
+        GROUP BY atco_code HAVING COUNT(*) > 1
+    """,
+    'deleted_common_name': f"""
+        SELECT stops.atco_code, descriptors.common_name
+        FROM descriptors JOIN stops USING (stop_id)
+        WHERE stops.atco_code <> '' AND descriptors.common_name REGEXP '(?i){DELETE_PATTERN.pattern}'
+        ORDER BY stop_id
+    """,
+    'count_FLX': """
+        SELECT atco_code FROM stops
+        WHERE stop_type = 'BCT' AND bus_stop_type = 'FLX' AND atco_code IS NOT NULL
+        ORDER BY stop_id
+    """,
+    'FLX_zone_count': """
+        SELECT vertices, COUNT(*) AS stops
+        FROM (SELECT COUNT(flexible_zone_vertices.vertex) AS vertices
+              FROM stops LEFT JOIN flexible_zone_vertices USING (stop_id)
+              WHERE stops.stop_type = 'BCT' AND stops.bus_stop_type = 'FLX'
+              GROUP BY stops.stop_id)
+        GROUP BY vertices ORDER BY vertices
+    """,
+    'flexiblezone_stoptype': """
+        SELECT COALESCE(bus_stop_type, 'Unknown') AS bus_stop_type, COUNT(*) AS count
+        FROM stops WHERE has_flexible_zone GROUP BY 1 ORDER BY 1
+    """,
+    'zero_coords': """
+        SELECT atco_code FROM stops
+        WHERE easting = 0 OR northing = 0 OR latitude = 0 OR longitude = 0
+        ORDER BY stop_id
+    """,
+}
+
+
+def database_path_for(file_path):
+    """
+    Return the default database path for a NaPTAN XML file: next to it, with .sqlite appended.
+    """
+    return f'{file_path}.sqlite'
+
+
+def _validity_ranges(stop_point):
+    """
+    Return (StartDate, EndDate, state) for each StopValidity of a StopPoint, where state
+    is Active, Suspended or Transferred.
+    """
+    ranges = []
+    for validity in stop_point.iterfind('n:StopAvailability/n:StopValidity', ns):
+        state = next((VALIDITY_STATES[child.tag] for child in validity if child.tag in VALIDITY_STATES), None)
+        ranges.append((validity.findtext('n:DateRange/n:StartDate', namespaces=ns),
+                       validity.findtext('n:DateRange/n:EndDate', namespaces=ns),
+                       state))
+    return ranges
+
+
+def _rows(stop_id, stop_point):
+    """
+    Normalize one StopPoint into a row for each table it has data for.
+    """
+    fields = extract_stop_fields(stop_point)
+    flexible_zone = fields['FlexibleZone']
+    yield 'stops', (
+        stop_id, fields['AtcoCode'], fields['NaptanCode'],
+        fields['StopType'], fields['BusStopType'], fields['TimingStatus'],
+        fields['Status'], fields['CreationDateTime'], fields['ModificationDateTime'],
+        fields['Modification'], fields['RevisionNumber'],
+        fields['Easting'], fields['Northing'], fields['Latitude'], fields['Longitude'],
+        fields['AdministrativeAreaRef'], fields['NptgLocalityRef'],
+        flexible_zone is not None,
+    )
+    yield 'descriptors', (stop_id, fields['CommonName'], fields['ShortCommonName'],
+                          fields['Landmark'], fields['Street'], fields['Indicator'])
+    for vertex, location in enumerate(flexible_zone or ()):
+        yield 'flexible_zone_vertices', (stop_id, vertex) + location
+    for position, code in enumerate(fields['StopAreaRefs']):
+        yield 'stop_area_refs', (stop_id, position, code)
+    for position, validity in enumerate(_validity_ranges(stop_point)):
+        yield 'validity_ranges', (stop_id, position) + validity
+
+
+def _insert(connection, batch):
+    connection.execute('BEGIN')
+    for table, rows in batch.items():
+        connection.executemany(INSERTS[table], rows)
+        rows.clear()
+    connection.execute('COMMIT')
+
+
+def export_to_sqlite(file_path, database_path=None, batch_size=BATCH_SIZE):
+    """
+    Load the StopPoints of a NaPTAN XML file into a new SQLite database.
+
+    The file is streamed, so only one StopPoint and one batch of rows are held in memory
+    at a time. Each batch of batch_size StopPoints is inserted in a single transaction with
+    journaling and syncing turned off, and the indexes are built once at the end. The
+    database is written under a temporary name and moved into place when complete, so a
+    failed load never leaves a partial database behind.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file, plain or compressed.
+    database_path (str): Database to write. Defaults to the file path with .sqlite appended.
+    batch_size (int): StopPoints inserted per transaction.
+
+    Returns:
+    int: Number of StopPoints loaded.
+    """
+    database_path = database_path or database_path_for(file_path)
+    temp_path = f'{database_path}.{os.getpid()}.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    # Autocommit mode, so each batch's transaction is opened and committed explicitly
+    connection = sqlite3.connect(temp_path, isolation_level=None)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(SCHEMA)
+
+        batch = {table: [] for table in INSERTS}
+        stop_id = 0
+        for stop_id, stop_point in enumerate(iter_stop_points(file_path), 1):
+            for table, row in _rows(stop_id, stop_point):
+                batch[table].append(row)
+            if stop_id % batch_size == 0:
+                _insert(connection, batch)
+        _insert(connection, batch)
+
+        connection.executescript(INDEXES)
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', [
+            ('version', str(DATABASE_VERSION)),
+            ('source_path', os.path.abspath(file_path)),
+            ('source_key', source_key(file_path)),
+            ('created', datetime.datetime.now().isoformat(timespec='seconds')),
+        ])
+    except BaseException:
+        connection.close()
+        os.remove(temp_path)
+        raise
+    connection.close()
+    os.replace(temp_path, database_path)
+    return stop_id
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(pattern):
+    return re.compile(pattern)
+
+
+def _regexp(pattern, value):
+    return value is not None and _compile(pattern).search(value) is not None
+
+
+def connect(database_path):
+    """
+    Open a NaPTAN SQLite database, with the REGEXP operator available to queries.
+    """
+    connection = sqlite3.connect(database_path)
+    connection.create_function('REGEXP', 2, _regexp, deterministic=True)
+    return connection
+
+
+def _is_current(database_path, file_path):
+    try:
+        with sqlite3.connect(f'file:{database_path}?mode=ro', uri=True) as connection:
+            metadata = dict(connection.execute('SELECT key, value FROM metadata'))
+    except sqlite3.Error:
+        return False
+    return metadata.get('version') == str(DATABASE_VERSION) and metadata.get('source_key') == source_key(file_path)
+
+
+def open_database(file_path, database_path=None, rebuild=False):
+    """
+    Open the SQLite database for a NaPTAN XML file, loading it first when it is missing,
+    was built from a different version of the file, or rebuild is set.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    database_path (str): Database to use. Defaults to the file path with .sqlite appended.
+    rebuild (bool): Reload the database even when it is current.
+
+    Returns:
+    sqlite3.Connection: An open connection to the database.
+    """
+    database_path = database_path or database_path_for(file_path)
+    if rebuild or not os.path.exists(database_path) or not _is_current(database_path, file_path):
+        start = time.perf_counter()
+        count = export_to_sqlite(file_path, database_path)
+        print(f"Loaded {count} stops into {database_path} in {time.perf_counter() - start:.2f}s")
+    return connect(database_path)
+
+
+def run_query(connection, sql):
+    """
+    Run a query, returning its column names and rows.
+
+    Args:
+    connection (sqlite3.Connection): Connection from connect or open_database.
+    sql (str): The query, or the name of one of ANALYSIS_QUERIES.
+
+    Returns:
+    tuple: (list of column names, list of row tuples).
+    """
+    cursor = connection.execute(ANALYSIS_QUERIES.get(sql, sql))
+    rows = cursor.fetchall()
+    return [column[0] for column in cursor.description or ()], rows
+
+
+def export_to_csv(columns, rows, filename):
+    """
+    Export query results to a CSV file.
+
+    Args:
+    columns (list): Column names.
+    rows (list): Row tuples.
+    filename (str): Filename for the CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load NaPTAN.xml into an indexed SQLite database and query it.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--database', help='SQLite database to use (default: next to the XML file, .sqlite appended)')
+    parser.add_argument('--rebuild', action='store_true', help='Reload the database even if it is up to date')
+    parser.add_argument('--query', nargs='+', default=[], choices=sorted(ANALYSIS_QUERIES),
+                        help='Analyses to run as SQL queries')
+    parser.add_argument('--sql', nargs='+', default=[], help='Ad-hoc SQL queries to run')
+    args = parser.parse_args()
+
+    connection = open_database(args.file_path, args.database, args.rebuild)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    try:
+        for number, sql in enumerate(args.query + args.sql, 1):
+            start = time.perf_counter()
+            columns, rows = run_query(connection, sql)
+            elapsed = (time.perf_counter() - start) * 1000
+            name = sql if sql in ANALYSIS_QUERIES else f'query{number}'
+            csv_filename = f'sql_{name}_{timestamp}.csv'
+            export_to_csv(columns, rows, csv_filename)
+            print(f"{name}: {len(rows)} rows in {elapsed:.1f} ms, exported to {csv_filename}")
+            if len(rows) == 1:
+                print('   ' + ', '.join(f'{column}={value}' for column, value in zip(columns, rows[0])))
+    except sqlite3.Error as e:
+        print(f"Error occurred: {e}")
+    finally:
+        connection.close()
@@ -0,0 +1,365 @@
+import argparse
+import csv
+import datetime
+import os
+import pickle
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from compressed import map_naptan
+from dataset_cache import load_stop_fields, source_key
+
+# Bump whenever the layout of the graph changes, so old sidecars are rebuilt
+GRAPH_VERSION = 1
+
+STOP_AREA_OPEN = b'<StopArea'
+STOP_AREA_CLOSE = b'</StopArea>'
+
+# Fields kept for each StopArea defined in the file
+STOP_AREA_FIELDS = ('StopAreaCode', 'Name', 'StopAreaType', 'AdministrativeAreaRef', 'Status')
+
+
+def graph_path_for(file_path):
+    """
+    Return the path of the sidecar stop area graph for a NaPTAN XML file.
+    """
+    return f'{file_path}.areagraph'
+
+
+def scan_stop_areas(data):
+    """
+    Yield the fields of every StopArea defined in a NaPTAN file by scanning the raw bytes.
+
+    Only the StopArea elements themselves are parsed; the StopAreas and StopAreaRef
+    elements inside StopPoints share the tag prefix and are passed over.
+
+    Args:
+    data (bytes or mmap): The raw file contents.
+
+    Yields:
+    dict: The values of STOP_AREA_FIELDS for each StopArea, in document order.
+    """
+    pos = 0
+    while True:
+        start = data.find(STOP_AREA_OPEN, pos)
+        if start == -1:
+            return
+        pos = start + len(STOP_AREA_OPEN)
+        # Skip <StopAreas>, <StopAreaRef>, <StopAreaCode> and <StopAreaType>
+        if data[pos:pos + 1] not in (b' ', b'>', b'\t', b'\n', b'\r'):
+            continue
+        end = data.find(STOP_AREA_CLOSE, start)
+        if end == -1:
+            return
+        end += len(STOP_AREA_CLOSE)
+        # The slice carries no namespace declaration, so its tags parse unqualified
+        stop_area = ET.fromstring(bytes(data[start:end]))
+        yield {
+            'StopAreaCode': stop_area.findtext('StopAreaCode'),
+            'Name': stop_area.findtext('Name'),
+            'StopAreaType': stop_area.findtext('StopAreaType'),
+            'AdministrativeAreaRef': stop_area.findtext('AdministrativeAreaRef'),
+            'Status': stop_area.get('Status'),
+        }
+        pos = end
+
+
+def _csr(sources, targets, count):
+    """
+    Group edges by source: return offsets (count + 1) and the targets ordered by source,
+    keeping the original order of each source's edges.
+    """
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=count), out=offsets[1:])
+    return offsets, targets[order]
+
+
+class StopAreaGraph:
+    """
+    Membership graph between StopAreas and the StopPoints that reference them.
+
+    Both directions are held as compressed adjacency (CSR) arrays: the members of area a
+    are area_stops[area_offsets[a]:area_offsets[a + 1]] (stop rows, in document order)
+    and the areas of stop row s are stop_areas[stop_offsets[s]:stop_offsets[s + 1]] (in
+    the order of its StopAreaRefs). Areas are numbered with those defined in the file
+    first, in document order, followed by the codes only ever referenced (orphans).
+    """
+
+    def __init__(self, atco_codes, stop_statuses, area_codes, area_fields, defined_areas,
+                 area_offsets, area_stops, stop_offsets, stop_areas):
+        self.atco_codes = atco_codes
+        self.stop_statuses = stop_statuses
+        self.area_codes = area_codes
+        self.area_fields = area_fields
+        self.defined_areas = defined_areas
+        self.area_offsets = area_offsets
+        self.area_stops = area_stops
+        self.stop_offsets = stop_offsets
+        self.stop_areas = stop_areas
+        # Code -> number lookups, built on first use
+        self._area_index = None
+        self._stop_index = None
+
+    @classmethod
+    def build(cls, columns, stop_areas):
+        """
+        Build the graph from the extracted field columns and the StopAreas defined in the file.
+
+        Args:
+        columns (dict): Field names mapped to one value per StopPoint, from load_stop_fields.
+        stop_areas (iterable): StopArea fields from scan_stop_areas.
+
+        Returns:
+        StopAreaGraph: The graph.
+        """
+        area_fields = {field: [] for field in STOP_AREA_FIELDS}
+        area_index = {}
+        for stop_area in stop_areas:
+            code = stop_area['StopAreaCode']
+            if not code or code in area_index:
+                continue
+            area_index[code] = len(area_index)
+            for field in STOP_AREA_FIELDS:
+                area_fields[field].append(stop_area[field])
+        defined_areas = len(area_index)
+
+        # One edge per StopAreaRef; codes with no definition are numbered after the defined areas
+        edge_stops = []
+        edge_areas = []
+        for row, refs in enumerate(columns['StopAreaRefs']):
+            for code in refs:
+                if code:
+                    edge_stops.append(row)
+                    edge_areas.append(area_index.setdefault(code, len(area_index)))
+        edge_stops = np.array(edge_stops, dtype=np.int32)
+        edge_areas = np.array(edge_areas, dtype=np.int32)
+
+        stop_offsets = np.zeros(len(columns['AtcoCode']) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_stops, minlength=len(columns['AtcoCode'])), out=stop_offsets[1:])
+        area_offsets, area_stops = _csr(edge_areas, edge_stops, len(area_index))
+
+        return cls(list(columns['AtcoCode']), list(columns['Status']), list(area_index), area_fields, defined_areas,
+                   area_offsets, area_stops, stop_offsets, edge_areas)
+
+    def __len__(self):
+        return len(self.area_codes)
+
+    def save(self, graph_path, file_path):
+        """
+        Write the graph to disk, tagged with the source file it was built from.
+        """
+        header = {'version': GRAPH_VERSION, 'source_key': source_key(file_path)}
+        temp_path = f'{graph_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((self.atco_codes, self.stop_statuses, self.area_codes, self.area_fields, self.defined_areas,
+                         self.area_offsets, self.area_stops, self.stop_offsets, self.stop_areas),
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, graph_path)
+
+    @classmethod
+    def load(cls, file_path, graph_path=None):
+        """
+        Load the sidecar graph of a NaPTAN XML file, building it first if it is missing or stale.
+
+        The stop side of the graph comes from the parsed dataset cache, so building it only
+        adds a scan of the raw bytes for the StopArea definitions.
+
+        Args:
+        file_path (str): Path to the NaPTAN XML file.
+        graph_path (str): Path of the sidecar graph. Defaults to graph_path_for(file_path).
+
+        Returns:
+        StopAreaGraph: The graph.
+        """
+        graph_path = graph_path or graph_path_for(file_path)
+        try:
+            with open(graph_path, 'rb') as file:
+                header = pickle.load(file)
+                if header.get('version') == GRAPH_VERSION and header.get('source_key') == source_key(file_path):
+                    return cls(*pickle.load(file))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        columns = load_stop_fields(file_path)
+        with map_naptan(file_path) as data:
+            graph = cls.build(columns, scan_stop_areas(data))
+        graph.save(graph_path, file_path)
+        return graph
+
+    def area_number(self, area_code):
+        """
+        Return the number of a StopArea code in the graph, or None if no stop or definition mentions it.
+        """
+        if self._area_index is None:
+            self._area_index = {code: area for area, code in enumerate(self.area_codes)}
+        return self._area_index.get(area_code)
+
+    def stop_row(self, atco_code):
+        """
+        Return the row of the first stop with an ATCO code, or None if there is none.
+        """
+        if self._stop_index is None:
+            self._stop_index = {}
+            for row, code in enumerate(self.atco_codes):
+                self._stop_index.setdefault(code, row)
+        return self._stop_index.get(atco_code)
+
+    def degree(self, area_code):
+        """
+        Return the number of member stops of a StopArea (0 for an unknown code).
+        """
+        area = self.area_number(area_code)
+        return 0 if area is None else int(self.area_offsets[area + 1] - self.area_offsets[area])
+
+    def degrees(self):
+        """
+        Return the number of member stops of every area, indexed like area_codes.
+        """
+        return np.diff(self.area_offsets)
+
+    def member_rows(self, area):
+        """
+        Return the stop rows of an area's members, in document order.
+        """
+        return self.area_stops[self.area_offsets[area]:self.area_offsets[area + 1]]
+
+    def members(self, area_code):
+        """
+        List the ATCO codes of the stops in a StopArea, in document order.
+        """
+        area = self.area_number(area_code)
+        if area is None:
+            return []
+        return [self.atco_codes[row] for row in self.member_rows(area).tolist()]
+
+    def areas_of(self, atco_code):
+        """
+        List the StopArea codes a stop references, in the order of its StopAreaRefs.
+        """
+        row = self.stop_row(atco_code)
+        if row is None:
+            return []
+        areas = self.stop_areas[self.stop_offsets[row]:self.stop_offsets[row + 1]]
+        return [self.area_codes[area] for area in areas.tolist()]
+
+    def is_defined(self, area_code):
+        """
+        Return whether a StopArea code is defined in the file, rather than only referenced.
+        """
+        area = self.area_number(area_code)
+        return area is not None and area < self.defined_areas
+
+    def orphaned_refs(self):
+        """
+        Find the StopAreaRefs to StopAreas not defined in the file.
+
+        The undefined areas are numbered last, so their members are the tail of area_stops
+        and are read without looking at any other edge.
+
+        Returns:
+        list of tuples: (ATCO code, StopArea code) for each orphaned reference, grouped by area.
+        """
+        orphans = []
+        for area in range(self.defined_areas, len(self.area_codes)):
+            code = self.area_codes[area]
+            orphans.extend((self.atco_codes[row], code) for row in self.member_rows(area).tolist())
+        return orphans
+
+    def empty_areas(self):
+        """
+        List the codes of StopAreas defined in the file that no stop references.
+        """
+        degrees = self.degrees()[:self.defined_areas]
+        return [self.area_codes[area] for area in np.flatnonzero(degrees == 0).tolist()]
+
+    def mixed_status_areas(self):
+        """
+        Find the StopAreas with both active and inactive member stops.
+
+        Returns:
+        list of tuples: (StopArea code, active members, inactive members) for each such area.
+        """
+        statuses = [(status or '').lower() for status in self.stop_statuses]
+        active_stops = np.array([status == 'active' for status in statuses], dtype=bool)
+        inactive_stops = np.array([status == 'inactive' for status in statuses], dtype=bool)
+        # Per-area totals are sums over each area's contiguous run of members
+        edge_areas = np.repeat(np.arange(len(self.area_codes)), self.degrees())
+        active = np.bincount(edge_areas, active_stops[self.area_stops], minlength=len(self.area_codes))
+        inactive = np.bincount(edge_areas, inactive_stops[self.area_stops], minlength=len(self.area_codes))
+        mixed = np.flatnonzero((active > 0) & (inactive > 0))
+        return [(self.area_codes[area], int(active[area]), int(inactive[area])) for area in mixed.tolist()]
+
+
+def export_to_csv(data, filename, column_names):
+    """
+    Export a list of tuples to a CSV file.
+
+    Args:
+    data (list of tuples): List of data to be exported.
+    filename (str): Filename for the CSV file.
+    column_names (list): Column names for the CSV file.
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(column_names)
+        for row in data:
+            writer.writerow(row)
+
+
+def export_results(graph, timestamp):
+    """
+    Export orphaned StopAreaRefs, areas with mixed member statuses and area degrees to timestamped CSV files.
+
+    Args:
+    graph (StopAreaGraph): The stop area graph.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    csv_filename = f'stop_area_orphans_{timestamp}.csv'
+    export_to_csv(graph.orphaned_refs(), csv_filename, ['ATCO Code', 'StopAreaRef'])
+    print(f"Exported orphaned StopAreaRefs to {csv_filename}")
+
+    csv_filename = f'stop_area_mixed_status_{timestamp}.csv'
+    export_to_csv(graph.mixed_status_areas(), csv_filename, ['StopAreaCode', 'Active Members', 'Inactive Members'])
+    print(f"Exported stop areas with mixed member statuses to {csv_filename}")
+
+    csv_filename = f'stop_area_degrees_{timestamp}.csv'
+    degrees = graph.degrees().tolist()
+    export_to_csv(((code, graph.area_fields['Name'][area] if area < graph.defined_areas else '', degrees[area],
+                    area < graph.defined_areas) for area, code in enumerate(graph.area_codes)),
+                  csv_filename, ['StopAreaCode', 'Name', 'Members', 'Defined'])
+    print(f"Exported stop area member counts to {csv_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the StopArea membership graph of NaPTAN.xml and query it.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--area', nargs='+', default=[], help='List the member stops of these StopArea codes')
+    parser.add_argument('--stop', nargs='+', default=[], help='List the StopAreas of these ATCO codes')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = StopAreaGraph.load(args.file_path)
+    print(f"Loaded stop area graph of {len(graph)} areas and {len(graph.area_stops)} memberships "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    for area_code in args.area:
+        defined = '' if graph.is_defined(area_code) else ' (not defined in the file)'
+        print(f"StopArea {area_code}{defined}: {graph.degree(area_code)} stops {', '.join(graph.members(area_code))}")
+    for atco_code in args.stop:
+        print(f"Stop {atco_code}: StopAreas {', '.join(graph.areas_of(atco_code)) or 'none'}")
+
+    if not args.area and not args.stop:
+        start = time.perf_counter()
+        print(f"Orphaned StopAreaRefs: {len(graph.orphaned_refs())}")
+        print(f"StopAreas with mixed active/inactive members: {len(graph.mixed_status_areas())}")
+        print(f"StopAreas with no member stops: {len(graph.empty_areas())}")
+        print(f"Ran graph queries in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        export_results(graph, timestamp)
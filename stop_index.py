@@ -0,0 +1,343 @@
+import argparse
+import contextlib
+import html
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import xml.etree.ElementTree as ET
+
+from compressed import map_naptan
+
+# Identifies the sidecar index format; bump the digit when the layout changes
+INDEX_MAGIC = b'NPTNIDX2'
+
+# Fields indexed, each mapped to the byte range of its StopPoint
+INDEXED_FIELDS = ('AtcoCode', 'NaptanCode')
+
+# Start and end byte offset stored after each padded code
+RANGE = struct.Struct('<QQ')
+
+STOP_POINT_OPEN = b'<StopPoint'
+STOP_POINT_CLOSE = b'</StopPoint>'
+
+# CDATA sections and comments, which the XML parser unwraps and drops from element text
+MARKUP = re.compile(rb'<!\[CDATA\[(.*?)\]\]>|<!--.*?-->', re.DOTALL)
+
+
+def index_path_for(file_path):
+    """
+    Return the path of the sidecar index for a NaPTAN XML file.
+    """
+    return f'{file_path}.stopidx'
+
+
+def _decode_text(raw):
+    """
+    Return the text of an element's raw content as the XML parser reads it, stripped.
+
+    Character and entity references are decoded and CDATA sections unwrapped, so a code
+    written as A&amp;1, &#65;&amp;1 or <![CDATA[A&1]]> is the same code.
+    """
+    if b'&' not in raw and b'<' not in raw:
+        return raw.decode('utf-8').strip()
+    parts = []
+    pos = 0
+    for match in MARKUP.finditer(raw):
+        parts.append(html.unescape(raw[pos:match.start()].decode('utf-8')))
+        if match.group(1) is not None:
+            parts.append(match.group(1).decode('utf-8'))
+        pos = match.end()
+    parts.append(html.unescape(raw[pos:].decode('utf-8')))
+    return ''.join(parts).strip()
+
+
+def _element_text(data, tag, start, end):
+    open_tag = b'<' + tag + b'>'
+    i = data.find(open_tag, start, end)
+    if i == -1:
+        return None
+    i += len(open_tag)
+    j = data.find(b'</' + tag + b'>', i, end)
+    if j == -1:
+        return None
+    return _decode_text(data[i:j])
+
+
+def root_start_tag(data):
+    """
+    Locate the root element's start tag in a NaPTAN XML file.
+
+    Args:
+    data (bytes or mmap): The raw file contents.
+
+    Returns:
+    int: Offset just past the root start tag; everything before it can prefix any slice of StopPoints.
+    bytes: The root element's name, for the matching end tag.
+    """
+    pos = 0
+    while True:
+        pos = data.find(b'<', pos)
+        if data[pos + 1:pos + 2] not in (b'?', b'!'):
+            prefix_end = data.find(b'>', pos) + 1
+            root_tag = data[pos + 1:prefix_end].split(None, 1)[0].rstrip(b'>')
+            return prefix_end, root_tag
+        pos += 1
+
+
+def find_stop_point(data, pos=0):
+    """
+    Return the offset of the next StopPoint start tag at or after pos, or -1 if there is none.
+
+    Args:
+    data (bytes or mmap): The raw file contents.
+    pos (int): Offset to search from.
+
+    Returns:
+    int: Offset of the '<' opening the StopPoint, or -1.
+    """
+    while True:
+        start = data.find(STOP_POINT_OPEN, pos)
+        if start == -1:
+            return -1
+        pos = start + len(STOP_POINT_OPEN)
+        # Skip <StopPoints>, <StopPointRef> and other tags sharing the prefix
+        if data[pos:pos + 1] in (b' ', b'>', b'\t', b'\n', b'\r'):
+            return start
+
+
+def scan_stop_points(data):
+    """
+    Yield the byte range and indexed codes of every StopPoint by scanning the raw bytes.
+
+    Args:
+    data (bytes or mmap): The raw file contents.
+
+    Yields:
+    tuple: (start, end, codes) where codes holds the text of each of INDEXED_FIELDS (or None),
+        decoded as the XML parser would and stripped.
+    """
+    tags = [field.encode('ascii') for field in INDEXED_FIELDS]
+    pos = 0
+    while True:
+        start = find_stop_point(data, pos)
+        if start == -1:
+            return
+        end = data.find(STOP_POINT_CLOSE, start)
+        if end == -1:
+            return
+        end += len(STOP_POINT_CLOSE)
+        yield start, end, [_element_text(data, tag, start, end) for tag in tags]
+        pos = end
+
+
+def build_index(file_path, index_path=None):
+    """
+    Build the sidecar index for a NaPTAN XML file in one pass over the raw bytes.
+
+    For each of INDEXED_FIELDS the index holds every code, sorted and padded to a fixed
+    width, followed by the byte range of its StopPoint in the source file. Lookups can
+    then binary search the memory mapped index without loading it.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    index_path (str): Where to write the index. Defaults to alongside the source file.
+
+    Returns:
+    str: Path of the written index.
+    """
+    index_path = index_path or index_path_for(file_path)
+    entries = {field: [] for field in INDEXED_FIELDS}
+
+    stat = os.stat(file_path)
+    with map_naptan(file_path) as data:
+        prefix_end, root_tag = root_start_tag(data)
+        for start, end, codes in scan_stop_points(data):
+            for field, code in zip(INDEXED_FIELDS, codes):
+                if code:
+                    entries[field].append((code.encode('utf-8'), start, end))
+
+    header = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'prefix_end': prefix_end,
+        'root_tag': root_tag.decode('utf-8'),
+        'sections': {},
+    }
+    sections = []
+    offset = 0
+    for field in INDEXED_FIELDS:
+        field_entries = sorted(entries[field])
+        width = max((len(code) for code, _, _ in field_entries), default=1)
+        section = b''.join(code.ljust(width, b'\0') + RANGE.pack(start, end) for code, start, end in field_entries)
+        # Section offsets are relative to the end of the header
+        header['sections'][field] = {'offset': offset, 'count': len(field_entries), 'width': width}
+        sections.append(section)
+        offset += len(section)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    temp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(INDEX_MAGIC)
+        file.write(struct.pack('<I', len(header_bytes)))
+        file.write(header_bytes)
+        for section in sections:
+            file.write(section)
+    os.replace(temp_path, index_path)
+    return index_path
+
+
+def parse_stop_point(prefix, stop_point_bytes, root_tag):
+    """
+    Parse the raw bytes of one StopPoint.
+
+    The slice is wrapped in the source file's own prolog and root start tag so its
+    namespaces resolve exactly as they do in the full file.
+
+    Args:
+    prefix (bytes): The source file up to the end of its root start tag.
+    stop_point_bytes (bytes): The StopPoint's bytes.
+    root_tag (bytes): The root element's name.
+
+    Returns:
+    Element: The StopPoint element.
+    """
+    return ET.fromstring(prefix + stop_point_bytes + b'</' + root_tag + b'>')[0]
+
+
+class StopIndex:
+    """
+    Memory mapped lookup of StopPoints by AtcoCode or NaptanCode through the sidecar index.
+
+    The index is built on first use and rebuilt whenever the source file's size or
+    modification time no longer match it. Only the matching StopPoint's bytes are parsed.
+    """
+
+    def __init__(self, file_path, index_path=None):
+        self.file_path = file_path
+        self.index_path = index_path or index_path_for(file_path)
+        if not self._is_current():
+            build_index(file_path, self.index_path)
+
+        self._index_file = open(self.index_path, 'rb')
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length = struct.unpack_from('<I', self._index, len(INDEX_MAGIC))[0]
+        start = len(INDEX_MAGIC) + 4
+        self.header = json.loads(self._index[start:start + header_length])
+        self._data_start = start + header_length
+
+        self._source_stack = contextlib.ExitStack()
+        self._source = self._source_stack.enter_context(map_naptan(file_path))
+        self._prefix = self._source[:self.header['prefix_end']]
+        self._root_tag = self.header['root_tag'].encode('utf-8')
+
+    def _is_current(self):
+        try:
+            with open(self.index_path, 'rb') as file:
+                if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return False
+                header_length = struct.unpack('<I', file.read(4))[0]
+                header = json.loads(file.read(header_length))
+        except (OSError, ValueError, struct.error):
+            return False
+        stat = os.stat(self.file_path)
+        return header['size'] == stat.st_size and header['mtime_ns'] == stat.st_mtime_ns
+
+    def close(self):
+        self._index.close()
+        self._index_file.close()
+        self._source_stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def ranges(self, code, field='AtcoCode'):
+        """
+        Return the byte ranges of every StopPoint with the given code, in document order.
+
+        Args:
+        code (str): The code to look up.
+        field (str): 'AtcoCode' or 'NaptanCode'.
+
+        Returns:
+        list of tuples: (start, end) byte offsets into the source file.
+        """
+        section = self.header['sections'][field]
+        width = section['width']
+        key = code.encode('utf-8')
+        if len(key) > width:
+            return []
+        key = key.ljust(width, b'\0')
+        record_size = width + RANGE.size
+        offset = self._data_start + section['offset']
+
+        # Binary search for the first record with this code
+        low, high = 0, section['count']
+        while low < high:
+            middle = (low + high) // 2
+            record = offset + middle * record_size
+            if self._index[record:record + width] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        ranges = []
+        while low < section['count']:
+            record = offset + low * record_size
+            if self._index[record:record + width] != key:
+                break
+            ranges.append(RANGE.unpack_from(self._index, record + width))
+            low += 1
+        return ranges
+
+    def stop_point_bytes(self, start, end):
+        """
+        Return the raw bytes of the StopPoint at the given byte range.
+        """
+        return self._source[start:end]
+
+    def stop_point(self, code, field='AtcoCode'):
+        """
+        Parse and return the first StopPoint with the given code, or None if there is none.
+
+        Args:
+        code (str): The code to look up.
+        field (str): 'AtcoCode' or 'NaptanCode'.
+
+        Returns:
+        Element: The StopPoint element, or None.
+        """
+        ranges = self.ranges(code, field)
+        if not ranges:
+            return None
+        return parse_stop_point(self._prefix, self.stop_point_bytes(*ranges[0]), self._root_tag)
+
+    def stop_points(self, codes, field='AtcoCode'):
+        """
+        Look up a batch of codes.
+
+        Args:
+        codes (iterable): Codes to look up.
+        field (str): 'AtcoCode' or 'NaptanCode'.
+
+        Returns:
+        dict: Each code mapped to its first StopPoint element, or None when not found.
+        """
+        return {code: self.stop_point(code, field) for code in codes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the byte-offset sidecar index for a NaPTAN XML file.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    index_path = build_index(args.file_path)
+    print(f"Built index {index_path} in {time.perf_counter() - start_time:.2f}s")
@@ -0,0 +1,237 @@
+import argparse
+import copy
+import itertools
+import time
+import tracemalloc
+
+from compressed import compression_of, map_naptan
+from naptan_stream import extract_stop_fields, iter_stop_points
+from stop_index import STOP_POINT_CLOSE, StopIndex, _element_text, find_stop_point, parse_stop_point, root_start_tag, scan_stop_points
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StopPointRecord:
+    """
+    The fields of one StopPoint that the analyses report on, in place of the StopPoint element.
+
+    A record holds a handful of values and where the stop is in its source file, where a
+    kept Element holds its whole subtree: hundreds of thousands of records fit in the memory
+    of a few thousand Elements. The full StopPoint is read back from the source on demand
+    with rehydrate().
+
+    start and end are the byte range of the StopPoint in the (decompressed) source, when the
+    record was taken by something that knew it; locate() fills them in otherwise. position,
+    the stop's place among the StopPoints of the source, is kept as a fallback.
+
+    Text fields are as found in the XML (None when missing); coordinates are floats, None
+    when missing or not a number.
+    """
+    __slots__ = ('position', 'start', 'end', 'atco_code', 'naptan_code', 'common_name', 'stop_type', 'bus_stop_type', 'status',
+                 'easting', 'northing', 'latitude', 'longitude')
+
+    def __init__(self, position, atco_code, naptan_code=None, common_name=None, stop_type=None, bus_stop_type=None,
+                 status=None, easting=None, northing=None, latitude=None, longitude=None, start=None, end=None):
+        self.position = position
+        self.start = start
+        self.end = end
+        self.atco_code = atco_code
+        self.naptan_code = naptan_code
+        self.common_name = common_name
+        self.stop_type = stop_type
+        self.bus_stop_type = bus_stop_type
+        self.status = status
+        self.easting = easting
+        self.northing = northing
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @classmethod
+    def from_element(cls, stop_point, position, start=None, end=None):
+        """
+        Take a record of a StopPoint element.
+
+        Args:
+        stop_point (Element): A StopPoint element.
+        position (int): Its position among the StopPoints of the source, counting from 0.
+        start (int): Byte offset of the StopPoint in the source, if known.
+        end (int): Byte offset just past the StopPoint, if known.
+
+        Returns:
+        StopPointRecord: The record.
+        """
+        fields = extract_stop_fields(stop_point)
+        return cls(position, fields['AtcoCode'], fields['NaptanCode'], fields['CommonName'], fields['StopType'],
+                   fields['BusStopType'], fields['Status'], _to_float(fields['Easting']),
+                   _to_float(fields['Northing']), _to_float(fields['Latitude']), _to_float(fields['Longitude']),
+                   start, end)
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, StopPointRecord):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f'StopPointRecord({self.position}, {self.atco_code!r})'
+
+
+def attach_source(analyses, file_path):
+    """
+    Tell the analyses that keep StopPointRecords which file their records point into.
+
+    Analyses fed from a file object rather than a path are left alone; whoever splits the
+    file attaches the source once the parts are merged.
+
+    Args:
+    analyses (list): Analysis objects; those with a source attribute keep records.
+    file_path (str): Path to the NaPTAN XML file the analyses were fed from.
+    """
+    if hasattr(file_path, 'read'):
+        return
+    for analysis in analyses:
+        if hasattr(analysis, 'source'):
+            analysis.source = file_path
+
+
+def locate(file_path, records):
+    """
+    Fill in the byte range of records taken without one.
+
+    Each record is looked up by AtcoCode in the sidecar stop index (see stop_index.py, built
+    next to the source on first use), a binary search rather than a scan. Records whose code
+    is missing, repeated in the file or not in the index are left to source_ranges, which
+    places them by position. So are the records of a compressed source, which has to be
+    decompressed in full to read them anyway.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file the records were taken from.
+    records (list): StopPointRecords taken from this source.
+    """
+    missing = [record for record in records if record.start is None and record.atco_code]
+    if not missing or compression_of(file_path) is not None:
+        return
+    try:
+        with StopIndex(file_path) as index:
+            for record in missing:
+                ranges = index.ranges(record.atco_code.strip())
+                if len(ranges) == 1:
+                    record.start, record.end = ranges[0]
+    except OSError:
+        # No index can be written next to the source; positions will do
+        pass
+
+
+def _check(data, record, start, end, atco_code):
+    # Catch a source that has changed since the records were taken
+    if find_stop_point(data, start) != start or data[end - len(STOP_POINT_CLOSE):end] != STOP_POINT_CLOSE:
+        raise ValueError(f'The source has no StopPoint at byte {start} for {record.atco_code}')
+    if atco_code is not None and record.atco_code is not None and atco_code != record.atco_code.strip():
+        raise ValueError(f'The source has {atco_code} at byte {start}, expected {record.atco_code}')
+
+
+def source_ranges(data, records):
+    """
+    Find the byte range of each record's StopPoint in the raw source.
+
+    Records with a byte range are checked against the source and used as they are. Any
+    without one are placed by their position, with one scan of the source up to the last
+    of them.
+
+    Args:
+    data (bytes or mmap): The raw file contents.
+    records (list): StopPointRecords taken from this source.
+
+    Returns:
+    list of tuples: (start, end) byte offsets of each record's StopPoint, in the order of the records.
+    """
+    wanted = {record.position for record in records if record.start is None}
+    by_position = {}
+    if wanted:
+        last = max(wanted)
+        for position, (start, end, codes) in enumerate(scan_stop_points(data)):
+            if position in wanted:
+                by_position[position] = (start, end, codes[0])
+            if position == last:
+                break
+
+    result = []
+    for record in records:
+        if record.start is not None:
+            start, end = record.start, record.end
+            atco_code = _element_text(data, b'AtcoCode', start, end)
+        elif record.position in by_position:
+            start, end, atco_code = by_position[record.position]
+        else:
+            raise ValueError(f'The source has no StopPoint at position {record.position} for {record.atco_code}')
+        _check(data, record, start, end, atco_code)
+        result.append((start, end))
+    return result
+
+
+def rehydrate(file_path, records):
+    """
+    Read back the full StopPoint elements of records from their source.
+
+    The records are found with locate() and source_ranges(), so a record with a byte range or
+    a unique AtcoCode costs no scan of the source, and only the records' own StopPoints are
+    parsed. They are parsed within the source's own prolog and root start tag, and given the
+    whitespace that follows them as their tail, so they are the same as those streamed from it.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file the records were taken from.
+    records (list): StopPointRecords, in any order.
+
+    Yields:
+    Element: The StopPoint element of each record, in the order of the records.
+    """
+    locate(file_path, records)
+    with map_naptan(file_path) as data:
+        prefix_end, root_tag = root_start_tag(data)
+        prefix = data[:prefix_end]
+        for start, end in source_ranges(data, records):
+            stop_point = parse_stop_point(prefix, data[start:end], root_tag)
+            tail_end = data.find(b'<', end)
+            tail = data[end:tail_end if tail_end != -1 else len(data)].decode('utf-8')
+            # As the parser does, normalize line endings
+            stop_point.tail = tail.replace('\r\n', '\n').replace('\r', '\n') or None
+            yield stop_point
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the memory held by StopPoint records with that of copied StopPoint elements.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--limit', type=int, default=10000, help='Number of StopPoints to keep (default: 10000)')
+    args = parser.parse_args()
+
+    try:
+        for kind in ('Element', 'StopPointRecord'):
+            tracemalloc.start()
+            start = time.perf_counter()
+            kept = []
+            for position, stop_point in enumerate(iter_stop_points(args.file_path)):
+                if position == args.limit:
+                    break
+                kept.append(copy.deepcopy(stop_point) if kind == 'Element' else StopPointRecord.from_element(stop_point, position))
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"{len(kept)} {kind}s: {size / 1024 ** 2:.1f} MiB ({size / max(len(kept), 1):.0f} bytes each) "
+                  f"in {time.perf_counter() - start:.2f}s")
+            del kept
+
+        start = time.perf_counter()
+        records = [StopPointRecord.from_element(stop_point, position)
+                   for position, stop_point in enumerate(itertools.islice(iter_stop_points(args.file_path), 100))]
+        elements = list(rehydrate(args.file_path, records))
+        print(f"Rehydrated {len(elements)} StopPoints in {(time.perf_counter() - start) * 1000:.1f} ms")
+    except Exception as e:
+        print(f"Error occurred: {e}")
@@ -0,0 +1,272 @@
+import argparse
+import time
+
+import numpy as np
+
+from dataset_cache import load_stop_fields
+
+# Code fields stored as dictionary encoded integer columns
+CODED_FIELDS = (
+    'AtcoCode', 'NaptanCode', 'StopType', 'BusStopType', 'TimingStatus', 'Status', 'Modification',
+    'AdministrativeAreaRef', 'NptgLocalityRef',
+)
+
+# Coordinate fields stored as float columns (NaN when missing)
+COORDINATE_FIELDS = ('Easting', 'Northing', 'Latitude', 'Longitude')
+
+# Timestamp fields stored as datetime64 columns (NaT when missing)
+TIMESTAMP_FIELDS = ('CreationDateTime', 'ModificationDateTime')
+
+# Code used for a missing or empty value in a coded column
+MISSING = -1
+
+
+def encode(values):
+    """
+    Dictionary encode a list of strings.
+
+    Categories are numbered in order of first appearance, so anything reported per
+    category comes out in the same order as a Counter built while reading the file.
+    None and empty strings are encoded as MISSING.
+
+    Args:
+    values (list): Values to encode.
+
+    Returns:
+    ndarray: int32 code for each value.
+    list: The distinct values, indexed by code.
+    """
+    index = {}
+    codes = np.fromiter(
+        (MISSING if not value else index.setdefault(value, len(index)) for value in values),
+        dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+
+def _to_float(values):
+    try:
+        return np.array(['nan' if not value else value for value in values], dtype=np.float64)
+    except ValueError:
+        # Fall back to converting one at a time so a single bad value doesn't fail the column
+        floats = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                floats[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return floats
+
+
+def _to_datetime(values):
+    try:
+        return np.array(values, dtype='datetime64[s]')
+    except ValueError:
+        timestamps = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[s]')
+        for i, value in enumerate(values):
+            try:
+                timestamps[i] = np.datetime64(value, 's')
+            except (TypeError, ValueError):
+                pass
+        return timestamps
+
+
+class StopTable:
+    """
+    Columnar, array-backed view of the StopPoints in a NaPTAN dataset.
+
+    Code fields are held as dictionary encoded int32 columns (codes[field] with the
+    distinct values in categories[field]), coordinates as float64 columns and the
+    creation/modification timestamps as datetime64 columns. flexible_zone_sizes holds the
+    number of Locations in each stop's FlexibleZone, or MISSING for a stop without one.
+    Row i of every column is the i-th StopPoint in the source file.
+    """
+
+    def __init__(self, codes, categories, coordinates, timestamps, revision_numbers, flexible_zone_sizes):
+        self.codes = codes
+        self.categories = categories
+        self.coordinates = coordinates
+        self.timestamps = timestamps
+        self.revision_numbers = revision_numbers
+        self.flexible_zone_sizes = flexible_zone_sizes
+        # Value -> code lookups, built on first use per field
+        self._code_index = {}
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Build a table from the extracted field columns returned by load_stop_fields.
+
+        Args:
+        columns (dict): Field names mapped to one value per StopPoint.
+
+        Returns:
+        StopTable: The columnar table.
+        """
+        codes = {}
+        categories = {}
+        for field in CODED_FIELDS:
+            codes[field], categories[field] = encode(columns[field])
+
+        coordinates = {field: _to_float(columns[field]) for field in COORDINATE_FIELDS}
+        timestamps = {field: _to_datetime(columns[field]) for field in TIMESTAMP_FIELDS}
+        revision_numbers = _to_float(columns['RevisionNumber'])
+        flexible_zone_sizes = np.fromiter(
+            (MISSING if zone is None else len(zone) for zone in columns['FlexibleZone']),
+            dtype=np.int32, count=len(columns['FlexibleZone']))
+
+        return cls(codes, categories, coordinates, timestamps, revision_numbers, flexible_zone_sizes)
+
+    def __len__(self):
+        return len(self.codes['AtcoCode'])
+
+    def __getitem__(self, field):
+        """
+        Return a column: the int32 codes for a coded field, or the float/datetime array otherwise.
+        """
+        if field in self.codes:
+            return self.codes[field]
+        if field in self.coordinates:
+            return self.coordinates[field]
+        if field == 'RevisionNumber':
+            return self.revision_numbers
+        return self.timestamps[field]
+
+    def code_of(self, field, value):
+        """
+        Return the integer code of a value in a coded column, or MISSING if it never occurs.
+        """
+        if field not in self._code_index:
+            self._code_index[field] = {category: code for code, category in enumerate(self.categories[field])}
+        return self._code_index[field].get(value, MISSING)
+
+    def codes_where(self, field, predicate):
+        """
+        Return the codes of every category of a coded column whose value satisfies predicate.
+        """
+        return np.array([code for code, value in enumerate(self.categories[field]) if predicate(value)], dtype=np.int32)
+
+    def equals(self, field, value):
+        """
+        Return a boolean mask of the rows where a coded column equals value.
+        """
+        code = self.code_of(field, value)
+        if code == MISSING:
+            return np.zeros(len(self), dtype=bool)
+        return self.codes[field] == code
+
+    def decode(self, field, rows=None):
+        """
+        Decode a coded column back to strings (None where missing), for all rows or the given ones.
+        """
+        codes = self.codes[field] if rows is None else self.codes[field][rows]
+        categories = self.categories[field]
+        return [categories[code] if code != MISSING else None for code in codes.tolist()]
+
+    def value_counts(self, field):
+        """
+        Count the occurrences of every category of a coded column.
+
+        Returns:
+        ndarray: Count per code, indexed like categories[field].
+        """
+        codes = self.codes[field]
+        return np.bincount(codes[codes != MISSING], minlength=len(self.categories[field]))
+
+
+def load_stop_table(file_path, **cache_options):
+    """
+    Load a NaPTAN XML file into a StopTable, using the parsed dataset cache where possible.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    **cache_options: Passed through to dataset_cache.load_stop_fields.
+
+    Returns:
+    StopTable: The columnar table.
+    """
+    return StopTable.from_columns(load_stop_fields(file_path, **cache_options))
+
+
+def find_duplicates(table):
+    """
+    Find duplicate ATCO and NaPTAN codes with a bincount over the encoded code columns.
+
+    Args:
+    table (StopTable): The columnar table.
+
+    Returns:
+    list of tuples: A list of tuples with duplicate ATCO codes.
+    list of tuples: A list of tuples with duplicate NaPTAN codes.
+    """
+    duplicates = []
+    for field in ('AtcoCode', 'NaptanCode'):
+        counts = table.value_counts(field)
+        duplicate_codes = np.flatnonzero(counts > 1)
+        categories = table.categories[field]
+        duplicates.append([(categories[code], int(counts[code])) for code in duplicate_codes.tolist()])
+    return duplicates[0], duplicates[1]
+
+
+def count_inactive_stops(table):
+    """
+    Count the stops with the status "inactive" (in any case).
+
+    Args:
+    table (StopTable): The columnar table.
+
+    Returns:
+    int: Count of inactive stops.
+    """
+    inactive_codes = table.codes_where('Status', lambda status: status.lower() == 'inactive')
+    return int(np.isin(table['Status'], inactive_codes).sum())
+
+
+def zero_coordinates_mask(table):
+    """
+    Return a boolean mask of the stops with any Easting, Northing, Latitude or Longitude equal to zero.
+
+    Args:
+    table (StopTable): The columnar table.
+
+    Returns:
+    ndarray: True for each stop with a zero coordinate.
+    """
+    mask = np.zeros(len(table), dtype=bool)
+    for field in COORDINATE_FIELDS:
+        mask |= table[field] == 0.0
+    return mask
+
+
+def find_zero_coordinate_stops(table):
+    """
+    Find the ATCO codes of stops with coordinates set to zero.
+
+    Args:
+    table (StopTable): The columnar table.
+
+    Returns:
+    list: ATCO codes of the invalid stops, in document order.
+    """
+    return table.decode('AtcoCode', np.flatnonzero(zero_coordinates_mask(table)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load NaPTAN.xml into a columnar table and run the vectorized checks.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = load_stop_table(args.file_path)
+    print(f"Loaded {len(table)} stops in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    atco_duplicates, naptan_duplicates = find_duplicates(table)
+    inactive_stops_count = count_inactive_stops(table)
+    zero_coordinate_stops = find_zero_coordinate_stops(table)
+    print(f"Duplicate ATCO codes: {len(atco_duplicates)}")
+    print(f"Duplicate NaPTAN codes: {len(naptan_duplicates)}")
+    print(f"Number of inactive stops: {inactive_stops_count}")
+    print(f"Stops with zero coordinates: {len(zero_coordinate_stops)}")
+    print(f"Ran vectorized checks in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,142 @@
+import xml.etree.ElementTree as ET
+import argparse
+import contextlib
+import datetime
+
+from compressed import map_naptan
+from naptan_stream import NAPTAN_NS, iter_stop_points
+from stop_index import root_start_tag, scan_stop_points
+from stop_record import locate, source_ranges
+
+# Output buffer size; matching StopPoints are copied through it straight from the memory mapped source
+BUFFER_SIZE = 1024 * 1024
+
+
+class SubsetWriter:
+    """
+    Stream a subset of the StopPoints of a NaPTAN XML file to a new NaPTAN XML file.
+
+    The output reuses the source's own XML declaration and root start tag, so its
+    namespaces and root attributes are exactly those of the source, and wraps the
+    StopPoints in a StopPoints element as the source does. Each StopPoint is written
+    by copying its original bytes from the memory mapped source rather than
+    re-serializing it, so memory use is constant however many stops are written.
+    A compressed source is decompressed into memory instead of being mapped.
+
+    The writer keeps a cursor over the source's StopPoints. Whoever streams the source
+    calls next_stop_point() once for every StopPoint, in document order, and
+    write_current() for those to keep.
+    """
+
+    def __init__(self, file_path, output_path):
+        self.file_path = file_path
+        self._source_stack = contextlib.ExitStack()
+        self._source = self._source_stack.enter_context(map_naptan(file_path))
+        self._view = memoryview(self._source)
+        self._stop_points = scan_stop_points(self._source)
+        self._current = None
+        self.count = 0
+
+        prefix_end, self._root_tag = root_start_tag(self._source)
+        self._output = open(output_path, 'wb', buffering=BUFFER_SIZE)
+        self._output.write(self._view[:prefix_end])
+        self._output.write(b'<StopPoints>')
+
+    def next_stop_point(self):
+        """
+        Move the cursor to the next StopPoint of the source.
+        """
+        self._current = next(self._stop_points, None)
+
+    def write_current(self, atco_code=None):
+        """
+        Copy the StopPoint under the cursor to the output.
+
+        Args:
+        atco_code (str): AtcoCode of the StopPoint the caller is looking at, checked against
+            the one under the cursor to catch the two falling out of step.
+        """
+        if self._current is None:
+            raise ValueError('No StopPoint under the cursor')
+        start, end, codes = self._current
+        if atco_code is not None and codes[0] is not None and codes[0] != atco_code.strip():
+            raise ValueError(f'Subset writer is at {codes[0]}, expected {atco_code}')
+        self._output.write(self._view[start:end])
+        self.count += 1
+
+    def write_records(self, records):
+        """
+        Copy the StopPoints of StopPointRecords taken from the source to the output, in the order of the records.
+
+        For analyses that kept records of their matches rather than writing them as they streamed.
+        """
+        locate(self.file_path, records)
+        for start, end in source_ranges(self._source, records):
+            self._output.write(self._view[start:end])
+            self.count += 1
+
+    def write_element(self, stop_point):
+        """
+        Serialize a StopPoint element to the output, for StopPoints that don't come from the source.
+        """
+        ET.register_namespace('', NAPTAN_NS)
+        self._output.write(ET.tostring(stop_point))
+        self.count += 1
+
+    def close(self):
+        if self._output.closed:
+            return
+        self._output.write(b'</StopPoints></' + self._root_tag + b'>')
+        self._output.close()
+        self._view.release()
+        self._source_stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_subset(file_path, output_path, predicate):
+    """
+    Stream the StopPoints of a NaPTAN XML file matching a predicate to a new NaPTAN XML file.
+
+    Args:
+    file_path (str): Path to the NaPTAN XML file.
+    output_path (str): Path of the XML file to write.
+    predicate (callable): Called with each StopPoint element; StopPoints for which it returns True are written.
+
+    Returns:
+    int: Number of StopPoints written.
+    """
+    with SubsetWriter(file_path, output_path) as writer:
+        for stop_point in iter_stop_points(file_path):
+            writer.next_stop_point()
+            if predicate(stop_point):
+                writer.write_current(stop_point.findtext(f'{{{NAPTAN_NS}}}AtcoCode'))
+        return writer.count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export a subset of the StopPoints of NaPTAN.xml, copying them byte for byte.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--stop-type', help='Keep stops with this StopType, e.g. BCT')
+    parser.add_argument('--bus-stop-type', help='Keep stops with this BusStopType, e.g. FLX')
+    parser.add_argument('--status', help='Keep stops with this Status, e.g. active')
+    args = parser.parse_args()
+
+    ns = {'n': NAPTAN_NS}
+
+    def matches(stop_point):
+        return ((args.stop_type is None or stop_point.findtext('n:StopClassification/n:StopType', namespaces=ns) == args.stop_type)
+                and (args.bus_stop_type is None
+                     or stop_point.findtext('n:StopClassification/n:OnStreet/n:Bus/n:BusStopType', namespaces=ns) == args.bus_stop_type)
+                and (args.status is None or stop_point.get('Status') == args.status))
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    xml_filename = f'stop_subset_{timestamp}.xml'
+    count = export_subset(args.file_path, xml_filename, matches)
+    print(f"Exported {count} stops to {xml_filename}")
@@ -0,0 +1,38 @@
+import os
+import pickle
+
+import pytest
+
+from dataset_cache import CACHE_DIR, SCHEMA_VERSION, cache_path, load_stop_fields
+from generate_naptan import generate
+
+# Entries a crash, a disk error or another version of the code could leave behind
+BROKEN_PAYLOADS = {
+    'truncated': lambda payload: payload[:len(payload) // 2],
+    'unknown protocol': lambda payload: b'\x80\x7f' + payload[2:],
+    'missing module': lambda payload: b'cno_such_module\nColumns\n.',
+    'missing class': lambda payload: b'cdataset_cache\nNoSuchColumns\n.',
+    'empty stack': lambda payload: b'.',
+}
+
+
+def test_default_cache_dir_is_absolute():
+    assert os.path.isabs(CACHE_DIR)
+
+
+@pytest.mark.parametrize('damage', sorted(BROKEN_PAYLOADS))
+def test_broken_entry_is_a_miss(tmp_path, damage):
+    file_path = str(tmp_path / 'naptan.xml')
+    cache_dir = str(tmp_path / 'cache')
+    generate(file_path, stops=100, seed=2)
+    expected = load_stop_fields(file_path, cache_dir=cache_dir)
+
+    path = cache_path(file_path, cache_dir)
+    payload = pickle.dumps(expected, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(path, 'wb') as file:
+        pickle.dump({'schema': SCHEMA_VERSION}, file)
+        file.write(BROKEN_PAYLOADS[damage](payload))
+
+    assert load_stop_fields(file_path, cache_dir=cache_dir) == expected
+    # The entry was rebuilt, so the next load is a hit again
+    assert load_stop_fields(file_path, cache_dir=cache_dir) == expected
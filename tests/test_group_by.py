@@ -0,0 +1,31 @@
+from collections import Counter
+
+import numpy as np
+
+from generate_naptan import generate
+from group_by import GroupBy, key_column
+from stop_table import load_stop_table
+
+
+def _brute_force_counts(table, keys):
+    columns = []
+    for key in keys:
+        codes, categories = key_column(table, key)
+        columns.append([None if code < 0 else categories[code] for code in codes.tolist()])
+    return Counter(zip(*columns))
+
+
+def test_many_wide_keys_do_not_overflow(tmp_path):
+    file_path = tmp_path / 'naptan.xml'
+    generate(str(file_path), stops=20000, seed=0)
+    table = load_stop_table(str(file_path), cache_dir=str(tmp_path / 'cache'))
+
+    # The product of the cardinalities of these keys is beyond int64
+    keys = ['AtcoCode', 'NaptanCode', 'NptgLocalityRef', 'AdministrativeAreaRef', 'StopType', 'BusStopType',
+            'TimingStatus', 'Status', 'Modification', 'MissingNaptanCode', 'HasFlexibleZone']
+    groups = GroupBy(table, keys)
+    assert groups.counts() == dict(_brute_force_counts(table, keys))
+
+    crosstab, axes = GroupBy(table, ['StopType', 'Status']).crosstab()
+    expected = _brute_force_counts(table, ['StopType', 'Status'])
+    assert {(axes[0][i], axes[1][j]): int(count) for (i, j), count in np.ndenumerate(crosstab) if count} == dict(expected)
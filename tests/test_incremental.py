@@ -0,0 +1,70 @@
+import re
+
+import pytest
+
+from generate_naptan import generate
+from incremental import run_incremental
+from run_all import run_analyses
+from stop_record import StopPointRecord
+
+REVISION_ATTRIBUTES = re.compile(rb' (?:ModificationDateTime|RevisionNumber)="[^"]*"')
+
+
+def _plain(value):
+    # Records found by byte range and by position are the same stop
+    if isinstance(value, StopPointRecord):
+        return {slot: item for slot, item in value.as_dict().items() if slot not in ('start', 'end')}
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _results(analyses):
+    return {analysis.name: _plain(analysis.result()) for analysis in analyses}
+
+
+def _stop_points(data):
+    starts = [match.start() for match in re.finditer(rb'<StopPoint[ >]', data)]
+    return starts, data.index(b'</StopPoints>')
+
+
+def _edit(data, bump_revision):
+    """
+    Make a second release: rename one stop with "DELETED ", switch the Status of another and drop a third.
+    """
+    starts, end = _stop_points(data)
+    stops = [data[start:next_start] for start, next_start in zip(starts, starts[1:] + [end])]
+
+    def edit(stop, old, new):
+        assert old in stop
+        stop = stop.replace(old, new, 1)
+        if bump_revision:
+            stop = re.sub(rb'RevisionNumber="(\d+)"', lambda match: b'RevisionNumber="%d"' % (int(match.group(1)) + 1), stop, 1)
+        return stop
+
+    stops[10] = edit(stops[10], b'<CommonName xml:lang="en">', b'<CommonName xml:lang="en">DELETED ')
+    status = b'Status="active"' if b'Status="active"' in stops[20] else b'Status="inactive"'
+    stops[20] = edit(stops[20], status, b'Status="inactive"' if status == b'Status="active"' else b'Status="active"')
+    del stops[30]
+    return data[:starts[0]] + b''.join(stops) + data[end:]
+
+
+@pytest.mark.parametrize('keep_revisions, fast_path', [(True, True), (False, True), (False, False)])
+def test_incremental_matches_full_run(tmp_path, keep_revisions, fast_path):
+    first = tmp_path / 'first.xml'
+    generate(str(first), stops=2000, seed=3)
+    data = first.read_bytes()
+    if not keep_revisions:
+        data = REVISION_ATTRIBUTES.sub(b'', data)
+        first.write_bytes(data)
+    second = tmp_path / 'second.xml'
+    second.write_bytes(_edit(data, keep_revisions))
+
+    state_path = str(tmp_path / 'state.pickle')
+    for release in (first, second):
+        analyses, stats = run_incremental(str(release), state_path=state_path, fast_path=fast_path)
+        assert _results(analyses) == _results(run_analyses(str(release)))
+
+    assert (stats['unchanged'], stats['changed'], stats['added'], stats['removed']) == (1997, 2, 0, 1)
@@ -0,0 +1,45 @@
+import re
+
+from generate_naptan import generate
+from naptan_stream import extract_stop_fields, iter_stop_points
+from stop_index import StopIndex, scan_stop_points
+
+# Codes written the ways the XML parser reads as the same text
+ENCODED_CODES = [
+    (b'<AtcoCode>', b'A&amp;1'),
+    (b'<AtcoCode>', b'&#66;&#x32;'),
+    (b'<AtcoCode>', b'<![CDATA[X<1>]]>'),
+    (b'<AtcoCode>', b' C<!-- old code -->3 '),
+    (b'<NaptanCode>', b'n&lt;&gt;p'),
+]
+
+
+def _encoded_release(tmp_path):
+    file_path = tmp_path / 'naptan.xml'
+    generate(str(file_path), stops=200, seed=11)
+    data = file_path.read_bytes()
+    starts = [match.start() for match in re.finditer(rb'<StopPoint[ >]', data)]
+    for position, (tag, code) in zip(reversed(starts[10:10 + len(ENCODED_CODES)]), reversed(ENCODED_CODES)):
+        i = data.index(tag, position) + len(tag)
+        j = data.index(b'</', i)
+        data = data[:i] + code + data[j:]
+    file_path.write_bytes(data)
+    return str(file_path)
+
+
+def test_codes_are_decoded_as_the_parser_reads_them(tmp_path):
+    file_path = _encoded_release(tmp_path)
+    expected = [extract_stop_fields(stop_point) for stop_point in iter_stop_points(file_path)]
+
+    with open(file_path, 'rb') as file:
+        scanned = [codes for _, _, codes in scan_stop_points(file.read())]
+    assert scanned == [[fields['AtcoCode'].strip(), fields['NaptanCode'] and fields['NaptanCode'].strip()]
+                       for fields in expected]
+    assert {'A&1', 'B2', 'X<1>', 'C3'} <= {codes[0] for codes in scanned}
+
+    with StopIndex(file_path, str(tmp_path / 'naptan.stopidx')) as index:
+        for fields in expected:
+            stop_point = index.stop_point(fields['AtcoCode'].strip())
+            assert extract_stop_fields(stop_point) == fields
+            if fields['NaptanCode']:
+                assert index.stop_point(fields['NaptanCode'].strip(), 'NaptanCode') is not None
@@ -0,0 +1,49 @@
+import re
+
+import pytest
+
+from dataset_cache import load_stop_fields
+from generate_naptan import generate
+from text_index import TEXT_FIELDS, TextIndex
+
+PATTERNS = [
+    r'High Street',
+    r'high\s+street',
+    r'(?x)Hi gh\ Street',
+    r'(?x)High\ Street  # comment',
+    r'(?i)HIGH street',
+    r'(?s)Church.Road',
+    r'(?i:high) Street',
+    r'\x48igh Street',
+    r'\u0048igh Street',
+    r'\N{LATIN CAPITAL LETTER H}igh Street',
+    r'\110igh Street',
+    r'Stop (A|B)',
+    r'^Stand \d$',
+    r'Mill|Manor',
+    r'Stati?on Ro+ad',
+    r'[MK]ing[s]? Road',
+]
+
+
+@pytest.fixture(scope='module')
+def index_and_columns(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('text_index')
+    file_path = tmp_path / 'naptan.xml'
+    generate(str(file_path), stops=2000, seed=7)
+    columns = load_stop_fields(str(file_path), cache_dir=str(tmp_path / 'cache'))
+    return TextIndex.from_columns(columns), columns
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_search_regex_matches_brute_force(index_and_columns, pattern):
+    index, columns = index_and_columns
+    regex = re.compile(pattern, re.IGNORECASE)
+    expected = [
+        (atco_code, field, columns[field][row])
+        for row, atco_code in enumerate(columns['AtcoCode'])
+        for field in TEXT_FIELDS
+        if columns[field][row] and regex.search(columns[field][row])
+    ]
+    assert expected
+    assert index.search_regex(pattern) == expected
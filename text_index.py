@@ -0,0 +1,430 @@
+import argparse
+import csv
+import datetime
+import os
+import pickle
+import re
+import time
+
+import numpy as np
+
+from dataset_cache import load_stop_fields, source_key
+
+# Descriptor fields covered by the index
+TEXT_FIELDS = ('CommonName', 'ShortCommonName', 'Landmark', 'Street', 'Indicator')
+
+# Bump whenever the layout of the index changes, so old sidecars are rebuilt
+INDEX_VERSION = 1
+
+# Characters that end a run of literal text in a regular expression
+REGEX_SPECIAL = set('.^$*+?{}[]()|\\')
+
+# Letters that open an inline flag group such as (?x) or (?i:...), which can change how
+# the rest of the pattern reads: in verbose mode spaces and # comments aren't literal
+INLINE_FLAGS = set('aiLmsux-')
+
+# Escapes followed by a fixed number of digits: the most taken, and the digits allowed
+ESCAPE_DIGITS = {
+    'x': (2, '0123456789abcdefABCDEF'),
+    'u': (4, '0123456789abcdefABCDEF'),
+    'U': (8, '0123456789abcdefABCDEF'),
+}
+
+
+def index_path_for(file_path):
+    """
+    Return the path of the sidecar text index for a NaPTAN XML file.
+    """
+    return f'{file_path}.textidx'
+
+
+def _escape_end(pattern, i, letter):
+    """
+    Return the index just past the arguments of an escape, given the index just past its letter.
+    """
+    if letter in ESCAPE_DIGITS:
+        digits, allowed = ESCAPE_DIGITS[letter]
+        end = i
+        while end < min(i + digits, len(pattern)) and pattern[end] in allowed:
+            end += 1
+        return end
+    if letter == 'N' and pattern[i:i + 1] == '{':
+        return pattern.find('}', i) + 1 or len(pattern)
+    if letter.isdigit():
+        # An octal escape (\0, \101) or a group reference (\1, \12)
+        end = i
+        while end < min(i + 2, len(pattern)) and pattern[end].isdigit():
+            end += 1
+        return end
+    return i
+
+
+def required_literals(pattern):
+    """
+    Find runs of literal text that any match of a regular expression must contain.
+
+    Only plain characters outside groups and character classes are considered, so the
+    result is conservative: an empty list means the pattern could not be prefiltered. A
+    pattern with inline flags is not prefiltered at all.
+
+    Args:
+    pattern (str): Regular expression.
+
+    Returns:
+    list: Lower-cased literal strings every match contains.
+    """
+    literals, run = [], []
+    depth, i = 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            following = pattern[i + 1]
+            i += 2
+            if following.isalnum():
+                # Escapes such as \w, \d and \b match classes or positions, not literal text.
+                # Skip the arguments of those that take them, so they don't read as literals.
+                i = _escape_end(pattern, i, following)
+                if depth:
+                    continue
+                literals.append(''.join(run))
+                run = []
+            elif not depth:
+                run.append(following)
+            continue
+        i += 1
+
+        if char == '[':
+            # Skip the class, including a leading ']' or '^]'
+            i += 1 if pattern[i:i + 1] == '^' else 0
+            i += 1 if pattern[i:i + 1] == ']' else 0
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+            if not depth:
+                literals.append(''.join(run))
+                run = []
+        elif char == '(':
+            if pattern[i:i + 1] == '?' and pattern[i + 1:i + 2] in INLINE_FLAGS:
+                return []
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if not depth:
+                literals.append(''.join(run))
+                run = []
+        elif depth:
+            continue
+        elif char == '|':
+            # A top level alternation means no literal is required by every match
+            return []
+        elif char in '*?{':
+            # The previous character may be absent or repeated, so it can't be relied on
+            if run:
+                run.pop()
+            literals.append(''.join(run))
+            run = []
+            if char == '{':
+                i = pattern.find('}', i) + 1 or len(pattern)
+        elif char == '+':
+            literals.append(''.join(run))
+            run = []
+        elif char in REGEX_SPECIAL:
+            literals.append(''.join(run))
+            run = []
+        else:
+            run.append(char)
+
+    literals.append(''.join(run))
+    return [literal.lower() for literal in literals if literal]
+
+
+def _within_edit_distance(term, text, max_edits):
+    """
+    Check whether some substring of text is within max_edits insertions, deletions or substitutions of term.
+    """
+    # Semi-global edit distance: a match may start and end anywhere in text
+    previous = list(range(len(term) + 1))
+    for char in text:
+        current = [0]
+        for j, term_char in enumerate(term, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (term_char != char)))
+        if current[-1] <= max_edits:
+            return True
+        previous = current
+    return previous[-1] <= max_edits
+
+
+class TextIndex:
+    """
+    Trigram inverted index over the Descriptor fields of every StopPoint.
+
+    Each (stop, field) pair is a document, numbered row * len(TEXT_FIELDS) + field. Every
+    distinct lower-cased trigram has a sorted posting list of the documents containing
+    it, stored end to end in one array. Queries intersect the posting lists of the
+    trigrams a match must contain and only check the remaining candidates' text.
+    """
+
+    def __init__(self, atco_codes, texts, alphabet, trigrams, offsets, postings):
+        self.atco_codes = atco_codes
+        self.texts = texts
+        self.alphabet = alphabet
+        self.trigrams = trigrams
+        self.offsets = offsets
+        self.postings = postings
+        self._char_codes = {char: code for code, char in enumerate(alphabet)}
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Build the index from the extracted field columns returned by load_stop_fields.
+
+        All trigrams are found at once: the lower-cased texts are joined into one array of
+        code points, and the trigram and document at every position are computed with
+        array operations, so no per-stop Python loop is needed.
+
+        Args:
+        columns (dict): Field names mapped to one value per StopPoint.
+
+        Returns:
+        TextIndex: The index.
+        """
+        atco_codes = columns['AtcoCode']
+        texts = [columns[field][row] or '' for row in range(len(atco_codes)) for field in TEXT_FIELDS]
+
+        # Documents are separated by NUL, which never appears in XML text
+        joined = '\0'.join(text.lower() for text in texts)
+        chars = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+        alphabet_codes, chars = np.unique(chars, return_inverse=True)
+        alphabet = ''.join(map(chr, alphabet_codes.tolist()))
+        size = len(alphabet)
+        separator = alphabet.find('\0')
+
+        documents = np.cumsum(chars == separator) if separator != -1 else np.zeros(len(chars), dtype=np.int64)
+        chars = chars.astype(np.int64)
+        codes = (chars[:-2] * size + chars[1:-1]) * size + chars[2:]
+        valid = np.ones(len(codes), dtype=bool)
+        if separator != -1:
+            valid = (chars[:-2] != separator) & (chars[1:-1] != separator) & (chars[2:] != separator)
+        codes, documents = codes[valid], documents[:-2][valid]
+
+        # One key per (trigram, document) pair; sorting the unique keys groups the postings by trigram
+        keys = np.unique(codes * len(texts) + documents)
+        key_trigrams = keys // len(texts) if len(texts) else keys
+        trigrams, starts = np.unique(key_trigrams, return_index=True)
+        offsets = np.append(starts, len(keys)).astype(np.int64)
+        postings = (keys % len(texts)).astype(np.int32) if len(texts) else keys.astype(np.int32)
+
+        return cls(atco_codes, texts, alphabet, trigrams, offsets, postings)
+
+    def __len__(self):
+        return len(self.atco_codes)
+
+    def save(self, index_path, file_path):
+        """
+        Write the index to disk, tagged with the source file it was built from.
+        """
+        header = {'version': INDEX_VERSION, 'source_key': source_key(file_path)}
+        temp_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((self.atco_codes, self.texts, self.alphabet, self.trigrams, self.offsets, self.postings),
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, index_path)
+
+    @classmethod
+    def load(cls, file_path, index_path=None):
+        """
+        Load the sidecar index of a NaPTAN XML file, building it first if it is missing or stale.
+
+        Args:
+        file_path (str): Path to the NaPTAN XML file.
+        index_path (str): Path of the sidecar index. Defaults to index_path_for(file_path).
+
+        Returns:
+        TextIndex: The index.
+        """
+        index_path = index_path or index_path_for(file_path)
+        try:
+            with open(index_path, 'rb') as file:
+                header = pickle.load(file)
+                if header.get('version') == INDEX_VERSION and header.get('source_key') == source_key(file_path):
+                    return cls(*pickle.load(file))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        index = cls.from_columns(load_stop_fields(file_path))
+        index.save(index_path, file_path)
+        return index
+
+    def _trigram_code(self, trigram):
+        try:
+            return (self._char_codes[trigram[0]] * len(self.alphabet) + self._char_codes[trigram[1]]) \
+                * len(self.alphabet) + self._char_codes[trigram[2]]
+        except KeyError:
+            return None
+
+    def _posting(self, trigram):
+        code = self._trigram_code(trigram)
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        position = np.searchsorted(self.trigrams, code)
+        if position == len(self.trigrams) or self.trigrams[position] != code:
+            return np.empty(0, dtype=np.int32)
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+    def _candidates(self, literals, fields=None):
+        """
+        Return the documents containing every trigram of every literal, restricted to fields.
+
+        Returns None when no literal is long enough to narrow the search, meaning every document.
+        """
+        trigrams = {literal[i:i + 3] for literal in literals for i in range(len(literal) - 2)}
+        if not trigrams:
+            documents = None
+        else:
+            postings = sorted((self._posting(trigram) for trigram in trigrams), key=len)
+            documents = postings[0]
+            for posting in postings[1:]:
+                if not len(documents):
+                    break
+                documents = np.intersect1d(documents, posting, assume_unique=True)
+
+        if fields is None or set(fields) == set(TEXT_FIELDS):
+            return documents
+        field_numbers = [TEXT_FIELDS.index(field) for field in fields]
+        if documents is None:
+            return np.array([row * len(TEXT_FIELDS) + number for row in range(len(self.atco_codes))
+                             for number in field_numbers], dtype=np.int64)
+        return documents[np.isin(documents % len(TEXT_FIELDS), field_numbers)]
+
+    def _matches(self, documents, test):
+        if documents is None:
+            documents = range(len(self.texts))
+        else:
+            documents = documents.tolist()
+        return [
+            (self.atco_codes[document // len(TEXT_FIELDS)], TEXT_FIELDS[document % len(TEXT_FIELDS)], self.texts[document])
+            for document in documents if self.texts[document] and test(self.texts[document])
+        ]
+
+    def search(self, text, fields=None):
+        """
+        Find the Descriptor fields containing a piece of text, ignoring case.
+
+        Args:
+        text (str): Text to look for.
+        fields (list): Fields to search. Defaults to all of TEXT_FIELDS.
+
+        Returns:
+        list of tuples: (ATCO code, field, field text) for each match, in document order.
+        """
+        text = text.lower()
+        return self._matches(self._candidates([text], fields), lambda value: text in value.lower())
+
+    def search_regex(self, pattern, fields=None):
+        """
+        Find the Descriptor fields matching a regular expression, ignoring case.
+
+        Only the documents containing the literal text the pattern requires are tested
+        against the pattern itself.
+
+        Args:
+        pattern (str): Regular expression, as accepted by re.search.
+        fields (list): Fields to search. Defaults to all of TEXT_FIELDS.
+
+        Returns:
+        list of tuples: (ATCO code, field, field text) for each match, in document order.
+        """
+        regex = re.compile(pattern, re.IGNORECASE)
+        return self._matches(self._candidates(required_literals(pattern), fields), lambda value: regex.search(value))
+
+    def search_fuzzy(self, text, max_edits=1, fields=None):
+        """
+        Find the Descriptor fields containing text within a number of typing errors, ignoring case.
+
+        A match within k edits of text shares at least (number of trigrams - 3k) of its
+        trigrams, so only documents with that many trigrams in common are checked.
+
+        Args:
+        text (str): Text to look for, such as "delete".
+        max_edits (int): Largest number of inserted, deleted or substituted characters.
+        fields (list): Fields to search. Defaults to all of TEXT_FIELDS.
+
+        Returns:
+        list of tuples: (ATCO code, field, field text) for each match, in document order.
+        """
+        text = text.lower()
+        trigrams = {text[i:i + 3] for i in range(len(text) - 2)}
+        needed = len(trigrams) - 3 * max_edits
+
+        if needed <= 0:
+            documents = self._candidates([], fields)
+        else:
+            postings = [self._posting(trigram) for trigram in trigrams]
+            counts = np.bincount(np.concatenate(postings), minlength=len(self.texts)) if postings else np.zeros(0)
+            documents = np.flatnonzero(counts >= needed)
+            if fields is not None:
+                documents = documents[np.isin(documents % len(TEXT_FIELDS), [TEXT_FIELDS.index(field) for field in fields])]
+
+        return self._matches(documents, lambda value: _within_edit_distance(text, value.lower(), max_edits))
+
+    def search_all(self, queries, fields=None):
+        """
+        Run many queries against the index.
+
+        Args:
+        queries (list of tuples): (kind, query) pairs, kind being 'text', 'regex' or 'fuzzy'.
+        fields (list): Fields to search. Defaults to all of TEXT_FIELDS.
+
+        Returns:
+        dict: Each (kind, query) pair mapped to its list of matches.
+        """
+        methods = {'text': self.search, 'regex': self.search_regex, 'fuzzy': self.search_fuzzy}
+        return {(kind, query): methods[kind](query, fields=fields) for kind, query in queries}
+
+
+def export_results(results, timestamp):
+    """
+    Export the matches of every query to a timestamped CSV file.
+
+    Args:
+    results (dict): Result of TextIndex.search_all.
+    timestamp (str): Timestamp used in exported filenames.
+    """
+    csv_filename = f'text_matches_{timestamp}.csv'
+    with open(csv_filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Query Type', 'Query', 'ATCO Code', 'Field', 'Text'])
+        for (kind, query), matches in results.items():
+            for atco_code, field, text in matches:
+                writer.writerow([kind, query, atco_code, field, text])
+    print(f"Exported matches to {csv_filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Search the Descriptor fields of NaPTAN stops through a trigram index.')
+    # Replace this with the absolute path to your NaPTAN XML file
+    parser.add_argument('file_path', nargs='?',
+                        default='C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml')
+    parser.add_argument('--text', nargs='+', default=[], help='Text to find, e.g. --text TEMP closed "not in use"')
+    parser.add_argument('--regex', nargs='+', default=[], help='Regular expressions to match')
+    parser.add_argument('--fuzzy', nargs='+', default=[], help='Text to find allowing --max-edits typing errors')
+    parser.add_argument('--max-edits', type=int, default=1)
+    parser.add_argument('--fields', nargs='+', choices=TEXT_FIELDS, help='Fields to search (default: all)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = TextIndex.load(args.file_path)
+    print(f"Loaded text index for {len(index)} stops in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = index.search_all([('text', query) for query in args.text] + [('regex', query) for query in args.regex],
+                               args.fields)
+    for query in args.fuzzy:
+        results['fuzzy', query] = index.search_fuzzy(query, args.max_edits, args.fields)
+    for (kind, query), matches in results.items():
+        print(f"{kind} {query!r}: {len(matches)} matches")
+    print(f"Ran {len(results)} queries in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_results(results, timestamp)
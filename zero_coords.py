@@ -1,29 +1,56 @@
-import xml.etree.ElementTree as ET
 import csv
 import datetime
 
+import numpy as np
 
-def find_invalid_stops_and_export(xml_file_path):
+from coordinates import wgs84_to_osgb36
+from naptan_stream import scan
+from stop_record import StopPointRecord
+from stop_table import load_stop_table, zero_coordinates_mask
+from subset_writer import SubsetWriter
+
+# Namespace handling for tags
+ns = {'naptan': 'http://www.naptan.org.uk/'}
+
+# Generous bounds of Great Britain, Scilly to Shetland, on the National Grid and in WGS84
+GB_EASTING = (0.0, 700000.0)
+GB_NORTHING = (0.0, 1250000.0)
+GB_LATITUDE = (49.8, 61.0)
+GB_LONGITUDE = (-8.7, 2.0)
+
+# Distance in metres by which Easting/Northing may disagree with Latitude/Longitude
+MAX_DISCREPANCY = 50.0
+
+# Coordinate issues in order of precedence; each stop is reported under the first that applies
+COORDINATE_ISSUES = ('zero', 'swapped', 'outside_gb', 'mismatch')
+
+
+class ZeroCoordsAnalysis:
     """
-    Parse the XML file and find stops with invalid position values (easting, northing, latitude, or longitude)
-    being some form of zero, and export the results to CSV and XML files.
+    Collect stops whose position values are some form of zero, one StopPoint at a time.
 
-    :param xml_file_path: Path to the XML file
+    Given a SubsetWriter over the same file, invalid stops are copied straight to its
+    output instead of being kept in memory. Otherwise each invalid stop is kept as a
+    StopPointRecord, and its bytes copied from the source by a SubsetWriter when exported,
+    so both ways write the same document.
     """
-    # Parse the XML file
-    tree = ET.parse(xml_file_path)
-    root = tree.getroot()
+    name = 'zero_coords'
 
-    # Namespace handling for tags
-    ns = {'naptan': 'http://www.naptan.org.uk/'}
-    ET.register_namespace('', ns['naptan'])
+    def __init__(self, writer=None):
+        # Lists to store invalid stops and their records
+        self.invalid_stops = []
+        self.invalid_stop_records = []
+        self.writer = writer
+        # File the records point into, and the number of StopPoints seen, to place them in it
+        self.source = None
+        self.stop_count = 0
 
-    # Lists to store invalid stops and their corresponding XML elements
-    invalid_stops = []
-    invalid_stop_elements = []
+    def process(self, stop_point):
+        position = self.stop_count
+        self.stop_count += 1
+        if self.writer is not None:
+            self.writer.next_stop_point()
 
-    # Iterate through each StopPoint element
-    for stop_point in root.findall('.//naptan:StopPoint', ns):
         location = stop_point.find('.//naptan:Location', ns)
         if location is not None:
             translation = location.find('naptan:Translation', ns)
@@ -38,31 +65,168 @@ def find_invalid_stops_and_export(xml_file_path):
                         (easting is not None and float(easting.text) == 0.0) or \
                         (northing is not None and float(northing.text) == 0.0):
                     atco_code = stop_point.find('naptan:AtcoCode', ns).text
-                    invalid_stops.append(atco_code)
-                    invalid_stop_elements.append(stop_point)
+                    self.invalid_stops.append(atco_code)
+                    if self.writer is not None:
+                        self.writer.write_current(atco_code)
+                    else:
+                        self.invalid_stop_records.append(StopPointRecord.from_element(stop_point, position))
+
+    def merge(self, other):
+        # The other analysis carries on from this one in document order
+        for record in other.invalid_stop_records:
+            record.position += self.stop_count
+        self.stop_count += other.stop_count
+        self.invalid_stops.extend(other.invalid_stops)
+        self.invalid_stop_records.extend(other.invalid_stop_records)
+
+    def result(self):
+        return self.invalid_stops, self.invalid_stop_records
+
+    def export(self, timestamp):
+        export_results(*self.result(), timestamp, self.source)
+
+
+def find_invalid_stops_and_export(xml_file_path):
+    """
+    Parse the XML file and find stops with invalid position values (easting, northing, latitude, or longitude)
+    being some form of zero, and export the results to CSV and XML files.
+
+    Invalid stops are streamed to the XML file as they are found, copying their original bytes.
 
+    :param xml_file_path: Path to the XML file
+    """
     # Timestamp for file naming
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
 
-    # Export to CSV
-    csv_file_path = f"invalid_stops_{timestamp}.csv"
+    # Stream through each StopPoint element
+    with SubsetWriter(xml_file_path, f"invalid_stops_{timestamp}.xml") as writer:
+        analysis = ZeroCoordsAnalysis(writer)
+        scan(xml_file_path, [analysis])
+
+    export_to_csv(analysis.invalid_stops, f"invalid_stops_{timestamp}.csv")
+
+
+def _within(values, bounds):
+    return (values >= bounds[0]) & (values <= bounds[1])
+
+
+def validate_coordinates(table, max_discrepancy=MAX_DISCREPANCY):
+    """
+    Check the coordinates of every stop at once with array operations.
+
+    Stops are flagged as "zero" when any coordinate is zero, "swapped" when the latitude
+    and longitude are the wrong way round, "outside_gb" when any coordinate falls outside
+    Great Britain, and "mismatch" when the Latitude/Longitude, converted to the National
+    Grid, land more than max_discrepancy metres from the Easting/Northing. Stops missing
+    a coordinate are only checked on the values they have.
+
+    :param table: StopTable of the dataset
+    :param max_discrepancy: Largest allowed distance in metres between the two positions
+    :return: Dictionary of boolean masks, one per entry of COORDINATE_ISSUES, each stop set in
+             at most one mask, and the discrepancy in metres for every stop (NaN where not computed)
+    """
+    eastings, northings = table['Easting'], table['Northing']
+    latitudes, longitudes = table['Latitude'], table['Longitude']
+
+    # Comparisons against NaN are False, so missing values never trip a check on their own
+    zero = zero_coordinates_mask(table)
+    swapped = ~zero & _within(latitudes, GB_LONGITUDE) & _within(longitudes, GB_LATITUDE)
+    outside_gb = ~zero & ~swapped & (
+        (eastings < GB_EASTING[0]) | (eastings > GB_EASTING[1])
+        | (northings < GB_NORTHING[0]) | (northings > GB_NORTHING[1])
+        | (latitudes < GB_LATITUDE[0]) | (latitudes > GB_LATITUDE[1])
+        | (longitudes < GB_LONGITUDE[0]) | (longitudes > GB_LONGITUDE[1]))
+
+    discrepancy = np.full(len(table), np.nan)
+    comparable = ~(zero | swapped | outside_gb) & ~np.isnan(eastings) & ~np.isnan(northings) \
+        & ~np.isnan(latitudes) & ~np.isnan(longitudes)
+    converted_eastings, converted_northings = wgs84_to_osgb36(latitudes[comparable], longitudes[comparable])
+    discrepancy[comparable] = np.hypot(converted_eastings - eastings[comparable],
+                                       converted_northings - northings[comparable])
+    mismatch = comparable & (discrepancy > max_discrepancy)
+
+    issues = {'zero': zero, 'swapped': swapped, 'outside_gb': outside_gb, 'mismatch': mismatch}
+    return issues, discrepancy
+
+
+def export_coordinate_issues(table, issues, discrepancy, timestamp):
+    """
+    Export the stops failing coordinate validation to a timestamped CSV file.
+
+    :param table: StopTable the issues were found in
+    :param issues: Dictionary of boolean masks from validate_coordinates
+    :param discrepancy: Discrepancy in metres for every stop from validate_coordinates
+    :param timestamp: Timestamp used in exported filenames
+    """
+    csv_file_path = f"coordinate_issues_{timestamp}.csv"
+    with open(csv_file_path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['ATCOCode', 'Issue', 'Easting', 'Northing', 'Latitude', 'Longitude', 'Discrepancy (m)'])
+        for issue in COORDINATE_ISSUES:
+            rows = np.flatnonzero(issues[issue])
+            columns = [table[field][rows].tolist() for field in ('Easting', 'Northing', 'Latitude', 'Longitude')]
+            for atco_code, *values, distance in zip(table.decode('AtcoCode', rows), *columns, discrepancy[rows].tolist()):
+                writer.writerow([atco_code, issue] + ['' if np.isnan(value) else value for value in values]
+                                + ['' if np.isnan(distance) else f'{distance:.1f}'])
+    print(f"Exported coordinate issues to {csv_file_path}")
+
+
+def validate_coordinates_and_export(xml_file_path, max_discrepancy=MAX_DISCREPANCY):
+    """
+    Load the dataset into a StopTable, validate all coordinates at once and export the stops with issues.
+
+    :param xml_file_path: Path to the XML file
+    :param max_discrepancy: Largest allowed distance in metres between the two positions
+    """
+    table = load_stop_table(xml_file_path)
+    issues, discrepancy = validate_coordinates(table, max_discrepancy)
+    for issue in COORDINATE_ISSUES:
+        print(f"Stops with {issue} coordinates: {int(issues[issue].sum())}")
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    export_coordinate_issues(table, issues, discrepancy, timestamp)
+
+
+def export_to_csv(invalid_stops, csv_file_path):
+    """
+    Export the ATCO codes of invalid stops to a CSV file.
+
+    :param invalid_stops: ATCO codes of the invalid stops
+    :param csv_file_path: Path of the CSV file
+    """
     with open(csv_file_path, 'w', newline='', encoding='utf-8') as csv_file:
         writer = csv.writer(csv_file)
         writer.writerow(['ATCOCode'])
         for atco_code in invalid_stops:
             writer.writerow([atco_code])
 
-    # Export to XML
-    xml_file_path = f"invalid_stops_{timestamp}.xml"
-    root_element = ET.Element('{http://www.naptan.org.uk/}NaPTAN')
-    for stop_element in invalid_stop_elements:
-        root_element.append(stop_element)
-    tree = ET.ElementTree(root_element)
-    tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
 
+def export_results(invalid_stops, invalid_stop_records, timestamp, source):
+    """
+    Export stops with zero position values to timestamped CSV and XML files.
+
+    :param invalid_stops: ATCO codes of the invalid stops
+    :param invalid_stop_records: StopPointRecords of the invalid stops
+    :param timestamp: Timestamp used in exported filenames
+    :param source: Path to the XML file the records were taken from, to copy the stops from
+    """
+    if source is None:
+        raise ValueError('The file the invalid stops were read from is not known')
+
+    # Export to CSV
+    export_to_csv(invalid_stops, f"invalid_stops_{timestamp}.csv")
+
+    # Export to XML, copying each stop's original bytes as find_invalid_stops_and_export does
+    with SubsetWriter(source, f"invalid_stops_{timestamp}.xml") as writer:
+        writer.write_records(invalid_stop_records)
+
+
+if __name__ == "__main__":
+    # Path to your NaPTAN XML dataset file
+    file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
 
-# Path to your NaPTAN XML dataset file
-file_path = 'C:\\Users\\benja\\PycharmProjects\\naptan_analysis\\data\\170124\\NaPTAN.xml'
+    # Find invalid stops and export to CSV and XML
+    find_invalid_stops_and_export(file_path)
 
-# Find invalid stops and export to CSV and XML
-find_invalid_stops_and_export(file_path)
+    # Check every coordinate for zeros, swaps, positions outside GB and Easting/Northing vs Latitude/Longitude mismatches
+    validate_coordinates_and_export(file_path)